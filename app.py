@@ -1,6 +1,15 @@
 import os
+import re
 import sys
+import copy
+import time
+import shutil
+import sqlite3
+import tempfile
+import threading
 from pathlib import Path
+from typing import Any, Callable
+from concurrent.futures import ThreadPoolExecutor
 from PyQt6.QtCore import Qt, QTimer
 from PyQt6.QtWidgets import (
     QApplication,
@@ -13,6 +22,7 @@ from PyQt6.QtWidgets import (
     QListWidgetItem,
     QMainWindow,
     QInputDialog,
+    QAbstractItemView,
     QPushButton,
     QSplitter,
     QVBoxLayout,
@@ -21,26 +31,64 @@ from PyQt6.QtWidgets import (
 )
 from codec import (
     convert_file_to_video,
+    convert_files_to_video,
     RS_ERROR_CORRECTION_BYTES,
     CONTAINER,
+    SEGMENT_RETRIES,
+    SEGMENT_SIZE,
     extract_file_from_video,
 )
-from yt_interface import (
-    create_yt_istance,
-    delete_video,
-    upload_video_to_youtube,
-    get_video_list,
-    download_video,
+from yt_interface import StudioPool
+from storage import LocalStorage, StorageBackend
+from reed_solomon import RSCodec
+from parallel import default_workers
+from instrumentation import JobCancelled, JobReport, measure
+from jobs import JobQueue, Stage
+from archive import index_entry, load_index
+from catalog import (
+    catalog_titles,
+    forget_videos,
+    import_archive_index,
+    open_catalog,
+    record_video,
+    refresh_catalog,
+    search_members,
+    search_videos,
+)
+from dedup import (
+    forget_titles,
+    load_content_index,
+    merge_content_index,
+    referencing_titles,
+    save_content_index,
 )
-from playwright.sync_api import Browser, BrowserContext, Page, sync_playwright
-import reedsolo
 
 
 TRANSFER_TEXT = "Uploading to YT"
+# one json line per upload or download, next to the key
+JOB_REPORT_LOG = "job_reports.jsonl"
+# also dump a cProfile of every job next to the log
+PROFILE_JOBS = False
+# every remote video with the members of those holding several files, next
+# to the key, refreshed from the storage list once the window is shown
+CATALOG = "remote_catalog.sqlite3"
+# members recorded before the catalog, imported into it once
+ARCHIVE_INDEX = "archive_index.json"
+MEMBER_PREFIX = "    ↳ "
+# videos holding every uploaded file or segment by content hash, next to the
+# key, so unchanged content is referenced instead of uploaded again
+CONTENT_INDEX = "content_index.json"
+# browser pages used at once for uploads, downloads and deletes
+STUDIO_SESSIONS = 2
+# keep the videos in this folder instead of YouTube, to try the app offline
+STORAGE_DIR: str | None = None
+# split big files where their content allows, so edits only change the
+# segments around them
+CONTENT_DEFINED_SEGMENTS = True
 
 
 class FileTransferWindow(QMainWindow):
-    def __init__(self, browser: Browser, context: BrowserContext, page: Page):
+    def __init__(self, storage: StorageBackend):
         super().__init__()
         self.setWindowTitle("File Transfer")
         self.resize(1024, 640)
@@ -50,14 +98,31 @@ class FileTransferWindow(QMainWindow):
         splitter = QSplitter(Qt.Orientation.Horizontal)
 
         # single instances
-        self.rsc = reedsolo.RSCodec(RS_ERROR_CORRECTION_BYTES)
-        self.browser = browser
-        self.context = context
-        self.page = page
+        self.rsc = RSCodec(RS_ERROR_CORRECTION_BYTES)
+        self.workers = default_workers()
+        self.storage = storage
         self.key = self._load_or_create_key()
+        self.report_dir = self.current_dir
+        self.catalog_path = str(self.current_dir / CATALOG)
+        self.catalog = self._open_catalog()
+        self.content_index_path = str(self.current_dir / CONTENT_INDEX)
+        self.content_index = load_content_index(self.content_index_path)
+        # encoding and decoding overlap with the transfers of other jobs
+        self.codec_lane = ThreadPoolExecutor(max_workers=1, thread_name_prefix="codec")
+        self.jobs = JobQueue({"codec": self.codec_lane, "storage": storage})
+        self.jobs.progress.connect(self.show_job_progress)
+        self.jobs.ended.connect(self.remove_job_item)
+        self.job_items: dict[int, QListWidgetItem] = {}
+        # titles of the uploads still queued or running
+        self.pending_titles: set[str] = set()
+        # upload jobs encode with a copy of the content index
+        self.index_lock = threading.Lock()
         # other
         self.left_status = QLabel("")
         self.left_list = QListWidget()
+        self.left_list.setSelectionMode(
+            QAbstractItemView.SelectionMode.ExtendedSelection
+        )
         self.left_list.itemDoubleClicked.connect(self.handle_local_double_click)
         self.left_search = QLineEdit()
         self.left_search.setPlaceholderText("Find local files")
@@ -72,6 +137,15 @@ class FileTransferWindow(QMainWindow):
         dir_layout.addWidget(self.dir_display, stretch=1)
         dir_layout.addWidget(self.dir_browse)
         self.load_local_items()
+        self.upload_btn = QPushButton("Upload selected")
+        self.upload_btn.setObjectName("primary")
+        self.upload_btn.clicked.connect(self.upload_selected_local)
+        self.pack_btn = QPushButton("Upload selected as one video")
+        self.pack_btn.setObjectName("primary")
+        self.pack_btn.clicked.connect(self.pack_selected_local)
+        upload_layout = QHBoxLayout()
+        upload_layout.addWidget(self.upload_btn)
+        upload_layout.addWidget(self.pack_btn)
         left_header = QLabel("Local files")
         left_header.setObjectName("panelTitle")
         left_layout = QVBoxLayout()
@@ -81,6 +155,7 @@ class FileTransferWindow(QMainWindow):
         left_layout.addLayout(dir_layout)
         left_layout.addWidget(self.left_search)
         left_layout.addWidget(self.left_list)
+        left_layout.addLayout(upload_layout)
         left_layout.addWidget(self.left_status)
         left_widget = QFrame()
         left_widget.setObjectName("panel")
@@ -89,23 +164,38 @@ class FileTransferWindow(QMainWindow):
         # yt list
         self.right_status = QLabel("")
         self.right_list = QListWidget()
+        self.right_list.setSelectionMode(
+            QAbstractItemView.SelectionMode.ExtendedSelection
+        )
         self.right_list.itemDoubleClicked.connect(self.handle_remote_double_click)
         self.right_search = QLineEdit()
         self.right_search.setPlaceholderText("Find saved files")
         self.right_search.textChanged.connect(self.filter_remote_list)
         self.load_remote_items()
+        self.refresh_btn = QPushButton("Refresh")
+        self.refresh_btn.setObjectName("ghost")
+        self.refresh_btn.clicked.connect(lambda: self.refresh_remote_items(full=True))
+        self.download_btn = QPushButton("Download selected")
+        self.download_btn.setObjectName("primary")
+        self.download_btn.clicked.connect(self.download_selected_remote)
         self.remove_btn = QPushButton("Delete selected")
         self.remove_btn.setObjectName("primary")
         self.remove_btn.clicked.connect(self.remove_selected_remote)
+        remote_layout = QHBoxLayout()
+        remote_layout.addWidget(self.download_btn)
+        remote_layout.addWidget(self.remove_btn)
         right_header = QLabel("Remote files")
         right_header.setObjectName("panelTitle")
         right_layout = QVBoxLayout()
         right_layout.setContentsMargins(16, 16, 16, 16)
         right_layout.setSpacing(12)
-        right_layout.addWidget(right_header)
+        right_header_layout = QHBoxLayout()
+        right_header_layout.addWidget(right_header, stretch=1)
+        right_header_layout.addWidget(self.refresh_btn)
+        right_layout.addLayout(right_header_layout)
         right_layout.addWidget(self.right_search)
         right_layout.addWidget(self.right_list)
-        right_layout.addWidget(self.remove_btn)
+        right_layout.addLayout(remote_layout)
         right_layout.addWidget(self.right_status)
         right_widget = QFrame()
         right_widget.setObjectName("panel")
@@ -115,13 +205,38 @@ class FileTransferWindow(QMainWindow):
         splitter.addWidget(right_widget)
         splitter.setSizes([450, 450])
 
+        # queued and running transfers
+        self.job_list = QListWidget()
+        self.job_list.setSelectionMode(
+            QAbstractItemView.SelectionMode.ExtendedSelection
+        )
+        self.job_list.setMaximumHeight(120)
+        self.cancel_btn = QPushButton("Cancel selected")
+        self.cancel_btn.setObjectName("ghost")
+        self.cancel_btn.clicked.connect(self.cancel_selected_jobs)
+        jobs_header = QLabel("Transfers")
+        jobs_header.setObjectName("panelTitle")
+        jobs_header_layout = QHBoxLayout()
+        jobs_header_layout.addWidget(jobs_header, stretch=1)
+        jobs_header_layout.addWidget(self.cancel_btn)
+        jobs_layout = QVBoxLayout()
+        jobs_layout.setContentsMargins(16, 12, 16, 12)
+        jobs_layout.addLayout(jobs_header_layout)
+        jobs_layout.addWidget(self.job_list)
+        jobs_widget = QFrame()
+        jobs_widget.setObjectName("panel")
+        jobs_widget.setLayout(jobs_layout)
+
         container = QWidget()
         container_layout = QVBoxLayout()
         container_layout.setContentsMargins(12, 12, 12, 12)
         container_layout.addWidget(splitter)
+        container_layout.addWidget(jobs_widget)
         container.setLayout(container_layout)
         self.setCentralWidget(container)
         self.apply_styles()
+        # the list is shown from the catalog, then checked for new videos
+        QTimer.singleShot(0, self.refresh_remote_items)
 
     def load_local_items(self):
         self.left_list.clear()
@@ -131,15 +246,44 @@ class FileTransferWindow(QMainWindow):
         self.filter_local_list(self.left_search.text())
 
     def load_remote_items(self):
+        # only the videos matching the search are listed
         self.right_list.clear()
-        try:
-            titles = get_video_list(self.page)
-            for title in titles:
-                item = QListWidgetItem(title)
-                self.right_list.addItem(item)
-            self.filter_remote_list(self.right_search.text())
-        except Exception as exc:
-            raise Exception(f"Failed to load remote items: {exc}")
+        query = self.right_search.text()
+        members = search_members(self.catalog, query)
+        for entry in search_videos(self.catalog, query):
+            self.add_remote_item(entry.title, members.get(entry.title, []))
+
+    def refresh_remote_items(self, full: bool = False):
+        # pages through the remote list until nothing is new, or through all
+        # of it to also drop the videos deleted elsewhere
+        def refresh(job, _):
+            job.progress("Reading the remote list...")
+            # sqlite connections stay on the thread that opened them
+            catalog = open_catalog(self.catalog_path)
+            try:
+                return refresh_catalog(catalog, self.storage.list_pages(), full)
+            finally:
+                catalog.close()
+
+        def done(new: int):
+            self.load_remote_items()
+            self.right_status.setText(f"{new} new remote files" if new else "")
+
+        def failed(exc: Exception):
+            self.right_status.setText(f"Failed to refresh remote files: {exc}")
+
+        self._submit("Refresh", [Stage("storage", refresh)], done, failed)
+
+    def add_remote_item(self, title: str, members: list[dict[str, int | str]]):
+        # archive videos are followed by their members
+        self.right_list.addItem(QListWidgetItem(title))
+        for member in members:
+            item = QListWidgetItem(f"{MEMBER_PREFIX}{member['name']}")
+            item.setData(Qt.ItemDataRole.UserRole, (title, member["name"]))
+            self.right_list.addItem(item)
+
+    def remote_titles(self) -> set[str]:
+        return catalog_titles(self.catalog)
 
     def show_error_popup(self, message: str):
         error_dialog = QMessageBox(self)
@@ -159,24 +303,145 @@ class FileTransferWindow(QMainWindow):
     def handle_remote_double_click(self, _item: QListWidgetItem):
         if _item is None:
             return
+        member = _item.data(Qt.ItemDataRole.UserRole)
+        if member is not None:
+            title, name = member
+            self.process_remote_file(title, [name])
+            return
         self.process_remote_file(_item.text())
 
+    def upload_selected_local(self):
+        # every file becomes its own video, titled after it
+        names = [item.text() for item in self.left_list.selectedItems()]
+        if not names:
+            self.left_status.setText("Select the files to upload")
+            return
+        for name in names:
+            file_path = self.current_dir / name
+            if not file_path.is_file():
+                continue
+            if self._title_taken(file_path.stem):
+                self.left_status.setText(f"A video titled {file_path.stem} exists")
+                continue
+            self._queue_upload(file_path, file_path.stem)
+
+    def pack_selected_local(self):
+        names = [item.text() for item in self.left_list.selectedItems()]
+        if not names:
+            self.left_status.setText("Select the files to upload")
+            return
+        self.process_local_files(names)
+
+    def download_selected_remote(self):
+        # one job per video, holding every member selected from it
+        requested: dict[str, list[str] | None] = {}
+        for item in self.right_list.selectedItems():
+            member = item.data(Qt.ItemDataRole.UserRole)
+            if member is None:
+                requested[item.text()] = None
+                continue
+            title, name = member
+            names = requested.setdefault(title, [])
+            if names is not None:
+                names.append(name)
+        if not requested:
+            self.right_status.setText("No video selected")
+            return
+        for title, names in requested.items():
+            self.process_remote_file(title, names)
+
     def remove_selected_remote(self):
         current = self.right_list.currentItem()
         if current is None:
             self.right_status.setText("No video selected")
             return
+        if current.data(Qt.ItemDataRole.UserRole) is not None:
+            self.right_status.setText("Select the archive video to delete it")
+            return
+        # their manifests may reference the content being deleted
+        if self.pending_titles:
+            self.right_status.setText("Wait for the uploads to finish")
+            return
 
-        try:
-            print(f"Deleting video titled '{current.text()}' from YouTube")
-            delete_video(self.page, current.text())
+        # with the segments of a split file, unless later uploads use them
+        pattern = re.compile(re.escape(current.text()) + r"\.part\d{3}")
+        segments = sorted(t for t in self.remote_titles() if pattern.fullmatch(t))
+        titles = [current.text()] + segments
+        users = referencing_titles(self.content_index, titles) & self.remote_titles()
+        if users:
+            self.show_error_popup(
+                f"Its content is still used by {', '.join(sorted(users))}."
+            )
+            return
+
+        deleted = []
+
+        def delete(job, _):
+            for title in titles:
+                job.progress(f"Deleting {title}...")
+                print(f"Deleting video titled '{title}'")
+                self.storage.delete(title)
+                deleted.append(title)
+
+        def done(_):
             self.right_status.setText("Video deleted")
-        except Exception as exc:
+            with self.index_lock:
+                forget_titles(self.content_index, titles)
+                save_content_index(self.content_index_path, self.content_index)
+            forget_videos(self.catalog, deleted)
+            self.load_remote_items()
+
+        def failed(exc: Exception):
+            self.show_error_popup(f"Error: {exc}")
+            forget_videos(self.catalog, deleted)
+            self.load_remote_items()
+
+        name = f"Delete {current.text()}"
+        self._submit(name, [Stage("storage", delete)], done, failed)
+
+    def cancel_selected_jobs(self):
+        for item in self.job_list.selectedItems():
+            self.jobs.cancel(item.data(Qt.ItemDataRole.UserRole))
+            item.setText(f"{item.text()} (cancelling)")
+
+    def show_job_progress(self, job_id: int, text: str):
+        item = self.job_items.get(job_id)
+        if item is not None:
+            item.setText(f"{self.jobs.jobs[job_id].name}: {text}")
+
+    def remove_job_item(self, job_id: int):
+        item = self.job_items.pop(job_id, None)
+        if item is not None:
+            self.job_list.takeItem(self.job_list.row(item))
+
+    def _submit(
+        self,
+        name: str,
+        stages: list[Stage],
+        on_done: Callable[[Any], None],
+        on_failed: Callable[[Exception], None],
+        report: JobReport | None = None,
+    ):
+        job = self.jobs.submit(name, stages, on_done, on_failed, report)
+        item = QListWidgetItem(f"{name}: queued")
+        item.setData(Qt.ItemDataRole.UserRole, job.job_id)
+        self.job_list.addItem(item)
+        self.job_items[job.job_id] = item
+
+    def _title_taken(self, title: str) -> bool:
+        return title in self.pending_titles or title in self.remote_titles()
+
+    def _job_failed(self, exc: Exception, label: QLabel):
+        if isinstance(exc, JobCancelled):
+            label.setText("Cancelled")
+        else:
             self.show_error_popup(f"Error: {exc}")
-            return
 
-        row = self.right_list.row(current)
-        self.right_list.takeItem(row)
+    def closeEvent(self, event):
+        # running stages stop at their next step
+        self.jobs.cancel_all()
+        self.codec_lane.shutdown(wait=False, cancel_futures=True)
+        super().closeEvent(event)
 
     def apply_styles(self):
         self.setStyleSheet(
@@ -280,8 +545,8 @@ class FileTransferWindow(QMainWindow):
     def filter_local_list(self, text: str):
         self._filter_list(self.left_list, text)
 
-    def filter_remote_list(self, text: str):
-        self._filter_list(self.right_list, text)
+    def filter_remote_list(self, _text: str):
+        self.load_remote_items()
 
     def _filter_list(self, list_widget: QListWidget, query: str):
         needle = query.lower().strip()
@@ -310,32 +575,186 @@ class FileTransferWindow(QMainWindow):
             self.left_status.setText("Upload cancelled (no title)")
             return
 
-        existing_titles = set()
-        for i in range(self.right_list.count()):
-            item = self.right_list.item(i)
-            if item:
-                existing_titles.add(item.text().strip())
-        if title in existing_titles:
+        if self._title_taken(title):
             self.show_error_popup("A video with this title already exists.")
             return
-
-        try:
-            output_path = self.current_dir / f"{title}.{CONTAINER}"
-            self.left_status.setText("Encoding to video...")
-            convert_file_to_video(str(file_path), str(output_path), self.key, self.rsc)
-            self.left_status.setText("Uploading...")
-            print(f"Uploading {output_path} to YouTube with title '{title}'")
-            upload_video_to_youtube(str(output_path), self.page)
+        self._queue_upload(file_path, title)
+
+    def _queue_upload(self, file_path: Path, title: str):
+        # encoded while the previous job uploads, into a folder of the job so
+        # the video never replaces a file of the user, even one named like it
+        work_dir = Path(tempfile.mkdtemp(prefix="ytdrive-"))
+        output_path = work_dir / f"{title}.{CONTAINER}"
+        size = file_path.stat().st_size
+        report = self._new_report("upload")
+        uploaded = []
+        self.pending_titles.add(title)
+
+        def encode(job, _):
+            job.progress("Encoding to video...")
+            # a copy, only merged once every video is uploaded
+            with self.index_lock:
+                content_index = copy.deepcopy(self.content_index)
+            # big files become segment videos followed by their manifest,
+            # content uploaded before is only referenced by it
+            videos = convert_file_to_video(
+                str(file_path),
+                str(output_path),
+                self.key,
+                self.rsc,
+                self.workers,
+                report=report,
+                segment_size=SEGMENT_SIZE,
+                content_index=content_index,
+                chunking=CONTENT_DEFINED_SEGMENTS,
+            )
+            return videos, content_index
+
+        def upload(job, encoded):
+            videos, content_index = encoded
+            try:
+                for i, video in enumerate(videos):
+                    job.progress(
+                        f"Uploading {Path(video).name} ({i + 1}/{len(videos)})"
+                    )
+                    self._upload(video, report)
+                    uploaded.append(video)
+            finally:
+                # removing the temporary video files
+                for video in videos:
+                    if os.path.exists(video):
+                        os.remove(video)
+            return content_index
+
+        def ended():
+            self.pending_titles.discard(title)
+            shutil.rmtree(work_dir, ignore_errors=True)
+            # segments are listed even when a later one failed
+            for video in uploaded:
+                if video != str(output_path):
+                    record_video(self.catalog, Path(video).stem)
+            self._publish_report(report)
+
+        def done(content_index):
+            with self.index_lock:
+                merge_content_index(self.content_index, content_index)
+                save_content_index(self.content_index_path, self.content_index)
+            record_video(self.catalog, title, file_path.name, size)
+            ended()
+            self.load_remote_items()
             self.left_status.setText("Upload completed")
 
-            # removing the temporary video file
-            os.remove(output_path)
+        def failed(exc: Exception):
+            ended()
+            self.load_remote_items()
+            self._job_failed(exc, self.left_status)
+
+        stages = [Stage("codec", encode), Stage("storage", upload)]
+        self._submit(f"Upload {title}", stages, done, failed, report)
+
+    def _upload(self, video: str, report: JobReport):
+        # a failed upload is retried on its own, so one bad segment does not
+        # restart the whole file
+        for attempt in range(SEGMENT_RETRIES + 1):
+            print(f"Uploading {video}")
+            try:
+                with measure(report, "upload", os.path.getsize(video)):
+                    self.storage.upload(video)
+                return
+            except JobCancelled:
+                raise
+            except Exception as exc:
+                if attempt == SEGMENT_RETRIES:
+                    raise
+                print(f"Upload of {video} failed, attempt {attempt + 1}: {exc}")
+                self.storage.recover()
+
+    def _download(self, title: str, report: JobReport, job, dest_dir: Path) -> str:
+        # on the storage lane
+        job.progress(f"Downloading {title}...")
+        with measure(report, "download"):
+            file_path = self.storage.download(title, str(dest_dir))
+        report.count("download", os.path.getsize(file_path), items=0)
+        return file_path
+
+    def process_local_files(self, filenames: list[str]):
+        # several files packed in a single video
+        file_paths = [self.current_dir / name for name in filenames]
+        if not all(path.is_file() for path in file_paths):
+            self.left_status.setText("Select only files")
+            return
 
-            # append the new title to the remote list and apply current filter
-            self.right_list.addItem(QListWidgetItem(title))
-            self.filter_remote_list(self.right_search.text())
-        except Exception as exc:
-            self.show_error_popup(f"Error: {exc}")
+        title, ok = QInputDialog.getText(
+            self,
+            "Video title",
+            f"Insert the title of the video holding {len(file_paths)} files:",
+            text=self.current_dir.name,
+        )
+        title = title.strip()
+        if not ok or not title:
+            self.left_status.setText("Upload cancelled (no title)")
+            return
+        if self._title_taken(title):
+            self.show_error_popup("A video with this title already exists.")
+            return
+
+        # see _queue_upload
+        work_dir = Path(tempfile.mkdtemp(prefix="ytdrive-"))
+        output_path = work_dir / f"{title}.{CONTAINER}"
+        report = self._new_report("upload")
+        self.pending_titles.add(title)
+
+        def encode(job, _):
+            job.progress("Encoding to video...")
+            return convert_files_to_video(
+                [str(path) for path in file_paths],
+                str(output_path),
+                self.key,
+                self.rsc,
+                self.workers,
+                report=report,
+            )
+
+        def upload(job, members):
+            job.progress("Uploading...")
+            try:
+                self._upload(str(output_path), report)
+            finally:
+                # removing the temporary video file
+                if output_path.exists():
+                    os.remove(output_path)
+            return members
+
+        def done(members):
+            self.pending_titles.discard(title)
+            shutil.rmtree(work_dir, ignore_errors=True)
+            record_video(
+                self.catalog,
+                title,
+                size=sum(m.original_size for m in members),
+                members=index_entry(members),
+            )
+            self.load_remote_items()
+            self.left_status.setText("Upload completed")
+            self._publish_report(report)
+
+        def failed(exc: Exception):
+            self.pending_titles.discard(title)
+            shutil.rmtree(work_dir, ignore_errors=True)
+            self._job_failed(exc, self.left_status)
+            self._publish_report(report)
+
+        stages = [Stage("codec", encode), Stage("storage", upload)]
+        self._submit(f"Upload {title}", stages, done, failed, report)
+
+    def _open_catalog(self) -> sqlite3.Connection:
+        path = self.current_dir / CATALOG
+        existed = path.exists()
+        catalog = open_catalog(str(path))
+        if not existed:
+            index = load_index(str(self.current_dir / ARCHIVE_INDEX))
+            import_archive_index(catalog, index)
+        return catalog
 
     def _load_or_create_key(self) -> bytes:
         key_path = self.current_dir / "aes_key.bin"
@@ -345,29 +764,69 @@ class FileTransferWindow(QMainWindow):
         key_path.write_bytes(key)
         return key
 
-    def process_remote_file(self, filename: str):
-        try:
-            self.right_status.setText("Downloading...")
-            QApplication.processEvents()
-            file_path = download_video(self.page, filename, self.current_dir)
-
-            self.right_status.setText("Decoding video...")
-            QApplication.processEvents()
-            extract_file_from_video(str(file_path), self.key, self.rsc)
-
+    def _new_report(self, job: str) -> JobReport:
+        profile_path = None
+        if PROFILE_JOBS:
+            profile_path = str(self.report_dir / f"{job}-{int(time.time())}.prof")
+        return JobReport(job, profile_path)
+
+    def _publish_report(self, report: JobReport):
+        report.log(str(self.report_dir / JOB_REPORT_LOG))
+        self.statusBar().showMessage(report.summary())
+
+    def process_remote_file(self, filename: str, members: list[str] | None = None):
+        # decoded while the next job downloads
+        report = self._new_report("download")
+        dest_dir = self.current_dir
+
+        def download(job, _):
+            return self._download(filename, report, job, dest_dir)
+
+        def fetch_segment(job, title: str) -> str:
+            return self.storage.submit(
+                self._download, title, report, job, dest_dir
+            ).result()
+
+        def decode(job, file_path: str):
+            job.progress("Decoding video...")
+            # the video of a split file fetches its segments
+            extract_file_from_video(
+                str(file_path),
+                self.key,
+                self.rsc,
+                self.workers,
+                report=report,
+                members=members,
+                fetch_segment=lambda title: fetch_segment(job, title),
+                dest_dir=str(dest_dir),
+            )
+
+        def done(_):
             self.load_local_items()
             self.right_status.setText("Restore completed")
-        except Exception as exc:
-            self.show_error_popup(f"Error: {exc}")
+            self._publish_report(report)
+
+        def failed(exc: Exception):
+            self._job_failed(exc, self.right_status)
+            self._publish_report(report)
+
+        stages = [Stage("storage", download), Stage("codec", decode)]
+        self._submit(f"Download {filename}", stages, done, failed, report)
 
 
 def launch_transfer_gui():
     app = QApplication(sys.argv)
-    with sync_playwright() as p:
-        browser, context, page = create_yt_istance(p)
-        window = FileTransferWindow(browser, context, page)
-        window.show()
-        sys.exit(app.exec())
+    if STORAGE_DIR is not None:
+        storage: StorageBackend = LocalStorage(STORAGE_DIR, STUDIO_SESSIONS)
+    else:
+        # logs in before the window opens, the other pages reuse the cookies
+        storage = StudioPool(STUDIO_SESSIONS)
+        storage.start()
+    window = FileTransferWindow(storage)
+    window.show()
+    code = app.exec()
+    storage.close()
+    sys.exit(code)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,186 @@
+import os
+import json
+import tempfile
+from typing import IO, NamedTuple
+from compression import (
+    COMPRESSION_NONE,
+    COMPRESSION_ZSTD,
+    COMPRESSION_ZSTD_DICT,
+    DICTIONARY_FILE_SIZE,
+    DICTIONARY_SAMPLE_BYTES,
+    copy_compressed,
+    is_compressible,
+    make_compressor,
+    train_member_dictionary,
+)
+
+# table of contents at the start of the payload of a multi-file video; the
+# first version has no dictionary and every member is compressed
+ARCHIVE_MAGIC = b"YTA2"
+ARCHIVE_MAGIC_V1 = b"YTAR"
+
+
+class ArchiveMember(NamedTuple):
+    # offset and size of the compressed member within the data that follows
+    # the table of contents, sha256 is the digest of the original content
+    name: str
+    offset: int
+    size: int
+    original_size: int
+    sha256: bytes
+    compression: int = COMPRESSION_ZSTD
+
+
+class ArchiveToc(NamedTuple):
+    # the dictionary of the COMPRESSION_ZSTD_DICT members comes first in the
+    # data that follows the table of contents
+    members: list[ArchiveMember]
+    dictionary_size: int = 0
+
+
+def build_toc(toc: ArchiveToc) -> bytes:
+    body = bytearray(ARCHIVE_MAGIC + len(toc.members).to_bytes(4, "little"))
+    body += toc.dictionary_size.to_bytes(4, "little")
+    for member in toc.members:
+        name_b = member.name.encode("utf-8")
+        body += len(name_b).to_bytes(2, "little") + name_b
+        body += member.offset.to_bytes(8, "little")
+        body += member.size.to_bytes(8, "little")
+        body += member.original_size.to_bytes(8, "little")
+        body += member.sha256
+        body += member.compression.to_bytes(1, "little")
+    return (len(body) + 4).to_bytes(4, "little") + bytes(body)
+
+
+def parse_toc(buf: bytes) -> ArchiveToc:
+    total_len = int.from_bytes(buf[0:4], "little")
+    if len(buf) < total_len or buf[4:8] not in (ARCHIVE_MAGIC, ARCHIVE_MAGIC_V1):
+        raise ValueError("Not an archive table of contents")
+    v1 = buf[4:8] == ARCHIVE_MAGIC_V1
+
+    count = int.from_bytes(buf[8:12], "little")
+    offset = 12
+    dictionary_size = 0
+    if not v1:
+        dictionary_size = int.from_bytes(buf[12:16], "little")
+        offset = 16
+    members = []
+    for _ in range(count):
+        name_len = int.from_bytes(buf[offset : offset + 2], "little")
+        offset += 2
+        name = buf[offset : offset + name_len].decode("utf-8")
+        offset += name_len
+        values = [
+            int.from_bytes(buf[offset + i : offset + i + 8], "little")
+            for i in (0, 8, 16)
+        ]
+        offset += 24
+        sha256 = bytes(buf[offset : offset + 32])
+        offset += 32
+        compression = COMPRESSION_ZSTD
+        if not v1:
+            compression = buf[offset]
+            offset += 1
+        members.append(ArchiveMember(name, *values, sha256, compression))
+    if offset != total_len:
+        raise ValueError("Archive table of contents is corrupted")
+    return ArchiveToc(members, dictionary_size)
+
+
+def member_names(paths: list[str]) -> list[str]:
+    # names relative to the deepest common folder, with forward slashes
+    if len(paths) == 1:
+        return [os.path.basename(paths[0])]
+    root = os.path.commonpath([os.path.dirname(os.path.abspath(p)) for p in paths])
+    names = [os.path.relpath(os.path.abspath(p), root) for p in paths]
+    names = [name.replace(os.sep, "/") for name in names]
+    if len(set(names)) != len(names):
+        raise ValueError("Archive members must have unique names")
+    return names
+
+
+def member_path(root: str, name: str) -> str:
+    # where a member is extracted, refusing names that escape root
+    parts = name.split("/")
+    if not name or name.startswith("/") or any(p in ("", ".", "..") for p in parts):
+        raise ValueError(f"Invalid archive member name {name!r}")
+    return os.path.join(root, *parts)
+
+
+def pack_files(
+    paths: list[str], names: list[str], level: int, threads: int = 1
+) -> tuple[IO[bytes], ArchiveToc]:
+    # every member is its own zstd frame, so it can be decompressed alone, or
+    # is stored as it is when it does not compress. Small members share a
+    # dictionary when it pays for itself
+    small = [p for p in paths if 0 < os.path.getsize(p) <= DICTIONARY_FILE_SIZE]
+    samples = []
+    sampled = 0
+    for path in small:
+        if sampled >= DICTIONARY_SAMPLE_BYTES:
+            break
+        with open(path, "rb") as f:
+            samples.append(f.read())
+        sampled += len(samples[-1])
+    dictionary = train_member_dictionary(samples, level)
+    small = set(small) if dictionary is not None else set()
+
+    tmp = tempfile.TemporaryFile()
+    members = []
+    try:
+        if dictionary is not None:
+            tmp.write(dictionary.as_bytes())
+        for path, name in zip(paths, names):
+            offset = tmp.tell()
+            original_size = os.path.getsize(path)
+            with open(path, "rb") as src:
+                if path in small:
+                    compression = COMPRESSION_ZSTD_DICT
+                    compressor = make_compressor(original_size, level, 1, dictionary)
+                elif is_compressible(src, 0, original_size):
+                    compression = COMPRESSION_ZSTD
+                    compressor = make_compressor(original_size, level, threads)
+                else:
+                    compression = COMPRESSION_NONE
+                    compressor = None
+                src.seek(0)
+                size, sha256 = copy_compressed(src, tmp, original_size, compressor)
+                if compressor is not None and size >= original_size:
+                    # the sample was wrong, or the member is too small
+                    src.seek(0)
+                    tmp.seek(offset)
+                    tmp.truncate()
+                    compression = COMPRESSION_NONE
+                    size, sha256 = copy_compressed(src, tmp, original_size, None)
+            members.append(
+                ArchiveMember(name, offset, size, original_size, sha256, compression)
+            )
+    except BaseException:
+        tmp.close()
+        raise
+    dictionary_size = 0 if dictionary is None else len(dictionary.as_bytes())
+    tmp.seek(0)
+    return tmp, ArchiveToc(members, dictionary_size)
+
+
+def load_index(path: str) -> dict[str, list[dict[str, int | str]]]:
+    # local record of the members of every archive video, keyed by title,
+    # since the table of contents can only be read by downloading the video
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_index(path: str, index: dict[str, list[dict[str, int | str]]]):
+    tmp_path = f"{path}.part"
+    with open(tmp_path, "w") as f:
+        json.dump(index, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def index_entry(members: list[ArchiveMember]) -> list[dict[str, int | str]]:
+    return [
+        {"name": m.name, "size": m.original_size, "sha256": m.sha256.hex()}
+        for m in members
+    ]
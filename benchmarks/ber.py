@@ -0,0 +1,101 @@
+# bit error rate of the full rgb24 decode against the ffmpeg scaled decode,
+# on videos transcoded again the way a video host would; weak is the share
+# of bytes under codec.ERASURE_MARGIN, caught the share of wrong bytes among
+# them, see codec.SOFT_DECODE
+#
+#   python benchmarks/ber.py --modulation bw gray4 rgb --crf 18 28 35
+#   python benchmarks/ber.py --rendition 360p 480p
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import codec  # noqa: E402
+from modulation import get_modulation  # noqa: E402
+from stream_format import StreamFormat  # noqa: E402
+from simulate import RENDITIONS, transcode  # noqa: E402
+
+
+def decode(
+    path: str, fmt: StreamFormat, scaled: bool
+) -> tuple[bytes, bytes, float, int]:
+    # the data and the margin of every byte
+    collapse = codec.collapse_block_grid if scaled else codec.collapse_frame_to_bits
+    start = time.perf_counter()
+    data = bytearray()
+    margins = bytearray()
+    piped = 0
+    frames = codec.iter_raw_frames(path, fmt, scaled)
+    # the first frame is the preamble
+    next(frames)
+    for frame in frames:
+        piped += len(frame)
+        collapsed = collapse(frame, fmt, soft=True)
+        data += collapsed[: fmt.frame_bytes]
+        margins += collapsed[fmt.frame_bytes :]
+    return bytes(data), bytes(margins), time.perf_counter() - start, piped
+
+
+def bit_errors(a: bytes, b: bytes) -> int:
+    x = np.frombuffer(a, dtype=np.uint8) ^ np.frombuffer(b, dtype=np.uint8)
+    return int(np.unpackbits(x).sum())
+
+
+def erasure_stats(a: bytes, b: bytes, margins: bytes) -> tuple[float, float]:
+    wrong = np.frombuffer(a, dtype=np.uint8) != np.frombuffer(b, dtype=np.uint8)
+    weak = np.frombuffer(margins, dtype=np.uint8) < codec.ERASURE_MARGIN
+    caught = (wrong & weak).sum() / wrong.sum() if wrong.any() else 1.0
+    return float(weak.mean()), float(caught)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--modulation", nargs="+", default=["bw", "gray4", "rgb"])
+    parser.add_argument("--crf", nargs="+", type=int, default=[18, 28, 35])
+    parser.add_argument("--rendition", nargs="+", choices=RENDITIONS, default=[])
+    parser.add_argument("--frames", type=int, default=30)
+    args = parser.parse_args()
+
+    print(
+        f"{'modulation':<10} {'video':>6} {'mode':<6} {'ber':>10} {'weak':>7} "
+        f"{'caught':>7} {'time':>7} {'piped':>10}"
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, "source.mp4")
+        transcoded = os.path.join(tmp, "transcoded.mp4")
+        for name in args.modulation:
+            fmt = StreamFormat(
+                width=codec.W,
+                height=codec.H,
+                block_size=codec.BLOCK_SIZE,
+                fps=codec.FPS,
+                modulation=get_modulation(name).id,
+                rs_nsym=codec.RS_ERROR_CORRECTION_BYTES,
+            )
+            payload = os.urandom(fmt.frame_bytes * args.frames)
+            frames = codec.iter_video_frames([payload], fmt)
+            codec.frames_to_video_file(frames, source, fmt)
+
+            size = (fmt.width, fmt.height)
+            settings = [(f"crf{crf}", {"crf": crf}) for crf in args.crf]
+            settings += [(r, {"rendition": r}) for r in args.rendition]
+            for label, options in settings:
+                transcode(source, transcoded, size, **options)
+                for scaled in (False, True):
+                    data, margins, elapsed, piped = decode(transcoded, fmt, scaled)
+                    ber = bit_errors(data, payload) / (len(payload) * 8)
+                    weak, caught = erasure_stats(data, payload, margins)
+                    mode = "scaled" if scaled else "full"
+                    print(
+                        f"{name:<10} {label:>6} {mode:<6} {ber:>10.2e} "
+                        f"{weak:>7.2%} {caught:>7.2%} {elapsed:>6.2f}s {piped:>10}"
+                    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+# encode throughput of each codec.ENCODE_PROFILES entry against the raw bit
+# error rate left after a simulated re-encode, and how much of the
+# Reed-Solomon correction capacity those errors use up
+#
+#   python benchmarks/calibrate_profiles.py --rendition 360p 480p
+#   python benchmarks/calibrate_profiles.py --modulation gray4 --crf 23 28
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import codec  # noqa: E402
+from modulation import get_modulation  # noqa: E402
+from stream_format import StreamFormat  # noqa: E402
+from simulate import RENDITIONS, transcode  # noqa: E402
+from ber import bit_errors, decode  # noqa: E402
+
+
+def worst_codeword(data: bytes, payload: bytes, nsize: int) -> int:
+    # most symbol errors in any codeword, if payload was a stream of codewords
+    errors = np.frombuffer(data, dtype=np.uint8) != np.frombuffer(
+        payload, dtype=np.uint8
+    )
+    errors = np.concatenate((errors, np.zeros(-len(errors) % nsize, dtype=bool)))
+    return int(errors.reshape(-1, nsize).sum(axis=1).max())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--profile", nargs="+", default=list(codec.ENCODE_PROFILES))
+    parser.add_argument("--modulation", default=codec.MODULATION)
+    parser.add_argument("--crf", nargs="+", type=int, default=[])
+    parser.add_argument("--rendition", nargs="+", choices=RENDITIONS, default=["360p"])
+    parser.add_argument("--frames", type=int, default=120)
+    parser.add_argument("--nsym", type=int, default=codec.RS_ERROR_CORRECTION_BYTES)
+    args = parser.parse_args()
+
+    fmt = StreamFormat(
+        width=codec.W,
+        height=codec.H,
+        block_size=codec.BLOCK_SIZE,
+        fps=codec.FPS,
+        modulation=get_modulation(args.modulation).id,
+        rs_nsym=args.nsym,
+    )
+    payload = os.urandom(fmt.frame_bytes * args.frames)
+    settings = [(f"crf{crf}", {"crf": crf}) for crf in args.crf]
+    settings += [(r, {"rendition": r}) for r in args.rendition]
+    # errors a codeword survives without erasure information
+    capacity = fmt.rs_nsym // 2
+
+    print(
+        f"{'profile':<10} {'encode':>10} {'size':>10} {'video':>6} "
+        f"{'ber':>10} {'worst':>6} {'margin':>6}  decodes"
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, "source.mp4")
+        transcoded = os.path.join(tmp, "transcoded.mp4")
+        for name in args.profile:
+            start = time.perf_counter()
+            frames = codec.iter_video_frames([payload], fmt)
+            codec.frames_to_video_file(frames, source, fmt, name)
+            throughput = len(payload) / (time.perf_counter() - start) / 1e6
+            size = os.path.getsize(source)
+
+            for label, options in settings:
+                transcode(source, transcoded, (fmt.width, fmt.height), **options)
+                data, _, _, _ = decode(transcoded, fmt, scaled=True)
+                ber = bit_errors(data, payload) / (len(payload) * 8)
+                worst = worst_codeword(data, payload, fmt.rs_nsize)
+                margin = capacity - worst
+                print(
+                    f"{name:<10} {throughput:>6.2f}MB/s {size:>10} {label:>6} "
+                    f"{ber:>10.2e} {worst:>6} {margin:>6}  {margin >= 0}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+# bytes materialized by every stage of the codec pipeline, per byte of
+# input, to keep track of the copies between and inside stages
+#
+#   python benchmarks/copies.py --size 64M
+#
+# glibc is told to serve every buffer of at least --mmap-threshold bytes
+# with a fresh mapping, and transparent huge pages are turned off, so every
+# page such a buffer is written to costs one minor page fault; a buffer
+# that is reused or a view into another one costs none. Faults are
+# counted around each stage of the encode and decode pipelines, with
+# STREAM_CHUNK_SIZE windows and no worker pool; the stream is kept in
+# memory between the two. Frames are only rendered with --render, ffmpeg
+# and the demodulation are left out
+
+import os
+import sys
+import time
+import ctypes
+import argparse
+import resource
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import codec  # noqa: E402
+from stream_format import ENCRYPTION_CHUNKED  # noqa: E402
+from roundtrip import parse_size  # noqa: E402
+
+M_MMAP_THRESHOLD = -3
+PR_SET_THP_DISABLE = 41
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+
+def fresh_mappings(threshold: int):
+    libc = ctypes.CDLL(None)
+    if not libc.mallopt(M_MMAP_THRESHOLD, threshold):
+        raise RuntimeError("mallopt failed")
+    libc.prctl(PR_SET_THP_DISABLE, 1, 0, 0, 0)
+
+
+def page_faults() -> int:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_minflt
+
+
+def run_stage(name: str, chunks, size: int, keep: bool = False) -> list:
+    # consumes chunks, printing the bytes they produced and the ones written
+    # to fresh pages, per byte of input
+    kept = []
+    produced = 0
+    faults = page_faults()
+    start = time.perf_counter()
+    for chunk in chunks:
+        produced += len(chunk)
+        if keep:
+            # chunks are never reused by the stages, keeping them costs nothing
+            kept.append(chunk)
+    seconds = time.perf_counter() - start
+    faults = page_faults() - faults
+    print(
+        f"{name:<12} {size / 1e6 / seconds:8.1f}MB/s "
+        f"output {produced / size:6.3f}x "
+        f"materialized {faults * PAGE_SIZE / size:6.3f}x"
+    )
+    return kept
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=parse_size, default="64M")
+    parser.add_argument("--mmap-threshold", type=parse_size, default="64K")
+    parser.add_argument("--render", action="store_true")
+    args = parser.parse_args()
+    fresh_mappings(args.mmap_threshold)
+
+    size = args.size
+    key = os.urandom(16)
+    rsc = codec.RSCodec(codec.RS_ERROR_CORRECTION_BYTES)
+    path = f"copies-{os.getpid()}.bin"
+    with open(path, "wb") as f:
+        for start in range(0, size, codec.STREAM_CHUNK_SIZE):
+            f.write(os.urandom(min(codec.STREAM_CHUNK_SIZE, size - start)))
+    try:
+        header = codec.build_file_header(path, size)
+        stream_size = codec.encrypted_size(len(header) + size, ENCRYPTION_CHUNKED)
+        fmt = codec.choose_stream_format(stream_size, rsc, codec.MODULATION)
+
+        def encrypted(src):
+            return codec.iter_encrypted_chunked(header, src, size, key)
+
+        def encoded(src):
+            return codec.iter_frame_aligned_encoded(
+                rsc, encrypted(src), stream_size, fmt
+            )
+
+        # every stage on top of the ones before it
+        print("encode")
+        with open(path, "rb") as src:
+            run_stage("read", codec.iter_file_chunks(src, size), size)
+        with open(path, "rb") as src:
+            run_stage("encrypt", encrypted(src), size)
+        with open(path, "rb") as src:
+            frames = run_stage("rs_encode", encoded(src), size, keep=True)
+        if args.render:
+            with open(path, "rb") as src:
+                run_stage("render", codec.iter_video_frames(encoded(src), fmt), size)
+
+        print("decode")
+
+        def decoded():
+            return codec.iter_frame_aligned_decoded(rsc, frames, fmt)
+
+        def decrypted():
+            return codec.iter_decrypted_chunked(decoded(), key)
+
+        def restored():
+            reader = codec.ChunkReader(decrypted())
+            head = reader.read(4)
+            reader.read(int.from_bytes(head, "little") - 4)
+            return reader.iter_read(size)
+
+        run_stage("rs_decode", decoded(), size)
+        run_stage("decrypt", decrypted(), size)
+        run_stage("read_payload", restored(), size)
+    finally:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
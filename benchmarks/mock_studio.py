@@ -0,0 +1,306 @@
+# local stand-in for YouTube Studio, with the elements yt_interface clicks:
+# the Create menu and upload dialog, the content list with its pages, and
+# the options menu of every row with Download and Delete forever. The list
+# is filtered by title through its url, as Studio does
+#
+#   python benchmarks/mock_studio.py --port 8765 --store /tmp/studio
+#
+# then point yt_interface.StudioPool at http://127.0.0.1:8765; uploaded
+# videos are kept as files in the store folder and titled after them
+
+import os
+import json
+import time
+import secrets
+import argparse
+import threading
+from urllib.parse import unquote, urlsplit
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# rows of the content list shown at once
+PAGE_SIZE = 30
+
+PAGE = """<!doctype html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>Mock Studio</title>
+<style>
+  .hidden { display: none !important; }
+  tp-yt-paper-icon-item, tp-yt-paper-item, tp-yt-paper-radio-button,
+  ytcp-button, ytcp-checkbox-lit, ytcp-video-row {
+    display: block; padding: 4px; cursor: pointer;
+  }
+  ytcp-checkbox-lit[checked] { font-weight: bold; }
+</style>
+</head>
+<body>
+<button id="create-button"><div>Create</div></button>
+<div id="create-menu" class="hidden">
+  <tp-yt-paper-item id="upload-item">Upload videos</tp-yt-paper-item>
+</div>
+<tp-yt-paper-icon-item id="content-item"><div>Content</div></tp-yt-paper-icon-item>
+
+<div id="upload-dialog" class="hidden">
+  <button id="select-files"><div>Select files</div></button>
+  <input id="file-input" type="file" class="hidden">
+  <div id="details" class="hidden">
+    <tp-yt-paper-radio-button name="VIDEO_MADE_FOR_KIDS_NOT_MFK">
+      No, it's not made for kids
+    </tp-yt-paper-radio-button>
+    <button id="next-button">Next</button>
+    <div id="visibility" class="hidden">
+      <tp-yt-paper-radio-button name="PRIVATE">Private</tp-yt-paper-radio-button>
+      <button id="save-button"><div>Save</div></button>
+    </div>
+  </div>
+  <div id="uploaded" class="hidden">
+    <ytcp-button id="close-button">Close</ytcp-button>
+  </div>
+</div>
+
+<div id="content" class="hidden">
+  <div id="rows"></div>
+  <ytcp-table-footer>
+    <button id="navigate-after" aria-disabled="true">Next page</button>
+  </ytcp-table-footer>
+</div>
+
+<div id="options-menu" class="hidden">
+  <tp-yt-paper-item id="download-item">Download</tp-yt-paper-item>
+  <tp-yt-paper-item id="delete-item">Delete forever</tp-yt-paper-item>
+</div>
+<div id="delete-dialog" class="hidden">
+  <ytcp-checkbox-lit id="confirm-checkbox">Delete forever, can't be undone</ytcp-checkbox-lit>
+  <ytcp-button id="confirm-button">Delete forever</ytcp-button>
+</div>
+
+<script>
+const PAGE_SIZE = %(page_size)d;
+const $ = (id) => document.getElementById(id);
+const show = (id, visible) => $(id).classList.toggle("hidden", !visible);
+let listPage = 0;
+let step = 0;
+let uploading = null;
+let selected = null;
+
+$("content-item").onclick = () => { location.href = "/videos"; };
+$("create-button").onclick = () => show("create-menu", true);
+$("upload-item").onclick = () => {
+  show("create-menu", false);
+  show("upload-dialog", true);
+};
+$("select-files").onclick = () => $("file-input").click();
+$("file-input").onchange = () => {
+  const file = $("file-input").files[0];
+  uploading = fetch("/api/upload", {
+    method: "POST",
+    headers: {"X-Filename": encodeURIComponent(file.name)},
+    body: file,
+  }).then((response) => {
+    if (!response.ok) throw new Error("upload failed");
+  });
+  step = 0;
+  show("details", true);
+};
+$("next-button").onclick = () => {
+  step += 1;
+  show("visibility", step >= 3);
+};
+$("save-button").onclick = async () => {
+  await uploading;
+  show("uploaded", true);
+};
+$("close-button").onclick = () => {
+  for (const id of ["upload-dialog", "details", "visibility", "uploaded"]) {
+    show(id, false);
+  }
+  $("file-input").value = "";
+  render();
+};
+
+$("download-item").onclick = () => {
+  show("options-menu", false);
+  const link = document.createElement("a");
+  link.href = "/download/" + selected;
+  link.download = "";
+  document.body.appendChild(link);
+  link.click();
+  link.remove();
+};
+$("delete-item").onclick = () => {
+  show("options-menu", false);
+  $("confirm-checkbox").removeAttribute("checked");
+  show("delete-dialog", true);
+};
+$("confirm-checkbox").onclick = () => {
+  $("confirm-checkbox").toggleAttribute("checked");
+};
+$("confirm-button").onclick = async () => {
+  if (!$("confirm-checkbox").hasAttribute("checked")) return;
+  await fetch("/api/delete/" + selected, {method: "POST"});
+  show("delete-dialog", false);
+  render();
+};
+$("navigate-after").onclick = () => {
+  if ($("navigate-after").getAttribute("aria-disabled") === "true") return;
+  listPage += 1;
+  render();
+};
+
+function titleFilter() {
+  const rules = JSON.parse(new URLSearchParams(location.search).get("filter") || "[]");
+  const rule = rules.find((r) => r.name === "TITLE");
+  return rule ? rule.value : "";
+}
+
+async function render() {
+  const filter = titleFilter();
+  const videos = (await (await fetch("/api/videos")).json()).filter(
+    (video) => video.title.includes(filter)
+  );
+  const rows = $("rows");
+  rows.replaceChildren();
+  for (const video of videos.slice(listPage * PAGE_SIZE, (listPage + 1) * PAGE_SIZE)) {
+    const row = document.createElement("ytcp-video-row");
+    const cell = document.createElement("div");
+    cell.className = "ytcp-video-list-cell-video right-section";
+    const title = document.createElement("a");
+    title.id = "video-title";
+    title.href = "/video/" + video.id + "/edit";
+    title.textContent = video.title;
+    const options = document.createElement("button");
+    options.setAttribute("aria-label", "Options");
+    options.textContent = "\\u22ee";
+    options.onclick = () => {
+      selected = video.id;
+      show("options-menu", true);
+    };
+    cell.append(title, options);
+    const date = document.createElement("div");
+    date.className = "tablecell-date";
+    date.innerText = video.date + "\\nUploaded";
+    row.append(cell, date);
+    rows.append(row);
+  }
+  const last = (listPage + 1) * PAGE_SIZE >= videos.length;
+  $("navigate-after").setAttribute("aria-disabled", String(last));
+}
+
+if (location.pathname === "/videos") {
+  show("content", true);
+  render();
+}
+</script>
+</body>
+</html>
+"""
+
+
+class MockStudio:
+    # uploaded videos, newest first, kept as files in store
+    def __init__(self, store: str):
+        self.store = store
+        self.videos: list[dict[str, str]] = []
+        self.lock = threading.Lock()
+        os.makedirs(store, exist_ok=True)
+
+    def add(self, filename: str, data: bytes) -> str:
+        video_id = secrets.token_urlsafe(8)
+        with open(os.path.join(self.store, video_id), "wb") as f:
+            f.write(data)
+        video = {
+            "id": video_id,
+            "title": os.path.splitext(filename)[0],
+            "filename": filename,
+            "date": time.strftime("%b %d, %Y"),
+        }
+        with self.lock:
+            self.videos.insert(0, video)
+        return video_id
+
+    def find(self, video_id: str) -> dict[str, str] | None:
+        with self.lock:
+            return next((v for v in self.videos if v["id"] == video_id), None)
+
+    def delete(self, video_id: str):
+        with self.lock:
+            self.videos = [v for v in self.videos if v["id"] != video_id]
+        path = os.path.join(self.store, video_id)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def make_handler(studio: MockStudio):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status: int, body: bytes, content_type: str, **headers):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in headers.items():
+                self.send_header(name.replace("_", "-"), value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if urlsplit(self.path).path in ("/", "/videos"):
+                page = PAGE % {"page_size": PAGE_SIZE}
+                self._send(200, page.encode("utf-8"), "text/html; charset=utf-8")
+            elif self.path == "/api/videos":
+                with studio.lock:
+                    body = json.dumps(studio.videos).encode("utf-8")
+                self._send(200, body, "application/json")
+            elif self.path.startswith("/download/"):
+                video = studio.find(self.path.split("/")[2])
+                if video is None:
+                    self._send(404, b"", "text/plain")
+                    return
+                with open(os.path.join(studio.store, video["id"]), "rb") as f:
+                    data = f.read()
+                disposition = f"attachment; filename=\"{video['filename']}\""
+                self._send(200, data, "video/mp4", Content_Disposition=disposition)
+            else:
+                self._send(404, b"", "text/plain")
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            data = self.rfile.read(length)
+            if self.path == "/api/upload":
+                filename = unquote(self.headers.get("X-Filename", "video.mp4"))
+                video_id = studio.add(os.path.basename(filename), data)
+                body = json.dumps({"id": video_id}).encode("utf-8")
+                self._send(200, body, "application/json")
+            elif self.path.startswith("/api/delete/"):
+                studio.delete(self.path.split("/")[3])
+                self._send(200, b"{}", "application/json")
+            else:
+                self._send(404, b"", "text/plain")
+
+    return Handler
+
+
+def serve(store: str, port: int = 0) -> tuple[ThreadingHTTPServer, str]:
+    # serves in a background thread, returns the server and its url
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(MockStudio(store)))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--store", default="mock_studio")
+    args = parser.parse_args()
+    server, url = serve(args.store, args.port)
+    print(f"Mock Studio on {url}, videos in {args.store}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
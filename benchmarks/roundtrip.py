@@ -0,0 +1,187 @@
+# end to end round trips: convert_file_to_video, a simulated re-encode by the
+# video host, then extract_file_from_video, with the time spent in every
+# stage, peak memory, video size overhead and whether the file came back
+#
+#   python benchmarks/roundtrip.py --sizes 1K 1M 64M 2G --output results.json
+#
+# each case runs in its own process so that its peak RSS can be measured;
+# stage times come from instrumentation.JobReport, their throughput is given
+# relative to the original file size
+
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import shutil
+import resource
+import tempfile
+import subprocess as sp
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import codec  # noqa: E402
+from instrumentation import JobReport  # noqa: E402
+from simulate import RENDITIONS, transcode  # noqa: E402
+
+UNITS = {"": 1, "K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+
+
+def parse_size(text: str) -> int:
+    unit = text[-1].upper() if text[-1].isalpha() else ""
+    return int(text[: len(text) - len(unit)]) * UNITS[unit]
+
+
+def write_payload(path: str, size: int) -> str:
+    # half random and half repetitive so that compression has some work,
+    # returns the sha256 of the content
+    digest = hashlib.sha256()
+    chunk = codec.STREAM_CHUNK_SIZE
+    with open(path, "wb") as f:
+        for start in range(0, size, chunk):
+            n = min(chunk, size - start)
+            block = os.urandom(n // 2) + bytes(range(256)) * (n // 512 + 1)
+            block = block[:n]
+            digest.update(block)
+            f.write(block)
+    return digest.hexdigest()
+
+
+def file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in codec.iter_file_chunks(f):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def run_case(size: int, args) -> dict:
+    key = os.urandom(16)
+    rsc = codec.RSCodec(codec.RS_ERROR_CORRECTION_BYTES)
+    encode_report = JobReport("encode")
+    decode_report = JobReport("decode")
+    workdir = tempfile.mkdtemp(prefix="roundtrip-", dir=args.tmp)
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        expected = write_payload("payload.bin", size)
+        with encode_report:
+            codec.convert_file_to_video(
+                "payload.bin",
+                "encoded.mp4",
+                key,
+                rsc,
+                args.workers,
+                args.modulation,
+                profile=args.profile,
+                report=encode_report,
+            )
+        video_size = os.path.getsize("encoded.mp4")
+        os.rename("payload.bin", "original.bin")
+
+        video = "encoded.mp4"
+        start = time.perf_counter()
+        if args.rendition is not None or args.crf is not None:
+            fmt = codec.read_stream_format(video)
+            size_wh = (fmt.width, fmt.height)
+            transcode(video, "transcoded.mp4", size_wh, args.crf, args.rendition)
+            video = "transcoded.mp4"
+        platform = time.perf_counter() - start
+
+        try:
+            with decode_report:
+                codec.extract_file_from_video(
+                    video, key, rsc, args.workers, report=decode_report
+                )
+            ok = file_digest("payload.bin") == expected
+            error = None
+        except Exception as e:
+            ok, error = False, f"{type(e).__name__}: {e}"
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir)
+
+    stages = {**encode_report.stages, **decode_report.stages}
+    return {
+        "size": size,
+        "modulation": args.modulation,
+        "profile": args.profile,
+        "workers": args.workers,
+        "rendition": args.rendition,
+        "crf": args.crf,
+        "ok": ok,
+        "error": error,
+        "video_bytes": video_size,
+        "overhead": video_size / max(size, 1),
+        "encode_seconds": encode_report.elapsed,
+        "platform_seconds": platform,
+        "decode_seconds": decode_report.elapsed,
+        "stages": {
+            name: {
+                "seconds": stage["seconds"],
+                "mb_per_s": size / 1e6 / max(stage["seconds"], 1e-9),
+            }
+            for name, stage in stages.items()
+        },
+        # kilobytes on linux, children is the largest ffmpeg or worker
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "peak_rss_children_mb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        / 1024,
+    }
+
+
+def print_result(result: dict):
+    print(
+        f"{result['size']:>12} ok={result['ok']} "
+        f"video={result['video_bytes']} ({result['overhead']:.2f}x) "
+        f"rss={result['peak_rss_mb']:.0f}MB ffmpeg={result['peak_rss_children_mb']:.0f}MB"
+    )
+    if result["error"]:
+        print(f"{'':>12} {result['error']}")
+    for name, stage in result["stages"].items():
+        print(
+            f"{'':>12} {name:<14} {stage['seconds']:>8.2f}s {stage['mb_per_s']:>8.2f}MB/s"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", nargs="+", default=["1K", "1M", "64M"])
+    parser.add_argument("--modulation", default=codec.MODULATION)
+    parser.add_argument("--profile", default=codec.ENCODE_PROFILE)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--rendition", choices=RENDITIONS, default=None)
+    parser.add_argument("--crf", type=int, default=None)
+    parser.add_argument("--tmp", default=None)
+    parser.add_argument("--output", default=None)
+    # internal, runs a single case and prints its result as json
+    parser.add_argument("--case", type=int, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case is not None:
+        print(json.dumps(run_case(args.case, args)))
+        return
+
+    results = []
+    for size in map(parse_size, args.sizes):
+        command = [sys.executable, os.path.abspath(__file__), "--case", str(size)]
+        for option in ("modulation", "profile", "workers", "rendition", "crf", "tmp"):
+            value = getattr(args, option)
+            if value is not None:
+                command += [f"--{option}", str(value)]
+        proc = sp.run(command, stdout=sp.PIPE, text=True)
+        if proc.returncode != 0:
+            raise RuntimeError(f"Benchmark case of {size} bytes failed")
+        # the codec prints progress, the result is the last line
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        print_result(result)
+        results.append(result)
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
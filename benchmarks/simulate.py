@@ -0,0 +1,59 @@
+# local stand-in for the re-encode a video host applies after upload
+
+import subprocess as sp
+from codec import LEGACY_FORMAT, read_stream_format
+
+# height and average avc bitrate of typical yt renditions
+RENDITIONS = {
+    "360p": (360, "700k"),
+    "480p": (480, "1200k"),
+    "720p": (720, "2500k"),
+    "1080p": (1080, "4500k"),
+}
+
+
+def transcode(
+    src: str,
+    dst: str,
+    size: tuple[int, int],
+    crf: int | None = None,
+    rendition: str | None = None,
+):
+    # re-encodes src at a constant quality or at the bitrate of a rendition,
+    # scaling through the rendition height and back to size when they differ
+    width, height = size
+    options = ["-crf", str(23 if crf is None else crf)]
+    filters = []
+    if rendition is not None:
+        rendition_height, bitrate = RENDITIONS[rendition]
+        options = ["-b:v", bitrate, "-maxrate", bitrate, "-bufsize", bitrate]
+        if rendition_height != height:
+            filters = ["-vf", f"scale=-2:{rendition_height},scale={width}:{height}"]
+
+    command = [
+        "ffmpeg",
+        "-y",
+        "-loglevel",
+        "error",
+        "-i",
+        src,
+        *filters,
+        "-c:v",
+        "libx264",
+        "-pix_fmt",
+        "yuv420p",
+        *options,
+        dst,
+    ]
+    if sp.run(command).returncode != 0:
+        raise RuntimeError("FFmpeg failed to transcode video")
+
+
+def host_transcode(crf: int | None = None, rendition: str | None = None):
+    # transcode for storage.LocalStorage, at the frame size of each video;
+    # videos without a preamble have the legacy one
+    def run(src: str, dst: str):
+        fmt = read_stream_format(src) or LEGACY_FORMAT
+        transcode(src, dst, (fmt.width, fmt.height), crf, rendition)
+
+    return run
@@ -0,0 +1,175 @@
+# uploads and downloads through a storage backend, to see how transfers
+# scale with its concurrency: storage.LocalStorage in a temporary folder,
+# or yt_interface.StudioPool against the local mock Studio
+#
+#   python benchmarks/storage_load.py --backend local --concurrency 1 2 4
+#   python benchmarks/storage_load.py --backend studio --concurrency 1 2 4
+#
+# with --crf or --rendition the local backend re-encodes what it stores like
+# a video host, the files are then encoded videos and checked by decoding
+# them; with --break-page, the page of one Studio thread is closed before
+# the downloads
+
+import os
+import sys
+import time
+import shutil
+import hashlib
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import codec  # noqa: E402
+from storage import LocalStorage, StorageBackend  # noqa: E402
+from roundtrip import parse_size  # noqa: E402
+from simulate import RENDITIONS, host_transcode  # noqa: E402
+
+
+def file_digest(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def open_backend(concurrency: int, args) -> tuple[StorageBackend, object | None]:
+    # the backend and the mock server it talks to, if any
+    if args.backend == "local":
+        transcode = None
+        if args.crf is not None or args.rendition is not None:
+            transcode = host_transcode(args.crf, args.rendition)
+        return LocalStorage("store", concurrency, transcode), None
+
+    # only needed for this backend
+    from yt_interface import StudioPool
+    from mock_studio import serve
+
+    server, url = serve("store")
+    pool = StudioPool(concurrency, studio_url=url, headless=not args.headed)
+    try:
+        pool.start()
+    except Exception:
+        pool.close()
+        server.shutdown()
+        raise
+    return pool, server
+
+
+def make_files(args, key: bytes, rsc: codec.RSCodec) -> dict[str, str]:
+    # title to the digest of what a download must give back
+    expected = {}
+    for i in range(args.files):
+        title = f"video{i:03d}"
+        if args.encoded:
+            payload = f"{title}.bin"
+            with open(payload, "wb") as f:
+                f.write(os.urandom(args.size))
+            expected[title] = file_digest(payload)
+            codec.convert_file_to_video(
+                payload, os.path.join("up", f"{title}.mp4"), key, rsc
+            )
+            os.remove(payload)
+        else:
+            path = os.path.join("up", f"{title}.mp4")
+            with open(path, "wb") as f:
+                f.write(os.urandom(args.size))
+            expected[title] = file_digest(path)
+    return expected
+
+
+def check_download(path: str, digest: str, args, key, rsc) -> bool:
+    if not args.encoded:
+        return file_digest(path) == digest
+    try:
+        restored = codec.extract_file_from_video(path, key, rsc)
+    except Exception as e:
+        print(f"{os.path.basename(path)}: {type(e).__name__}: {e}")
+        return False
+    ok = file_digest(restored) == digest
+    os.remove(restored)
+    return ok
+
+
+def run_case(concurrency: int, args) -> dict:
+    key = os.urandom(16)
+    rsc = codec.RSCodec(codec.RS_ERROR_CORRECTION_BYTES)
+    workdir = tempfile.mkdtemp(prefix="storage-load-", dir=args.tmp)
+    cwd = os.getcwd()
+    # no saved cookies, the mock needs no login
+    os.chdir(workdir)
+    try:
+        os.makedirs("up")
+        os.makedirs("down")
+        expected = make_files(args, key, rsc)
+        # what is moved, encoded videos are larger than their payload
+        total = sum(os.path.getsize(os.path.join("up", n)) for n in os.listdir("up"))
+        backend, server = open_backend(concurrency, args)
+        try:
+            start = time.perf_counter()
+            backend.upload_many(
+                sorted(os.path.join("up", name) for name in os.listdir("up"))
+            )
+            upload_seconds = time.perf_counter() - start
+
+            if args.break_page and args.backend == "studio":
+                backend.submit(lambda: backend.page.close()).result()
+
+            start = time.perf_counter()
+            paths = backend.download_many(list(expected), "down")
+            download_seconds = time.perf_counter() - start
+        finally:
+            backend.close()
+            if server is not None:
+                server.shutdown()
+        ok = all(
+            check_download(
+                path,
+                expected[os.path.splitext(os.path.basename(path))[0]],
+                args,
+                key,
+                rsc,
+            )
+            for path in paths
+        )
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir)
+
+    return {
+        "concurrency": concurrency,
+        "ok": ok,
+        "upload_seconds": upload_seconds,
+        "upload_mb_per_s": total / 1e6 / upload_seconds,
+        "download_seconds": download_seconds,
+        "download_mb_per_s": total / 1e6 / download_seconds,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backend", choices=["local", "studio"], default="local")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--files", type=int, default=8)
+    parser.add_argument("--size", type=parse_size, default="4M")
+    parser.add_argument("--rendition", choices=RENDITIONS, default=None)
+    parser.add_argument("--crf", type=int, default=None)
+    parser.add_argument("--break-page", action="store_true")
+    parser.add_argument("--headed", action="store_true")
+    parser.add_argument("--tmp", default=None)
+    args = parser.parse_args()
+    args.encoded = args.crf is not None or args.rendition is not None
+    if args.encoded and args.backend != "local":
+        parser.error("--crf and --rendition only apply to the local backend")
+
+    for concurrency in args.concurrency:
+        result = run_case(concurrency, args)
+        print(
+            f"{args.backend} x{concurrency:<3} ok={result['ok']} "
+            f"upload {result['upload_seconds']:.2f}s "
+            f"({result['upload_mb_per_s']:.1f}MB/s) "
+            f"download {result['download_seconds']:.2f}s "
+            f"({result['download_mb_per_s']:.1f}MB/s)"
+        )
+
+
+if __name__ == "__main__":
+    main()
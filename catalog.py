@@ -0,0 +1,202 @@
+import time
+import sqlite3
+from typing import Iterable, NamedTuple
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS videos (
+    title TEXT PRIMARY KEY,
+    video_id TEXT UNIQUE,
+    filename TEXT,
+    size INTEGER,
+    uploaded REAL
+);
+CREATE INDEX IF NOT EXISTS videos_uploaded ON videos (uploaded);
+CREATE TABLE IF NOT EXISTS members (
+    title TEXT NOT NULL REFERENCES videos (title)
+        ON DELETE CASCADE ON UPDATE CASCADE,
+    position INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    sha256 TEXT NOT NULL,
+    PRIMARY KEY (title, position)
+);
+CREATE INDEX IF NOT EXISTS members_name ON members (name);
+"""
+
+
+class CatalogEntry(NamedTuple):
+    # video_id is only known once the video was seen in the Studio list,
+    # filename and size are those of the original file when uploaded here
+    title: str
+    video_id: str | None
+    filename: str | None
+    size: int | None
+    uploaded: float | None
+
+
+def open_catalog(path: str) -> sqlite3.Connection:
+    # local record of every remote video, so listing and searching them does
+    # not need to scrape the Studio list
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA foreign_keys = ON")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def _like(query: str) -> str:
+    escaped = query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+# videos whose title or member names contain :q
+SEARCH_FILTER = (
+    "title LIKE :q ESCAPE '\\' OR title IN"
+    " (SELECT title FROM members WHERE name LIKE :q ESCAPE '\\')"
+)
+
+
+def search_videos(conn: sqlite3.Connection, query: str = "") -> list[CatalogEntry]:
+    # newest first
+    rows = conn.execute(
+        "SELECT title, video_id, filename, size, uploaded FROM videos"
+        f" WHERE {SEARCH_FILTER}"
+        " ORDER BY uploaded IS NULL, uploaded DESC, title",
+        {"q": _like(query.strip())},
+    )
+    return [CatalogEntry(*row) for row in rows]
+
+
+def search_members(
+    conn: sqlite3.Connection, query: str = ""
+) -> dict[str, list[dict[str, int | str]]]:
+    # the members of every video search_videos finds, by title, in one query
+    rows = conn.execute(
+        "SELECT title, name, size, sha256 FROM members WHERE title IN"
+        f" (SELECT title FROM videos WHERE {SEARCH_FILTER})"
+        " ORDER BY title, position",
+        {"q": _like(query.strip())},
+    )
+    members: dict[str, list[dict[str, int | str]]] = {}
+    for title, name, size, sha256 in rows:
+        members.setdefault(title, []).append(
+            {"name": name, "size": size, "sha256": sha256}
+        )
+    return members
+
+
+def catalog_titles(conn: sqlite3.Connection) -> set[str]:
+    return {title for (title,) in conn.execute("SELECT title FROM videos")}
+
+
+def record_video(
+    conn: sqlite3.Connection,
+    title: str,
+    filename: str | None = None,
+    size: int | None = None,
+    members: list[dict[str, int | str]] | None = None,
+):
+    # a video uploaded from here, its id is filled in by the next refresh
+    with conn:
+        _record(conn, title, filename, size, members or [], time.time())
+
+
+def import_archive_index(
+    conn: sqlite3.Connection, index: dict[str, list[dict[str, int | str]]]
+):
+    # members of the archive videos recorded in the json index, their upload
+    # time is taken from the Studio list
+    with conn:
+        for title, members in index.items():
+            _record(conn, title, None, None, members, None)
+
+
+def _record(
+    conn: sqlite3.Connection,
+    title: str,
+    filename: str | None,
+    size: int | None,
+    members: list[dict[str, int | str]],
+    uploaded: float | None,
+):
+    conn.execute(
+        "INSERT INTO videos (title, filename, size, uploaded) VALUES (?, ?, ?, ?)"
+        " ON CONFLICT (title) DO UPDATE SET filename = excluded.filename,"
+        " size = excluded.size, uploaded = excluded.uploaded",
+        (title, filename, size, uploaded),
+    )
+    conn.execute("DELETE FROM members WHERE title = ?", (title,))
+    conn.executemany(
+        "INSERT INTO members (title, position, name, size, sha256)"
+        " VALUES (?, ?, ?, ?, ?)",
+        [(title, i, m["name"], m["size"], m["sha256"]) for i, m in enumerate(members)],
+    )
+
+
+def forget_videos(conn: sqlite3.Connection, titles: Iterable[str]):
+    with conn:
+        conn.executemany("DELETE FROM videos WHERE title = ?", [(t,) for t in titles])
+
+
+def merge_page(
+    conn: sqlite3.Connection, videos: Iterable[tuple[str, str, float | None]]
+) -> int:
+    # title, video id and upload time of a page of the Studio list, returns
+    # how many of them were not in the catalog yet
+    new = 0
+    with conn:
+        for title, video_id, uploaded in videos:
+            row = conn.execute(
+                "SELECT title FROM videos WHERE video_id = ?", (video_id,)
+            ).fetchone()
+            if row is not None:
+                if row[0] != title:
+                    # renamed in Studio
+                    conn.execute(
+                        "UPDATE OR REPLACE videos SET title = ? WHERE video_id = ?",
+                        (title, video_id),
+                    )
+                continue
+            new += 1
+            conn.execute(
+                "INSERT INTO videos (title, video_id, uploaded) VALUES (?, ?, ?)"
+                " ON CONFLICT (title) DO UPDATE SET video_id = excluded.video_id,"
+                " uploaded = coalesce(uploaded, excluded.uploaded)",
+                (title, video_id, uploaded),
+            )
+    return new
+
+
+def refresh_catalog(
+    conn: sqlite3.Connection,
+    pages: Iterable[list[tuple[str, str, float | None]]],
+    full: bool = False,
+) -> int:
+    # the Studio list is sorted newest first, so paging stops at the first
+    # page holding nothing new; a full refresh reads every page and drops
+    # the videos deleted elsewhere. Returns the number of new videos
+    new = 0
+    seen = set()
+    pages = iter(pages)
+    try:
+        for videos in pages:
+            page_new = merge_page(conn, videos)
+            new += page_new
+            seen.update(video_id for _, video_id, _ in videos)
+            if not full and page_new == 0:
+                break
+    finally:
+        close = getattr(pages, "close", None)
+        if close is not None:
+            close()
+    if full:
+        with conn:
+            known = conn.execute(
+                "SELECT video_id FROM videos WHERE video_id IS NOT NULL"
+            )
+            gone = [(video_id,) for (video_id,) in known if video_id not in seen]
+            conn.executemany("DELETE FROM videos WHERE video_id = ?", gone)
+            # imported ones never seen in the list
+            conn.execute(
+                "DELETE FROM videos WHERE video_id IS NULL AND uploaded IS NULL"
+            )
+    return new
@@ -1,56 +1,589 @@
+import io
 import os
+import shutil
+import hashlib
+import tempfile
+import functools
+import itertools
+import multiprocessing
 import numpy as np
 import subprocess as sp
-import reedsolo
+from concurrent.futures import ProcessPoolExecutor
+from typing import IO, Callable, Iterable, Iterator, NamedTuple
 from Crypto.Cipher import AES
-from zstandard import ZstdCompressor, ZstdDecompressor
+from Crypto.Hash import CMAC
+from reed_solomon import RSCodec
+from parallel import SharedMemoryPool
+from instrumentation import (
+    JobCancelled,
+    JobReport,
+    check_cancelled,
+    measure,
+    measure_iter,
+)
+from compression import (
+    COMPRESSION_NONE,
+    COMPRESSION_ZSTD,
+    COMPRESSION_ZSTD_DICT,
+    copy_compressed,
+    is_compressible,
+    iter_decompressed,
+    make_compressor,
+)
+from archive import (
+    ArchiveMember,
+    build_toc,
+    member_names,
+    member_path,
+    pack_files,
+    parse_toc,
+)
+from modulation import MODULATIONS, get_modulation
+from dedup import (
+    ContentIndex,
+    content_defined_chunks,
+    lookup_content,
+    range_sha256,
+    record_content,
+)
+from segments import (
+    MANIFEST_SUFFIX,
+    Segment,
+    SegmentManifest,
+    build_manifest,
+    parse_manifest,
+    segment_path,
+    segment_ranges,
+    segment_title,
+)
+from stream_format import (
+    ENCRYPTION_CHUNKED,
+    ENCRYPTION_EAX,
+    ENCRYPTION_EAX_TAIL,
+    LAYOUT_FRAME_ALIGNED,
+    PREAMBLE_GRID_H,
+    PREAMBLE_GRID_W,
+    StreamFormat,
+    build_sync_markers,
+    deinterleave_codewords,
+    interleave_codewords,
+    parse_preamble_grid,
+    read_sync_marker,
+    render_preamble_frame,
+)
+
+
+class EncodeProfile(NamedTuple):
+    # x264 settings of the generated video, gop and tune are left to x264
+    # when None, and the zstd level of its payload, see compression_level
+    preset: str
+    crf: int
+    gop: int | None = None
+    tune: str | None = None
+    zstd_level: int = 3
+
 
 # yt needs at least 32 frames to allow the upload
 # this value should be adjusted based on the data size
 W, H = 640, 360
 BLOCK_SIZE = 2
-W_BLOCKS = W // BLOCK_SIZE
-H_BLOCKS = H // BLOCK_SIZE
-BITS_PER_FRAME = W_BLOCKS * H_BLOCKS
-BYTES_PER_FRAME = BITS_PER_FRAME // 8
 # low framerate so that the video has more duration
 # i think that yt has a minimum duration requirement of 1 second
 # if file is small its more likely to pass the check
 FPS = 6
 RS_ERROR_CORRECTION_BYTES = 8
+# symbol scheme used for new videos, see modulation.MODULATIONS
+MODULATION = "bw"
+# files that fit in the minimum number of frames even with bigger blocks and
+# more parity get that for free, see choose_stream_format
+ROBUST_BLOCK_SIZE = 4
+ROBUST_RS_ERROR_CORRECTION_BYTES = 32
+# frames each codeword of new videos is spread over, so a badly compressed
+# part of a frame costs every codeword a few bytes instead of wiping out a
+# few codewords; surviving the loss of a whole frame would take
+# nsize / (nsym / 2) of them. Random access decodes whole groups
+INTERLEAVE_FRAMES = 8
+# let ffmpeg average the blocks of videos with a preamble when decoding,
+# instead of reading back full rgb24 frames
+SCALED_DECODE = True
+# frame aligned videos are decoded with the margin of every byte to its
+# decision threshold, bytes under ERASURE_MARGIN (of 255, see
+# Modulation.margins) are erased in the codewords that have too many errors
+# to correct otherwise; a codeword corrects twice as many erasures as errors
+SOFT_DECODE = True
+ERASURE_MARGIN = 64
 CONTAINER = "mp4"
 CODEC = "libx264"
+# the video is re-encoded by yt anyway, see benchmarks/calibrate_profiles.py
+# for the speed against bit errors of each profile
+ENCODE_PROFILES = {
+    "fast": EncodeProfile(
+        preset="veryfast", crf=18, gop=250, tune="stillimage", zstd_level=1
+    ),
+    "balanced": EncodeProfile(preset="medium", crf=18, gop=250, tune="stillimage"),
+    "archival": EncodeProfile(preset="veryslow", crf=18, zstd_level=9),
+}
+ENCODE_PROFILE = "archival"
 COOKIES_PATH = "youtube_cookies.json"
-zstd_compressor = ZstdCompressor(level=3, write_checksum=True)
-zstd_decompressor = ZstdDecompressor()
-
-
-def encrypt_bytes_eax(data: bytes, key: bytes) -> bytes:
+# what the payload after the file header holds
+KIND_FILE = 0
+KIND_ARCHIVE = 1
+KIND_MANIFEST = 2
+# yt rejects videos longer than 12 hours, about 1.8 GB of payload at the
+# default format, so bigger files are split into segments of this size
+SEGMENT_SIZE = 1 << 30
+# times a segment is fetched again when it fails to decode or match its hash
+SEGMENT_RETRIES = 2
+# size of the windows read, compressed and encrypted by the streaming encoder
+STREAM_CHUNK_SIZE = 1 << 20
+# work handed to each process of the pool when running with workers > 1
+PARALLEL_CODEWORDS_PER_TASK = 1024
+PARALLEL_FRAMES_PER_TASK = 4
+PARALLEL_CIPHER_CHUNKS_PER_TASK = 16
+# ENCRYPTION_CHUNKED seals every CIPHER_CHUNK_SIZE bytes of the stream on
+# their own, see ChunkedHead
+CHUNKED_VERSION = 1
+CIPHER_CHUNK_SIZE = 1 << 14
+# plaintext read from the start of an archive for its header and table of
+# contents when extracting single members, more is read if they are longer
+ARCHIVE_INDEX_READ_SIZE = 1 << 14
+CHUNKED_HEAD_SIZE = 20
+CHUNKED_NONCE_PREFIX_SIZE = 7
+GCM_NONCE_SIZE = 12
+GCM_TAG_SIZE = 16
+# an EAX stream starts with its total length and nonce, followed by the tag
+# with ENCRYPTION_EAX, the tag ends it with ENCRYPTION_EAX_TAIL
+EAX_NONCE_SIZE = 16
+EAX_TAG_SIZE = 16
+# videos written before the preamble frame existed, version 0 has no preamble
+LEGACY_FORMAT = StreamFormat(
+    width=W,
+    height=H,
+    block_size=BLOCK_SIZE,
+    fps=FPS,
+    modulation=0,
+    rs_nsym=RS_ERROR_CORRECTION_BYTES,
+    version=0,
+)
+
+
+class ChunkedHead(NamedTuple):
+    # start of a chunked stream: its total length, then the version, chunk
+    # size and nonce prefix, which are authenticated with every chunk. Chunk i
+    # is sealed with AES-GCM under prefix + i + a flag set on the last chunk,
+    # so chunks cannot be reordered, dropped or truncated unnoticed
+    total_len: int
+    chunk_size: int
+    prefix: bytes
+    version: int = CHUNKED_VERSION
+
+    @property
+    def chunks(self) -> int:
+        body = self.total_len - CHUNKED_HEAD_SIZE
+        return -(-body // (self.chunk_size + GCM_TAG_SIZE))
+
+    @property
+    def aad(self) -> bytes:
+        return self.to_bytes()[8:]
+
+    def chunk_offset(self, index: int) -> int:
+        # where chunk index starts in the stream
+        return CHUNKED_HEAD_SIZE + index * (self.chunk_size + GCM_TAG_SIZE)
+
+    def nonces(self, first: int, count: int) -> list[bytes]:
+        last = self.chunks - 1
+        return [
+            self.prefix + i.to_bytes(4, "big") + bytes([i == last])
+            for i in range(first, first + count)
+        ]
+
+    def to_bytes(self) -> bytes:
+        return (
+            self.total_len.to_bytes(8, "little")
+            + self.version.to_bytes(1, "little")
+            + self.chunk_size.to_bytes(4, "little")
+            + self.prefix
+        )
+
+    @classmethod
+    def from_bytes(cls, buf: bytes) -> "ChunkedHead":
+        if len(buf) < CHUNKED_HEAD_SIZE:
+            raise ValueError("Encrypted stream is too short")
+        version = buf[8]
+        if version != CHUNKED_VERSION:
+            raise ValueError(f"Unsupported encrypted stream version {version}")
+        chunk_size = int.from_bytes(buf[9:13], "little")
+        if chunk_size == 0:
+            raise ValueError("Encrypted stream header is corrupted")
+        return cls(
+            total_len=int.from_bytes(buf[:8], "little"),
+            chunk_size=chunk_size,
+            prefix=bytes(buf[13:CHUNKED_HEAD_SIZE]),
+            version=version,
+        )
+
+
+def iter_encrypted_eax(
+    header: bytes, src: IO[bytes], size: int, key: bytes
+) -> Iterator[bytes]:
+    # ENCRYPTION_EAX_TAIL: total length and nonce, the ciphertext of header +
+    # the next size bytes of src, then the tag, in a single pass over src
     cipher = AES.new(key, AES.MODE_EAX)
-    ciphertext, tag = cipher.encrypt_and_digest(data)
-
-    encrypted = cipher.nonce + tag + ciphertext
-    total_len = len(encrypted) + 8
-    encrypted = total_len.to_bytes(8, "little") + encrypted
-
-    return encrypted
-
-
-# TODO: faster interpolation and video encoding
-
-
-def decrypt_bytes_eax(encrypted_data: bytes, key: bytes) -> bytes:
-    total_len = int.from_bytes(encrypted_data[:8], "little")
-    encrypted_data = encrypted_data[8:total_len]
-    nonce = encrypted_data[:16]
-    tag = encrypted_data[16:32]
-    ciphertext = encrypted_data[32:]
-    cipher = AES.new(key, AES.MODE_EAX, nonce=nonce)
-    data = cipher.decrypt_and_verify(ciphertext, tag)
-    return data
-
+    total_len = encrypted_size(len(header) + size, ENCRYPTION_EAX_TAIL)
+    yield total_len.to_bytes(8, "little") + cipher.nonce + cipher.encrypt(header)
+
+    read = 0
+    for chunk in iter_file_chunks(src, size):
+        read += len(chunk)
+        yield cipher.encrypt(chunk)
+    if read != size:
+        raise ValueError("Source is shorter than the declared size")
+    yield cipher.digest()
+
+
+def iter_decrypted_eax(
+    chunks: Iterable[bytes], key: bytes, encryption: int = ENCRYPTION_EAX_TAIL
+) -> Iterator[bytes]:
+    # inverse of iter_encrypted_eax, or of the ENCRYPTION_EAX streams of
+    # older videos, whose tag precedes the ciphertext; the tag is verified
+    # once the stream ends
+    tag_first = encryption == ENCRYPTION_EAX
+    head_size = 8 + EAX_NONCE_SIZE + (EAX_TAG_SIZE if tag_first else 0)
+    reader = ChunkReader(chunks)
+    try:
+        head = reader.read(head_size)
+    except ValueError:
+        raise ValueError("Encrypted stream is too short") from None
 
-def build_file_header(filename: str, data_size: int) -> bytes:
+    total_len = int.from_bytes(head[:8], "little")
+    cipher = AES.new(key, AES.MODE_EAX, nonce=head[8 : 8 + EAX_NONCE_SIZE])
+    try:
+        for piece in reader.iter_read(total_len - 8 - EAX_NONCE_SIZE - EAX_TAG_SIZE):
+            yield cipher.decrypt(piece)
+        tag = head[8 + EAX_NONCE_SIZE :] if tag_first else reader.read(EAX_TAG_SIZE)
+    except ValueError:
+        if reader.ended:
+            raise ValueError("Encrypted stream ended early") from None
+        raise
+    cipher.verify(tag)
+
+
+def eax_cipher_at(key: bytes, nonce: bytes, offset: int):
+    # EAX encrypts with CTR from OMAC(0 || nonce), so the plaintext at any
+    # offset can be decrypted on its own; nothing is authenticated this way
+    omac = CMAC.new(key, ciphermod=AES)
+    omac.update(bytes(16) + nonce)
+    counter = int.from_bytes(omac.digest(), "big") + offset // 16
+    cipher = AES.new(key, AES.MODE_CTR, nonce=b"", initial_value=counter % (1 << 128))
+    cipher.decrypt(bytes(offset % 16))
+    return cipher
+
+
+def encrypted_size(data_size: int, encryption: int) -> int:
+    # length of the stream encrypting data_size bytes
+    if encryption == ENCRYPTION_CHUNKED:
+        chunks = -(-data_size // CIPHER_CHUNK_SIZE)
+        return CHUNKED_HEAD_SIZE + data_size + chunks * GCM_TAG_SIZE
+    return 8 + EAX_NONCE_SIZE + EAX_TAG_SIZE + data_size
+
+
+def iter_encrypted_chunked(
+    header: bytes,
+    src: IO[bytes],
+    size: int,
+    key: bytes,
+    pool: SharedMemoryPool | None = None,
+) -> Iterator[bytes]:
+    # ENCRYPTION_CHUNKED for header + the next size bytes of src, every
+    # chunk is read in place after its nonce, in the buffer handed to
+    # _seal_chunks_into
+    head = ChunkedHead(
+        total_len=encrypted_size(len(header) + size, ENCRYPTION_CHUNKED),
+        chunk_size=CIPHER_CHUNK_SIZE,
+        prefix=os.urandom(CHUNKED_NONCE_PREFIX_SIZE),
+    )
+    yield head.to_bytes()
+
+    unit = GCM_NONCE_SIZE + head.chunk_size
+    task_size = unit * PARALLEL_CIPHER_CHUNKS_PER_TASK
+    window = head.chunk_size * max(1, STREAM_CHUNK_SIZE // head.chunk_size)
+    if pool is not None:
+        window = pool.window_size(task_size) // unit * head.chunk_size
+
+    def out_size(size: int) -> int:
+        return size + -(-size // unit) * (GCM_TAG_SIZE - GCM_NONCE_SIZE)
+
+    plaintext_size = len(header) + size
+    pending = memoryview(header)
+    per_window = window // head.chunk_size
+    # the same buffer for every window, sealing copies it
+    scratch = bytearray(per_window * unit)
+    for index in range(0, head.chunks, per_window):
+        count = min(per_window, head.chunks - index)
+        length = min(count * head.chunk_size, plaintext_size - index * head.chunk_size)
+        units = memoryview(scratch)[: length + count * GCM_NONCE_SIZE]
+        for i, nonce in enumerate(head.nonces(index, count)):
+            start = i * unit
+            units[start : start + GCM_NONCE_SIZE] = nonce
+            filled = start + GCM_NONCE_SIZE
+            end = min(start + unit, len(units))
+            if pending:
+                taken = min(len(pending), end - filled)
+                units[filled : filled + taken] = pending[:taken]
+                pending = pending[taken:]
+                filled += taken
+            while filled < end:
+                read = src.readinto(units[filled:end])
+                if not read:
+                    raise ValueError("Source is shorter than the declared size")
+                filled += read
+        args = (key, head.aad, head.chunk_size)
+        if pool is None:
+            sealed = bytearray(out_size(len(units)))
+            _seal_chunks_into(units, memoryview(sealed), *args)
+            yield sealed
+        else:
+            yield pool.map(_seal_chunks_into, units, task_size, out_size, *args)
+
+
+def iter_decrypted_chunked(
+    chunks: Iterable[bytes],
+    key: bytes,
+    pool: SharedMemoryPool | None = None,
+    head: ChunkedHead | None = None,
+    first_chunk: int = 0,
+) -> Iterator[bytes]:
+    # inverse of iter_encrypted_chunked, every chunk is verified before it is
+    # yielded. Given the head, chunks may start at chunk first_chunk instead,
+    # and the stream may stop early at a chunk boundary
+    reader = ChunkReader(chunks)
+    partial = head is not None
+    if head is None:
+        try:
+            head = ChunkedHead.from_bytes(reader.read(CHUNKED_HEAD_SIZE))
+        except ValueError:
+            if reader.ended:
+                raise ValueError("Encrypted stream is too short") from None
+            raise
+
+    unit = head.chunk_size + GCM_TAG_SIZE
+    task_size = (GCM_NONCE_SIZE + unit) * PARALLEL_CIPHER_CHUNKS_PER_TASK
+    window = unit * max(1, STREAM_CHUNK_SIZE // unit)
+    if pool is not None:
+        window = pool.window_size(task_size) // (GCM_NONCE_SIZE + unit) * unit
+
+    def out_size(size: int) -> int:
+        return size - -(-size // (GCM_NONCE_SIZE + unit)) * (
+            GCM_NONCE_SIZE + GCM_TAG_SIZE
+        )
+
+    remaining = head.total_len - head.chunk_offset(first_chunk)
+    index = first_chunk
+    # blocks are copied after the nonces of their chunks, into the same
+    # buffer every time
+    scratch = bytearray(window + -(-window // unit) * GCM_NONCE_SIZE)
+    for block in regroup_chunks(reader.iter_rest(), window, reuse=True):
+        block = memoryview(block)[:remaining]
+        units = _with_nonces(block, head, index, unit, scratch)
+        index += -(-len(block) // unit)
+        args = (key, head.aad, head.chunk_size)
+        if pool is None:
+            opened = bytearray(out_size(len(units)))
+            _open_chunks_into(memoryview(units), memoryview(opened), *args)
+            yield opened
+        else:
+            yield pool.map(_open_chunks_into, units, task_size, out_size, *args)
+        remaining -= len(block)
+        if remaining == 0:
+            return
+
+    if not partial:
+        raise ValueError("Encrypted stream ended early")
+
+
+def _with_nonces(
+    block: bytes, head: ChunkedHead, first: int, unit: int, out: bytearray
+) -> memoryview:
+    # every unit sized piece of block preceded by the nonce of its chunk,
+    # copied once into the start of out
+    count = -(-len(block) // unit)
+    src = memoryview(block)
+    dst = memoryview(out)[: len(block) + count * GCM_NONCE_SIZE]
+    for i, nonce in enumerate(head.nonces(first, count)):
+        start = i * (GCM_NONCE_SIZE + unit)
+        piece = src[i * unit : (i + 1) * unit]
+        dst[start : start + GCM_NONCE_SIZE] = nonce
+        dst[start + GCM_NONCE_SIZE : start + GCM_NONCE_SIZE + len(piece)] = piece
+    return dst
+
+
+def _seal_chunks_into(
+    src: memoryview, dst: memoryview, key: bytes, aad: bytes, chunk_size: int
+):
+    # slices are never kept in locals, a traceback holding one would keep
+    # the shared memory from being closed
+    unit = GCM_NONCE_SIZE + chunk_size
+    out = 0
+    for start in range(0, len(src), unit):
+        size = min(unit, len(src) - start) - GCM_NONCE_SIZE
+        nonce = bytes(src[start : start + GCM_NONCE_SIZE])
+        cipher = AES.new(key, AES.MODE_GCM, nonce=nonce, mac_len=GCM_TAG_SIZE)
+        cipher.update(aad)
+        cipher.encrypt(
+            src[start + GCM_NONCE_SIZE : start + unit], output=dst[out : out + size]
+        )
+        dst[out + size : out + size + GCM_TAG_SIZE] = cipher.digest()
+        out += size + GCM_TAG_SIZE
+
+
+def _open_chunks_into(
+    src: memoryview, dst: memoryview, key: bytes, aad: bytes, chunk_size: int
+):
+    unit = GCM_NONCE_SIZE + chunk_size + GCM_TAG_SIZE
+    out = 0
+    for start in range(0, len(src), unit):
+        end = min(start + unit, len(src))
+        size = end - start - GCM_NONCE_SIZE - GCM_TAG_SIZE
+        nonce = bytes(src[start : start + GCM_NONCE_SIZE])
+        cipher = AES.new(key, AES.MODE_GCM, nonce=nonce, mac_len=GCM_TAG_SIZE)
+        cipher.update(aad)
+        cipher.decrypt(
+            src[start + GCM_NONCE_SIZE : end - GCM_TAG_SIZE],
+            output=dst[out : out + size],
+        )
+        try:
+            cipher.verify(bytes(src[end - GCM_TAG_SIZE : end]))
+        except ValueError:
+            raise ValueError("Encrypted chunk failed authentication") from None
+        out += size
+
+
+def iter_file_chunks(f: IO[bytes], size: int = -1) -> Iterator[bytes]:
+    remaining = size
+    while remaining != 0:
+        read_size = (
+            STREAM_CHUNK_SIZE if remaining < 0 else min(STREAM_CHUNK_SIZE, remaining)
+        )
+        chunk = f.read(read_size)
+        if not chunk:
+            break
+        if remaining > 0:
+            remaining -= len(chunk)
+        yield chunk
+
+
+def regroup_chunks(
+    chunks: Iterable[bytes], size: int, reuse: bool = False
+) -> Iterator[bytes]:
+    # yields blocks of exactly size bytes, except for the last one. Blocks
+    # found whole in a chunk are views of it, the others are copied once
+    # into a new buffer; nothing yielded is written to afterwards, unless
+    # with reuse, where that buffer is the same for every block and a block
+    # is only valid until the next one is asked for. Buffers are written
+    # through memoryviews, assigning to a bytearray slice copies the
+    # assigned bytes first
+    buf = None
+    spare = None
+    filled = 0
+    for chunk in chunks:
+        view = memoryview(chunk).cast("B")
+        if buf is not None:
+            taken = min(size - filled, len(view))
+            memoryview(buf)[filled : filled + taken] = view[:taken]
+            filled += taken
+            view = view[taken:]
+            if filled < size:
+                continue
+            yield buf
+            spare = buf if reuse else None
+            buf = None
+        whole = len(view) - len(view) % size
+        for start in range(0, whole, size):
+            yield view[start : start + size]
+        if whole < len(view):
+            buf = spare if spare is not None else bytearray(size)
+            filled = len(view) - whole
+            memoryview(buf)[:filled] = view[whole:]
+    if buf is not None:
+        yield memoryview(buf)[:filled]
+
+
+def zero_padded(block: bytes, multiple: int) -> bytes:
+    # block itself when its length is a multiple of multiple, else a copy
+    # padded with zeros up to one
+    padding = -len(block) % multiple
+    if padding == 0:
+        return block
+    padded = bytearray(len(block) + padding)
+    memoryview(padded)[: len(block)] = block
+    return padded
+
+
+def compress_file(
+    filename: str, level: int, threads: int = 1
+) -> tuple[IO[bytes], int, int]:
+    # the payload of a file video, its size and compression: filename
+    # compressed into a temporary file, or filename itself when it does not
+    # compress
+    size = os.path.getsize(filename)
+    with open(filename, "rb") as src:
+        compressible = is_compressible(src, 0, size)
+    if compressible:
+        tmp = tempfile.TemporaryFile()
+        try:
+            with open(filename, "rb") as src:
+                # the content size is written in the frame
+                _, written = make_compressor(size, level, threads).copy_stream(
+                    src, tmp, size=size
+                )
+        except BaseException:
+            tmp.close()
+            raise
+        if written < size:
+            tmp.seek(0)
+            return tmp, written, COMPRESSION_ZSTD
+        tmp.close()
+    return open(filename, "rb"), size, COMPRESSION_NONE
+
+
+def compress_range(
+    filename: str, offset: int, size: int, level: int, threads: int = 1
+) -> tuple[IO[bytes], int, bytes, int]:
+    # size bytes of filename from offset compressed on their own like
+    # compress_file, with the sha256 of the uncompressed range
+    with open(filename, "rb") as src:
+        compressible = is_compressible(src, offset, size)
+    if compressible:
+        tmp = tempfile.TemporaryFile()
+        try:
+            with open(filename, "rb") as src:
+                src.seek(offset)
+                written, digest = copy_compressed(
+                    src, tmp, size, make_compressor(size, level, threads)
+                )
+        except BaseException:
+            tmp.close()
+            raise
+        if written < size:
+            tmp.seek(0)
+            return tmp, written, digest, COMPRESSION_ZSTD
+        tmp.close()
+    else:
+        digest = range_sha256(filename, offset, size)
+    src = open(filename, "rb")
+    src.seek(offset)
+    return src, size, digest, COMPRESSION_NONE
+
+
+def build_file_header(
+    filename: str,
+    data_size: int,
+    stream_format: StreamFormat = LEGACY_FORMAT,
+    kind: int = KIND_FILE,
+    compression: int = COMPRESSION_ZSTD,
+) -> bytes:
+    # compression is the one of the payload of a file, archive members have
+    # their own and manifests are not compressed
 
     name, ext = os.path.splitext(os.path.basename(filename))
     ext = ext.lstrip(".")
@@ -63,9 +596,12 @@ def build_file_header(filename: str, data_size: int) -> bytes:
         + len(ext_b).to_bytes(4, "little")
         + ext_b
         + data_size.to_bytes(8, "little")
-        + FPS.to_bytes(1, "little")
-        + W.to_bytes(2, "little")
-        + H.to_bytes(2, "little")
+        + stream_format.fps.to_bytes(1, "little")
+        + stream_format.width.to_bytes(2, "little")
+        + stream_format.height.to_bytes(2, "little")
+        + stream_format.modulation.to_bytes(1, "little")
+        + kind.to_bytes(1, "little")
+        + compression.to_bytes(1, "little")
     )
 
     total_len = len(body) + 4
@@ -105,6 +641,21 @@ def parse_file_header(buf: bytes) -> dict[str, int | str]:
     height = int.from_bytes(buf[offset : offset + 2], "little")
     offset += 2
 
+    # headers written before modulations, archives and the choice of
+    # compression were added end here
+    modulation = 0
+    if total_len > offset:
+        modulation = int.from_bytes(buf[offset : offset + 1], "little")
+        offset += 1
+    kind = KIND_FILE
+    if total_len > offset:
+        kind = int.from_bytes(buf[offset : offset + 1], "little")
+        offset += 1
+    compression = COMPRESSION_ZSTD
+    if total_len > offset:
+        compression = int.from_bytes(buf[offset : offset + 1], "little")
+        offset += 1
+
     return {
         "total_len": total_len,
         "name": name,
@@ -113,53 +664,69 @@ def parse_file_header(buf: bytes) -> dict[str, int | str]:
         "fps": fps,
         "width": width,
         "height": height,
+        "modulation": modulation,
+        "kind": kind,
+        "compression": compression,
     }
 
 
-def load_raw_video(video_path: str) -> bytes:
-
-    if not os.path.exists(video_path):
-        raise FileNotFoundError(f"Video file {video_path} not found")
-
-    command = [
-        "ffmpeg",
-        "-loglevel",
-        "error",
-        # input options
-        "-i",
-        video_path,
-        # output options
-        "-f",
-        "rawvideo",
-        "-pix_fmt",
-        "rgb24",
-        "-",
-    ]
+def frames_to_video_file(
+    frames: Iterable[bytes],
+    filename: str,
+    stream_format: StreamFormat = LEGACY_FORMAT,
+    profile: str | EncodeProfile = ENCODE_PROFILE,
+):
 
-    proc = sp.Popen(command, stdout=sp.PIPE, stderr=sp.DEVNULL)
-    if proc.stdout is None:
-        raise RuntimeError("Failed to open ffmpeg stdout pipe")
+    command = build_encode_command(filename, stream_format, profile=profile)
+    proc = sp.Popen(command, stdin=sp.PIPE)
+    if proc.stdin is None:
+        raise RuntimeError("Failed to open ffmpeg stdin pipe")
 
-    raw_video, _ = proc.communicate()
+    try:
+        for frame in frames:
+            proc.stdin.write(frame)
+    except BrokenPipeError as e:
+        print(f"Error during ffmpeg processing: {e}")
+    except BaseException:
+        proc.kill()
+        proc.wait()
+        raise
+    finally:
+        try:
+            proc.stdin.close()
+        except BrokenPipeError:
+            pass
+    proc.wait()
 
     if proc.returncode != 0:
-        raise RuntimeError("FFmpeg failed to read video")
-
-    return raw_video
-
-
-def bytes_to_video_file(data: bytes, filename: str):
-
-    if not isinstance(data, (bytes, bytearray)):
-        raise TypeError("Data must be bytes or bytearray")
+        raise RuntimeError("FFmpeg failed to write video")
 
-    array = np.frombuffer(data, dtype=np.uint8)
-    if array.size % (W * H * 3) != 0:
-        raise ValueError("Data size is not compatible with video dimensions")
+    print(f"Video saved as {filename}")
 
-    array = array.reshape((-1, H, W, 3))
 
-    command = [
+def get_encode_profile(profile: str | EncodeProfile) -> EncodeProfile:
+    if isinstance(profile, EncodeProfile):
+        return profile
+    if profile not in ENCODE_PROFILES:
+        raise ValueError(f"Unknown encode profile {profile!r}")
+    return ENCODE_PROFILES[profile]
+
+
+def build_encode_command(
+    filename: str,
+    stream_format: StreamFormat = LEGACY_FORMAT,
+    pix_fmt: str | None = None,
+    profile: str | EncodeProfile = ENCODE_PROFILE,
+) -> list[str]:
+    # frames are piped in the pixel format of the modulation unless told
+    # otherwise, gray needs a third of the bandwidth of rgb24
+    settings = get_encode_profile(profile)
+    tuning = []
+    if settings.gop is not None:
+        tuning += ["-g", str(settings.gop)]
+    if settings.tune is not None:
+        tuning += ["-tune", settings.tune]
+    return [
         "ffmpeg",
         "-y",
         "-loglevel",
@@ -168,11 +735,11 @@ def bytes_to_video_file(data: bytes, filename: str):
         "-f",
         "rawvideo",
         "-pix_fmt",
-        "rgb24",
+        pix_fmt or stream_format.pix_fmt,
         "-s",
-        f"{W}x{H}",
+        f"{stream_format.width}x{stream_format.height}",
         "-r",
-        str(FPS),
+        str(stream_format.fps),
         "-i",
         "-",
         # output options
@@ -181,163 +748,1517 @@ def bytes_to_video_file(data: bytes, filename: str):
         "-pix_fmt",
         "yuv420p",
         "-preset",
-        "veryslow",
+        settings.preset,
         "-crf",
-        "18",
+        str(settings.crf),
+        *tuning,
         "-movflags",
         "+faststart",
         filename,
     ]
 
-    proc = sp.Popen(command, stdin=sp.PIPE)
-    try:
-        proc.communicate(input=array.tobytes())
-    except Exception as e:
-        print(f"Error during ffmpeg processing: {e}")
-
-    if proc.returncode != 0:
-        raise RuntimeError("FFmpeg failed to write video")
-
-    print(f"Video saved as {filename}")
-
-
-def bytes_to_output_file(data: bytes):
-    if not isinstance(data, (bytes, bytearray)):
-        raise TypeError("Data must be bytes or bytearray")
-
-    header_len = int.from_bytes(data[0:4], "little")
-
-    header_bytes = data[0:header_len]
-    try:
-        header = parse_file_header(header_bytes)
-    except TypeError as e:
-        print(f"Error decoding header: {e}")
-        return
-
-    payload = int(header["payload"])
-    file_data = data[header_len : header_len + payload]
-    filename = f"{header['name']}.{header['ext']}"
-
-    # avoid overwriting existing files
-    if os.path.exists(filename):
-        base, ext = os.path.splitext(filename)
-        count = 1
-        while True:
-            new_filename = f"{base}_{count}{ext}"
-            if not os.path.exists(new_filename):
-                filename = new_filename
-                break
-            count += 1
-
-    # decompression
-    file_data = zstd_decompressor.decompress(file_data)
-
-    with open(filename, "wb") as f:
-        f.write(file_data)
-
-
-def expand_bits_to_frames(data: bytes) -> bytes:
-    bits = np.unpackbits(np.frombuffer(data, dtype=np.uint8))
-
-    # padding bits to make complete frames
-    total_bits = len(bits)
-    remainder = total_bits % BITS_PER_FRAME
-    if remainder != 0:
-        padding = BITS_PER_FRAME - remainder
-        bits = np.concatenate((bits, np.zeros(padding, dtype=np.uint8)))
 
-    # if we don't have enough bits for at least FPS frames, pad more
-    total_bits = len(bits)
-    total_frames = total_bits // BITS_PER_FRAME
-    if total_frames < FPS:
-        needed_frames = FPS - total_frames
-        padding_bits = needed_frames * BITS_PER_FRAME
-        bits = np.concatenate((bits, np.zeros(padding_bits, dtype=np.uint8)))
+def read_stream_format(video_path: str) -> StreamFormat | None:
+    # None for videos without a preamble frame
 
-    bits_array = bits.reshape(-1, H_BLOCKS, W_BLOCKS, 1)
+    if not os.path.exists(video_path):
+        raise FileNotFoundError(f"Video file {video_path} not found")
 
-    expanded = bits_array.repeat(BLOCK_SIZE, axis=1).repeat(BLOCK_SIZE, axis=2)
+    command = [
+        "ffmpeg",
+        "-loglevel",
+        "error",
+        # input options
+        "-i",
+        video_path,
+        # output options, the first frame averaged down to the preamble cells
+        "-frames:v",
+        "1",
+        "-vf",
+        f"scale={PREAMBLE_GRID_W}:{PREAMBLE_GRID_H}:flags=area",
+        "-f",
+        "rawvideo",
+        "-pix_fmt",
+        "gray",
+        "-",
+    ]
 
-    expanded = expanded * 255
+    proc = sp.run(command, stdout=sp.PIPE, stderr=sp.DEVNULL)
+    if proc.returncode != 0:
+        raise RuntimeError("FFmpeg failed to read video")
 
-    final_array = expanded.repeat(3, axis=3)
+    return parse_preamble_grid(proc.stdout)
 
-    return final_array.tobytes()
 
+def iter_raw_frames(
+    video_path: str,
+    stream_format: StreamFormat = LEGACY_FORMAT,
+    scaled: bool = False,
+    start: int = 0,
+    count: int | None = None,
+) -> Iterator[bytes]:
+    # scaled frames are area averaged to one pixel per block by ffmpeg, in
+    # the pixel format of the modulation, see collapse_block_grid; start and
+    # count select frames by index, ffmpeg seeks to start instead of
+    # decoding everything before it
 
-def collapse_frames_to_bits(data: bytes) -> bytes:
+    if not os.path.exists(video_path):
+        raise FileNotFoundError(f"Video file {video_path} not found")
 
-    array = np.frombuffer(data, dtype=np.uint8)
-    array = array.reshape(-1, H, W, 3)
+    fmt = stream_format
+    # a video re-timed to a higher frame rate only repeats frames, they are
+    # dropped before being piped; see iter_synced_frames for the rest
+    retime = f"fps={fmt.fps}"
+    if scaled:
+        # blocks that do not cover the whole frame leave a black border out
+        width, height = fmt.w_blocks * fmt.block_size, fmt.h_blocks * fmt.block_size
+        scale = f"scale={fmt.w_blocks}:{fmt.h_blocks}:flags=area"
+        filters = f"{retime},crop={width}:{height}:0:0,{scale}"
+        output = ["-vf", filters, "-pix_fmt", fmt.pix_fmt]
+        frame_size = fmt.grid_size
+    else:
+        output = ["-vf", retime, "-pix_fmt", "rgb24"]
+        frame_size = fmt.frame_size
+
+    seek = []
+    if start > 0:
+        # half a frame early, the first frame at or after the time is kept
+        seek = ["-ss", f"{(start - 0.5) / fmt.fps:.6f}"]
+    if count is not None:
+        output += ["-frames:v", str(count)]
 
-    gray = array.mean(axis=3)
+    command = [
+        "ffmpeg",
+        "-loglevel",
+        "error",
+        # input options
+        *seek,
+        "-i",
+        video_path,
+        # output options
+        "-f",
+        "rawvideo",
+        *output,
+        "-",
+    ]
 
-    blocks = gray.reshape(-1, H_BLOCKS, BLOCK_SIZE, W_BLOCKS, BLOCK_SIZE)
+    proc = sp.Popen(command, stdout=sp.PIPE, stderr=sp.DEVNULL)
+    if proc.stdout is None:
+        raise RuntimeError("Failed to open ffmpeg stdout pipe")
 
-    block_means = blocks.mean(axis=(2, 4))
+    try:
+        while True:
+            frame = proc.stdout.read(frame_size)
+            if len(frame) < frame_size:
+                break
+            yield frame
+        proc.wait()
+        if proc.returncode != 0:
+            raise RuntimeError("FFmpeg failed to read video")
+    finally:
+        # the consumer may stop early once the data stream is complete
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+        proc.stdout.close()
+
+
+def available_filename(filename: str) -> str:
+    if not os.path.exists(filename):
+        return filename
+
+    base, ext = os.path.splitext(filename)
+    count = 1
+    while True:
+        new_filename = f"{base}_{count}{ext}"
+        if not os.path.exists(new_filename):
+            return new_filename
+        count += 1
+
+
+class ChunkReader:
+    # reads exact amounts out of a stream of chunks of any size
+
+    def __init__(self, chunks: Iterable[bytes]):
+        self.it = iter(chunks)
+        self.pending = memoryview(b"")
+        # set once a read runs past the end of the stream
+        self.ended = False
+
+    def iter_read(self, size: int) -> Iterator[bytes]:
+        # yields views of the chunks adding up to size bytes
+        while size > 0:
+            if not self.pending:
+                self.pending = memoryview(next(self.it, b"")).cast("B")
+                if not self.pending:
+                    self.ended = True
+                    raise ValueError("Data stream ended before the end of the file")
+            piece = self.pending[:size]
+            self.pending = self.pending[len(piece) :]
+            size -= len(piece)
+            yield piece
+
+    def read(self, size: int) -> bytes:
+        return b"".join(self.iter_read(size))
+
+    def skip(self, size: int):
+        for _ in self.iter_read(size):
+            pass
+
+    def drain(self):
+        # consumes the rest of the stream, so that the decryption tag gets
+        # verified before the output is kept
+        for _ in self.it:
+            pass
+
+    def iter_rest(self) -> Iterator[bytes]:
+        # the rest of the stream as it comes, nothing is copied
+        if self.pending:
+            yield self.pending
+        yield from self.it
+
+
+def write_output_stream(
+    chunks: Iterable[bytes],
+    members: Iterable[str] | None = None,
+    dest_dir: str = ".",
+) -> tuple[str, int]:
+    # returns the restored file, or the folder of an archive where only the
+    # given members are written when members is not None, or the manifest
+    # of a split file; with the kind of the header. Outputs go to dest_dir
+    reader = ChunkReader(chunks)
+    try:
+        head = reader.read(4)
+        header_len = int.from_bytes(head, "little")
+        header_bytes = head + reader.read(max(header_len - 4, 0))
+    except ValueError:
+        if not reader.ended:
+            raise
+        raise ValueError("Data stream ended inside the file header")
+    header = parse_file_header(header_bytes)
+
+    if header["kind"] == KIND_ARCHIVE:
+        archive = write_archive_stream(reader, header, members, dest_dir)
+        return archive, KIND_ARCHIVE
 
-    bits = (block_means > 127).astype(np.uint8)
+    payload = int(header["payload"])
+    filename = os.path.join(dest_dir, f"{header['name']}.{header['ext']}")
+    if header["kind"] == KIND_MANIFEST:
+        # kept as is, the segments are fetched by assemble_segments
+        manifest = reader.read(payload)
+        parse_manifest(manifest)
+        reader.drain()
+        filename = available_filename(filename + MANIFEST_SUFFIX)
+        with open(filename, "wb") as f:
+            f.write(manifest)
+        return filename, KIND_MANIFEST
+    filename = available_filename(filename)
+
+    # written to a temporary file and renamed once the stream is authenticated
+    fd, tmp_path = tempfile.mkstemp(prefix=".", suffix=".part", dir=dest_dir)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            # decompression
+            for chunk in iter_decompressed(
+                reader.iter_read(payload), int(header["compression"])
+            ):
+                f.write(chunk)
+            reader.drain()
+        os.replace(tmp_path, filename)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+    return filename, KIND_FILE
+
+
+def write_archive_stream(
+    reader: ChunkReader,
+    header: dict[str, int | str],
+    members: Iterable[str] | None = None,
+    dest_dir: str = ".",
+) -> str:
+    head = reader.read(4)
+    toc_len = int.from_bytes(head, "little")
+    toc = parse_toc(head + reader.read(toc_len - 4))
+    names = {m.name for m in toc.members}
+    wanted = None if members is None else set(members)
+    if wanted is not None and not wanted <= names:
+        raise ValueError(f"Archive has no member {sorted(wanted - names)}")
+
+    dirname = available_filename(os.path.join(dest_dir, str(header["name"])))
+    payload = int(header["payload"]) - toc_len
+
+    # extracted next to the destination and renamed once authenticated
+    tmp_dir = tempfile.mkdtemp(prefix=".", suffix=".part", dir=dest_dir)
+    try:
+        dictionary = reader.read(toc.dictionary_size)
+        position = toc.dictionary_size
+        for member in sorted(toc.members, key=lambda m: m.offset):
+            reader.skip(member.offset - position)
+            position = member.offset + member.size
+            if wanted is not None and member.name not in wanted:
+                reader.skip(member.size)
+                continue
+            path = member_path(tmp_dir, member.name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            extract_member(reader.iter_read(member.size), member, path, dictionary)
+        reader.skip(payload - position)
+        reader.drain()
+        os.replace(tmp_dir, dirname)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    return dirname
+
+
+def extract_member(
+    chunks: Iterable[bytes],
+    member: ArchiveMember,
+    path: str,
+    dictionary: bytes = b"",
+):
+    # decompresses one member into path and checks it against the table
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, "wb") as f:
+        for data in iter_decompressed(chunks, member.compression, dictionary):
+            digest.update(data)
+            size += len(data)
+            f.write(data)
+    if size != member.original_size or digest.digest() != member.sha256:
+        raise ValueError(f"Archive member {member.name} is corrupted")
+
+
+def render_frame_into(
+    data: bytes, out: np.ndarray, stream_format: StreamFormat = LEGACY_FORMAT
+):
+    # out is a flat buffer of stream_format.render_size bytes, overwritten
+    # without any intermediate frame sized array
+    fmt = stream_format
+    planes = out.reshape(fmt.render_planes, fmt.height, fmt.width)
+    fmt.symbols.render_into(data, planes, fmt.h_blocks, fmt.w_blocks, fmt.block_size)
+
+
+def render_frame(data: bytes, stream_format: StreamFormat = LEGACY_FORMAT) -> bytes:
+    frame = np.empty(stream_format.render_size, dtype=np.uint8)
+    render_frame_into(data, frame, stream_format)
+    return frame.tobytes()
+
+
+def iter_video_frames(
+    chunks: Iterable[bytes],
+    stream_format: StreamFormat = LEGACY_FORMAT,
+    pool: SharedMemoryPool | None = None,
+) -> Iterator[bytes]:
+    frame_count = 0
+    if stream_format.version > 0:
+        yield render_preamble_frame(stream_format)
+        frame_count += 1
+
+    frame_bytes = stream_format.frame_bytes
+    frame_size = stream_format.render_size
+    if pool is None:
+        # a single buffer is reused, each frame is only valid until the
+        # next one is requested
+        frame = np.empty(frame_size, dtype=np.uint8)
+        for block in regroup_chunks(chunks, frame_bytes):
+            render_frame_into(block, frame, stream_format)
+            yield memoryview(frame)
+            frame_count += 1
+    else:
+        task_size = frame_bytes * PARALLEL_FRAMES_PER_TASK
+        for block in regroup_chunks(chunks, pool.window_size(task_size)):
+            # the last frame is zero padded, as render_frame does
+            block = zero_padded(block, frame_bytes)
+            frames = pool.map(
+                _render_frames_into,
+                block,
+                task_size,
+                lambda size: size // frame_bytes * frame_size,
+                stream_format,
+            )
+            view = memoryview(frames)
+            for start in range(0, len(frames), frame_size):
+                yield view[start : start + frame_size]
+                frame_count += 1
+
+    # videos are at least one second long
+    if frame_count < stream_format.fps:
+        blank = render_frame(b"", stream_format)
+        for _ in range(stream_format.fps - frame_count):
+            yield blank
+
+
+def collapse_frame_to_bits(
+    frame: bytes, stream_format: StreamFormat = LEGACY_FORMAT, soft: bool = False
+) -> bytes:
+    # with soft, frame_bytes of data then the margin of each, see SOFT_DECODE
+    fmt = stream_format
+    array = np.frombuffer(frame, dtype=np.uint8).reshape(fmt.height, fmt.width, 3)
+    array = array[: fmt.h_blocks * fmt.block_size, : fmt.w_blocks * fmt.block_size]
+    return fmt.symbols.demodulate(array, fmt.block_size, soft)
+
+
+def collapse_block_grid(
+    frame: bytes, stream_format: StreamFormat = LEGACY_FORMAT, soft: bool = False
+) -> bytes:
+    fmt = stream_format
+    grid = np.frombuffer(frame, dtype=np.uint8)
+    grid = grid.reshape(fmt.render_planes, fmt.h_blocks, fmt.w_blocks)
+    return fmt.symbols.demodulate_grid(grid, soft)
+
+
+def iter_collapsed_frames(
+    frames: Iterable[bytes],
+    stream_format: StreamFormat = LEGACY_FORMAT,
+    pool: SharedMemoryPool | None = None,
+    scaled: bool = False,
+    soft: bool = False,
+) -> Iterator[bytes]:
+    if scaled:
+        # only a threshold per block is left, not worth a round trip to the pool
+        for frame in frames:
+            yield collapse_block_grid(frame, stream_format, soft)
+        return
 
-    bytes_data = np.packbits(bits.flatten())
+    if pool is None:
+        for frame in frames:
+            yield collapse_frame_to_bits(frame, stream_format, soft)
+        return
 
-    return bytes_data.tobytes()
+    batch_size = pool.window_size(PARALLEL_FRAMES_PER_TASK)
+    batch: list[bytes] = []
+    for frame in frames:
+        batch.append(frame)
+        if len(batch) < batch_size:
+            continue
+        yield _collapse_batch(pool, batch, stream_format, soft)
+        batch.clear()
+    if batch:
+        yield _collapse_batch(pool, batch, stream_format, soft)
+
+
+def _collapse_batch(
+    pool: SharedMemoryPool,
+    batch: list[bytes],
+    stream_format: StreamFormat,
+    soft: bool,
+) -> bytes:
+    collapsed_size = stream_format.frame_bytes * (2 if soft else 1)
+    frame_size = stream_format.frame_size
+    return pool.map(
+        _collapse_frames_into,
+        b"".join(batch),
+        frame_size * PARALLEL_FRAMES_PER_TASK,
+        lambda size: size // frame_size * collapsed_size,
+        stream_format,
+        soft,
+    )
 
 
-def encode_reed_solomon(rsc: reedsolo.RSCodec, data: bytes) -> bytes:
-    encoded_data = rsc.encode(data)
-    encoded_data = bytes(encoded_data)
+def _render_frames_into(src: memoryview, dst: memoryview, stream_format: StreamFormat):
+    frame_bytes = stream_format.frame_bytes
+    frames = np.frombuffer(dst, dtype=np.uint8).reshape(-1, stream_format.render_size)
+    for i in range(len(src) // frame_bytes):
+        block = src[i * frame_bytes : (i + 1) * frame_bytes]
+        render_frame_into(block, frames[i], stream_format)
 
-    total_bytes = len(encoded_data)
-    encoded_data = total_bytes.to_bytes(8, "little") + encoded_data
-    total_bytes += 8
 
-    remainder = total_bytes % BYTES_PER_FRAME
-    if remainder != 0:
-        padding = BYTES_PER_FRAME - remainder
-        encoded_data += bytes([0] * padding)
+def _collapse_frames_into(
+    src: memoryview, dst: memoryview, stream_format: StreamFormat, soft: bool
+):
+    collapsed_size = stream_format.frame_bytes * (2 if soft else 1)
+    frame_size = stream_format.frame_size
+    for i in range(len(src) // frame_size):
+        frame = src[i * frame_size : (i + 1) * frame_size]
+        dst[i * collapsed_size : (i + 1) * collapsed_size] = collapse_frame_to_bits(
+            frame, stream_format, soft
+        )
+
+
+def detect_modulation(
+    frame: bytes, rsc: RSCodec, stream_format: StreamFormat = LEGACY_FORMAT
+) -> StreamFormat:
+    # videos without a preamble only record the modulation in the file
+    # header, so every scheme is tried on the first codeword
+    for modulation in MODULATIONS:
+        candidate = stream_format._replace(modulation=modulation)
+        data = collapse_frame_to_bits(frame, candidate)
+        total_bytes = int.from_bytes(data[:8], "little")
+        codeword = data[8 : 8 + min(total_bytes, rsc.nsize)]
+        if len(codeword) <= rsc.nsym:
+            continue
+        try:
+            rsc.decode(codeword)
+        except Exception:
+            continue
+        return candidate
+    raise ValueError("Could not detect the modulation of the video")
+
+
+def choose_stream_format(
+    data_size: int, rsc: RSCodec, modulation: int | str = MODULATION
+) -> StreamFormat:
+    standard = StreamFormat(
+        width=W,
+        height=H,
+        block_size=BLOCK_SIZE,
+        fps=FPS,
+        modulation=get_modulation(modulation).id,
+        rs_nsym=rsc.nsym,
+        rs_nsize=rsc.nsize,
+        layout=LAYOUT_FRAME_ALIGNED,
+        encryption=ENCRYPTION_CHUNKED,
+    )
+    robust = standard._replace(
+        block_size=ROBUST_BLOCK_SIZE,
+        modulation=0,
+        rs_nsym=ROBUST_RS_ERROR_CORRECTION_BYTES,
+    )
 
-    return encoded_data
+    # the video is padded to fps frames anyway, one of them is the preamble
+    chosen = standard
+    if 8 + data_size <= robust.frame_message_bytes * (robust.fps - 1):
+        chosen = robust
+    # the last group is padded to whole frames, short streams use fewer
+    frames = -(-(8 + data_size) // chosen.frame_message_bytes)
+    return chosen._replace(interleave=min(INTERLEAVE_FRAMES, frames))
+
+
+def iter_reed_solomon_encoded(
+    rsc: RSCodec,
+    chunks: Iterable[bytes],
+    data_len: int,
+    pool: SharedMemoryPool | None = None,
+) -> Iterator[bytes]:
+    # the length of the codewords, then the codewords produced one window at
+    # a time
+    message_size = rsc.nsize - rsc.nsym
+    codewords = -(-data_len // message_size)
+    total_bytes = data_len + codewords * rsc.nsym
+    # the stream is not padded, the last frame is filled with zeros
+    yield total_bytes.to_bytes(8, "little")
+
+    # windows are multiples of the message size so codewords match rsc.encode(data)
+    # blocks are copied by the encoder, their buffer is reused
+    window = message_size * max(1, STREAM_CHUNK_SIZE // message_size)
+    if pool is None:
+        for block in regroup_chunks(chunks, window, reuse=True):
+            yield rsc.encode(block)
+    else:
+        task_size = message_size * PARALLEL_CODEWORDS_PER_TASK
+        window = pool.window_size(task_size)
+        for block in regroup_chunks(chunks, window, reuse=True):
+            yield pool.map(
+                _encode_reed_solomon_into,
+                block,
+                task_size,
+                lambda size: size + -(-size // message_size) * rsc.nsym,
+                rsc.nsym,
+                rsc.nsize,
+            )
+
+
+def iter_reed_solomon_decoded(
+    rsc: RSCodec, chunks: Iterable[bytes], pool: SharedMemoryPool | None = None
+) -> Iterator[bytes]:
+    # inverse of iter_reed_solomon_encoded, trailing padding is never read
+    reader = ChunkReader(chunks)
+    try:
+        remaining = int.from_bytes(reader.read(8), "little")
+    except ValueError:
+        raise ValueError("Encoded stream is too short") from None
+    window = rsc.nsize * max(1, STREAM_CHUNK_SIZE // rsc.nsize)
+    task_size = rsc.nsize * PARALLEL_CODEWORDS_PER_TASK
+    if pool is not None:
+        window = pool.window_size(task_size)
+
+    for block in regroup_chunks(reader.iter_rest(), window):
+        block = memoryview(block)[:remaining]
+        if pool is None:
+            decoded_data, _, _ = rsc.decode(block)
+            yield decoded_data
+        else:
+            yield pool.map(
+                _decode_reed_solomon_into,
+                block,
+                task_size,
+                lambda size: size - -(-size // rsc.nsize) * rsc.nsym,
+                rsc.nsym,
+                rsc.nsize,
+            )
+        remaining -= len(block)
+        if remaining == 0:
+            return
+
+    raise ValueError("Encoded stream ended early")
+
+
+def iter_frame_aligned_encoded(
+    rsc: RSCodec,
+    chunks: Iterable[bytes],
+    data_len: int,
+    stream_format: StreamFormat,
+    pool: SharedMemoryPool | None = None,
+) -> Iterator[bytes]:
+    # LAYOUT_FRAME_ALIGNED, whole frames of codewords for the stream and its
+    # 8 byte length, the last group of frames is zero padded before being
+    # encoded so every frame holds the same number of full codewords
+    fmt = stream_format
+    message_bytes = fmt.frame_message_bytes
+    group_bytes = message_bytes * fmt.group_frames
+    span = fmt.codewords_per_frame * rsc.nsize
+    if message_bytes == 0:
+        raise ValueError("Frames are too small for a single codeword")
+
+    stream = itertools.chain([(8 + data_len).to_bytes(8, "little")], chunks)
+    task_size = message_bytes * PARALLEL_FRAMES_PER_TASK
+    if pool is None:
+        window = group_bytes * max(1, STREAM_CHUNK_SIZE // group_bytes)
+    else:
+        window = -(-pool.window_size(task_size) // group_bytes) * group_bytes
+    frame_index = 0
+    # only the frames are new for every window, the block, its codewords and
+    # their interleaved copy are written over for the next one
+    interleaved = np.empty((window // message_bytes, span), np.uint8)
+    if pool is None:
+        encoded_buffer = memoryview(np.empty(interleaved.size, np.uint8))
+    for block in regroup_chunks(stream, window, reuse=True):
+        block = zero_padded(block, group_bytes)
+        if pool is None:
+            size = len(block) // message_bytes * span
+            encoded = rsc.encode(block, out=encoded_buffer[:size])
+        else:
+            encoded = pool.map(
+                _encode_reed_solomon_into,
+                block,
+                task_size,
+                lambda size: size // message_bytes * span,
+                rsc.nsym,
+                rsc.nsize,
+            )
+        frames = np.zeros((len(block) // message_bytes, fmt.frame_bytes), np.uint8)
+        codewords = np.frombuffer(encoded, np.uint8).reshape(-1, span)
+        frames[:, :span] = interleave_codewords(
+            codewords, fmt, interleaved[: len(frames)]
+        )
+        if fmt.sync_bytes:
+            markers = build_sync_markers(frame_index, len(frames))
+            frames[:, fmt.frame_bytes - fmt.sync_bytes :] = markers
+        frame_index += len(frames)
+        yield frames.reshape(-1).data
+
+
+def iter_frame_aligned_decoded(
+    rsc: RSCodec,
+    chunks: Iterable[bytes],
+    stream_format: StreamFormat,
+    pool: SharedMemoryPool | None = None,
+    first_frame: int = 0,
+    total_bytes: int | None = None,
+    soft: bool = False,
+    report: JobReport | None = None,
+) -> Iterator[bytes]:
+    # inverse of iter_frame_aligned_encoded for the data frames from
+    # first_frame on, yielding the stream from the first byte they hold;
+    # chunks start at the first frame of its group. total_bytes, the stream
+    # length with its prefix, is read from the first frame unless given.
+    # Soft frames are collapsed with soft, their codewords are decoded with
+    # erasures
+    fmt = stream_format
+    message_bytes = fmt.frame_message_bytes
+    group_frames = fmt.group_frames
+    span = fmt.codewords_per_frame * rsc.nsize
+    # codewords, then their margins with soft
+    row_size = span * (2 if soft else 1)
+    collapsed_size = fmt.frame_bytes * (2 if soft else 1)
+    task_size = row_size * PARALLEL_FRAMES_PER_TASK
+    frames_per_window = max(1, STREAM_CHUNK_SIZE // collapsed_size)
+    if pool is not None:
+        frames_per_window = pool.window_size(PARALLEL_FRAMES_PER_TASK)
+    frames_per_window = -(-frames_per_window // group_frames) * group_frames
+
+    first_byte = first_frame * message_bytes
+    position = (first_frame - first_frame % group_frames) * message_bytes
+
+    def stream_frames(total_bytes: int) -> int:
+        # whole groups of data frames
+        frames = -(-total_bytes // message_bytes)
+        return -(-frames // group_frames) * group_frames
+
+    # until the length is read, the first window bounds the markers
+    end_frame = position // message_bytes + frames_per_window
+    if total_bytes is not None:
+        end_frame = stream_frames(total_bytes)
+    if fmt.sync_bytes:
+        chunks = iter_synced_frames(
+            chunks,
+            fmt,
+            position // message_bytes,
+            soft,
+            report,
+            lambda: end_frame,
+        )
+    for block in regroup_chunks(chunks, collapsed_size * frames_per_window):
+        frames = np.frombuffer(block, np.uint8).reshape(-1, collapsed_size)
+        # data ends with a whole group, blank frames may follow it
+        frames = frames[: len(frames) - len(frames) % group_frames]
+        codewords = deinterleave_codewords(frames[:, :span], fmt)
+        if soft:
+            margins = frames[:, fmt.frame_bytes : fmt.frame_bytes + span]
+            margins = deinterleave_codewords(margins, fmt)
+            rows = np.concatenate((codewords, margins), axis=1).reshape(-1).data
+        else:
+            rows = np.ascontiguousarray(codewords).reshape(-1).data
+        if pool is None:
+            decoded = _decode_rows(rsc, rows, span, soft)
+        else:
+            decoded = pool.map(
+                _decode_rows_into,
+                rows,
+                task_size,
+                lambda size: size // row_size * message_bytes,
+                rsc.nsym,
+                rsc.nsize,
+                span,
+                soft,
+            )
+        if total_bytes is None:
+            if position != 0:
+                raise ValueError("The stream length is needed to start mid stream")
+            total_bytes = int.from_bytes(decoded[:8], "little")
+            end_frame = stream_frames(total_bytes)
+
+        # the length prefix, the frames of the group before first_frame and
+        # the padding of the last group are dropped
+        start = max(8 - position, first_byte - position, 0)
+        end = min(len(decoded), total_bytes - position)
+        if start < end:
+            yield memoryview(decoded)[start:end]
+        position += len(decoded)
+        if position >= total_bytes:
+            return
+
+    raise ValueError("Encoded stream ended early")
+
+
+def iter_synced_frames(
+    chunks: Iterable[bytes],
+    stream_format: StreamFormat,
+    first_frame: int,
+    soft: bool = False,
+    report: JobReport | None = None,
+    frame_end: Callable[[], int] | None = None,
+) -> Iterator[bytes]:
+    # collapsed data frames from first_frame on, each once and in order by
+    # their sync markers: repeats are skipped and missing frames are given
+    # as blank ones, all erasures with soft. A frame whose marker cannot be
+    # read is a repeat when most of its bytes match the frame before it;
+    # such frames after the last marker are the blank padding of the video.
+    # A marker at or past frame_end(), the data frames known so far, was
+    # miscorrected and is not read. Repeated and missing frames are counted
+    # in report
+    fmt = stream_format
+    frame_bytes = fmt.frame_bytes
+    collapsed_size = frame_bytes * (2 if soft else 1)
+    marker_start = frame_bytes - fmt.sync_bytes
+    expected = first_frame
+    previous: np.ndarray | None = None
+    repeats = 0
+    # markerless repeats, counted once a marked frame follows them
+    unconfirmed = 0
+    try:
+        for chunk in chunks:
+            chunk = memoryview(chunk)
+            for start in range(0, len(chunk), collapsed_size):
+                frame = chunk[start : start + collapsed_size]
+                data = np.frombuffer(frame, np.uint8, frame_bytes)
+                index = read_sync_marker(bytes(frame[marker_start:frame_bytes]))
+                if index is not None and frame_end is not None:
+                    if index >= frame_end():
+                        index = None
+                if index is None:
+                    if previous is not None:
+                        if np.count_nonzero(data == previous) * 2 > frame_bytes:
+                            unconfirmed += 1
+                            continue
+                    index = expected
+                else:
+                    repeats += unconfirmed
+                    unconfirmed = 0
+                if index < expected:
+                    repeats += 1
+                    continue
+                if index > expected:
+                    if report is not None:
+                        report.count("missing_frames", 0, index - expected)
+                    for _ in range(index - expected):
+                        yield bytes(collapsed_size)
+                yield frame
+                previous = data
+                expected = index + 1
+    finally:
+        if repeats and report is not None:
+            report.count("repeated_frames", 0, repeats)
+
+
+@functools.lru_cache(maxsize=None)
+def _worker_codec(nsym: int, nsize: int) -> RSCodec:
+    # built once per pool process
+    return RSCodec(nsym, nsize)
+
+
+def _encode_reed_solomon_into(src: memoryview, dst: memoryview, nsym: int, nsize: int):
+    _worker_codec(nsym, nsize).encode(src, out=dst)
+
+
+def _decode_reed_solomon_into(src: memoryview, dst: memoryview, nsym: int, nsize: int):
+    decoded_data, _, _ = _worker_codec(nsym, nsize).decode(src)
+    dst[:] = decoded_data
+
+
+def erasure_positions(margins: np.ndarray, nsize: int, nsym: int) -> np.ndarray:
+    # margins of whole codewords, in stream order; the positions of the
+    # least reliable bytes of each under ERASURE_MARGIN. At most half the
+    # parity is spent on erasures, the rest corrects the errors they miss
+    # and tells wrong erasures from right ones: with nsym erasures any
+    # codeword decodes to something
+    rows = margins.reshape(-1, nsize)
+    limit = max(nsym // 2, 1)
+    lowest = np.argpartition(rows, limit - 1, axis=1)[:, :limit]
+    weak = np.take_along_axis(rows, lowest, axis=1) < ERASURE_MARGIN
+    offsets = np.arange(len(rows))[:, None] * nsize
+    return (offsets + lowest)[weak]
+
+
+def _decode_rows(rsc: RSCodec, rows: bytes, span: int, soft: bool) -> bytearray:
+    # rows of span codeword bytes, each followed by their margins with soft
+    if not soft:
+        decoded, _, _ = rsc.decode(rows)
+        return decoded
+    # copied, a view would keep the shared memory of a pool task open
+    rows_array = np.frombuffer(bytes(rows), np.uint8).reshape(-1, 2 * span)
+    weak_pos = erasure_positions(rows_array[:, span:], rsc.nsize, rsc.nsym)
+    decoded, _, _ = rsc.decode(
+        rows_array[:, :span].tobytes(), weak_pos=weak_pos.tolist()
+    )
+    return decoded
 
 
-def decode_reed_solomon(rsc: reedsolo.RSCodec, data: bytes) -> bytes:
-    total_bytes = int.from_bytes(data[:8], "little")
-    data = data[8 : 8 + total_bytes]
-    decoded_data, _, _ = rsc.decode(data)
-    return bytes(decoded_data)
+def _decode_rows_into(
+    src: memoryview,
+    dst: memoryview,
+    nsym: int,
+    nsize: int,
+    span: int,
+    soft: bool,
+):
+    dst[:] = _decode_rows(_worker_codec(nsym, nsize), src, span, soft)
 
 
 def convert_file_to_video(
-    filename: str, out_filename: str, key: bytes, rsc: reedsolo.RSCodec
-):
-    with open(filename, "rb") as f:
-        data = f.read()
-
-    # compression
-    data = zstd_compressor.compress(data)
-
-    header = build_file_header(filename, len(data))
-    data = header + data
-    # encryption
-    data = encrypt_bytes_eax(data, key)
-    # encode with Reed-Solomon
-    encoded_data = encode_reed_solomon(rsc, data)
-    # interpolation to video frames
-    video_data = expand_bits_to_frames(encoded_data)
-    # saving to video file
-    bytes_to_video_file(video_data, filename=out_filename)
+    filename: str,
+    out_filename: str,
+    key: bytes,
+    rsc: RSCodec,
+    workers: int = 1,
+    modulation: int | str = MODULATION,
+    stream_format: StreamFormat | None = None,
+    profile: str | EncodeProfile = ENCODE_PROFILE,
+    report: JobReport | None = None,
+    segment_size: int | None = None,
+    content_index: ContentIndex | None = None,
+    chunking: bool = False,
+) -> list[str]:
+    # returns the videos written, in upload order; given segment_size, larger
+    # files are split into segment videos followed by a manifest video.
+    # Given content_index, a file uploaded before only gets a manifest video
+    # referencing it, see convert_file_to_segments
+    size = os.path.getsize(filename)
+    split = segment_size is not None and size > segment_size
+    digest = None
+    if content_index is not None and not split:
+        with measure(report, "hash", size):
+            digest = range_sha256(filename)
+        split = lookup_content(content_index, digest) is not None
+    if split:
+        return convert_file_to_segments(
+            filename,
+            out_filename,
+            key,
+            rsc,
+            segment_size or size,
+            workers,
+            modulation,
+            stream_format,
+            profile,
+            report,
+            content_index,
+            chunking,
+        )
+    # compression, spooled to disk so the header can carry the compressed size
+    level = get_encode_profile(profile).zstd_level
+    with measure(report, "compress", size):
+        compressed, compressed_size, compression = compress_file(
+            filename, level, workers
+        )
+    try:
+        _payload_to_video(
+            compressed,
+            compressed_size,
+            filename,
+            KIND_FILE,
+            compression,
+            b"",
+            out_filename,
+            key,
+            rsc,
+            workers,
+            modulation,
+            stream_format,
+            profile,
+            report,
+        )
+    finally:
+        compressed.close()
+    if content_index is not None and digest is not None:
+        record_content(content_index, digest, segment_title(out_filename), size)
     print(f"Generated video file: {out_filename}")
-
-
-def extract_file_from_video(video_path: str, key: bytes, rsc: reedsolo.RSCodec):
-    # reading video
-    raw_video = load_raw_video(video_path)
-    # de-interpolation to bit stream
-    recovered_stream = collapse_frames_to_bits(raw_video)
-    # decode with Reed-Solomon
-    decoded_data = decode_reed_solomon(rsc, recovered_stream)
-    # decryption
-    decrypted_data = decrypt_bytes_eax(decoded_data, key)
-    # saving restored file
-    bytes_to_output_file(decrypted_data)
+    return [out_filename]
+
+
+def convert_file_to_segments(
+    filename: str,
+    out_filename: str,
+    key: bytes,
+    rsc: RSCodec,
+    segment_size: int = SEGMENT_SIZE,
+    workers: int = 1,
+    modulation: int | str = MODULATION,
+    stream_format: StreamFormat | None = None,
+    profile: str | EncodeProfile = ENCODE_PROFILE,
+    report: JobReport | None = None,
+    content_index: ContentIndex | None = None,
+    chunking: bool = False,
+) -> list[str]:
+    # every segment is a file video of its own, encoded in separate processes
+    # when workers > 1, then the manifest listing them is written to
+    # out_filename; it comes last so that it is only uploaded once every
+    # segment is. Segments found in content_index are referenced instead of
+    # encoded again, and the new ones are recorded in it; chunking cuts
+    # segments at content defined boundaries so that they survive edits
+    size = os.path.getsize(filename)
+    if chunking:
+        with measure(report, "hash", size):
+            ranges = content_defined_chunks(filename, segment_size)
+    elif content_index is not None:
+        with measure(report, "hash", size):
+            ranges = [
+                (offset, length, range_sha256(filename, offset, length))
+                for offset, length in segment_ranges(size, segment_size)
+            ]
+    else:
+        ranges = [(o, n, None) for o, n in segment_ranges(size, segment_size)]
+
+    # the title of every segment, None for the ones to encode
+    titles: list[str | None] = [None] * len(ranges)
+    if content_index is not None:
+        for i, (_, _, digest) in enumerate(ranges):
+            titles[i] = lookup_content(content_index, digest)
+    new = [i for i, title in enumerate(titles) if title is None]
+    paths = {i: segment_path(out_filename, i) for i in new}
+    name = os.path.basename(filename)
+    processes = max(1, min(workers, len(new)))
+    jobs = [
+        (
+            filename,
+            ranges[i][0],
+            ranges[i][1],
+            f"{name}.part{i + 1:03d}",
+            paths[i],
+            key,
+            rsc.nsym,
+            rsc.nsize,
+            max(1, workers // processes),
+            modulation,
+            stream_format,
+            profile,
+        )
+        for i in new
+    ]
+    try:
+        with measure(report, "encode_segments", sum(ranges[i][1] for i in new)):
+            if processes > 1:
+                # spawned for the same reason as parallel.SharedMemoryPool
+                with ProcessPoolExecutor(
+                    max_workers=processes,
+                    mp_context=multiprocessing.get_context("spawn"),
+                ) as executor:
+                    digests = []
+                    try:
+                        for digest in executor.map(_segment_to_video, *zip(*jobs)):
+                            check_cancelled(report)
+                            digests.append(digest)
+                    except BaseException:
+                        # segments not started yet are dropped
+                        executor.shutdown(cancel_futures=True)
+                        raise
+            else:
+                digests = []
+                for job in jobs:
+                    check_cancelled(report)
+                    digests.append(_segment_to_video(*job))
+
+        for i, digest in zip(new, digests):
+            titles[i] = segment_title(paths[i])
+            ranges[i] = (ranges[i][0], ranges[i][1], digest)
+        segments = [
+            Segment(str(title), offset, length, digest)
+            for title, (offset, length, digest) in zip(titles, ranges)
+        ]
+        manifest = build_manifest(SegmentManifest(name, size, segments))
+        _payload_to_video(
+            io.BytesIO(manifest),
+            len(manifest),
+            filename,
+            KIND_MANIFEST,
+            COMPRESSION_NONE,
+            b"",
+            out_filename,
+            key,
+            rsc,
+            1,
+            modulation,
+            stream_format,
+            profile,
+            report,
+        )
+    except BaseException:
+        for path in list(paths.values()) + [out_filename]:
+            if os.path.exists(path):
+                os.remove(path)
+        raise
+    if content_index is not None:
+        for segment in segments:
+            record_content(
+                content_index,
+                segment.sha256,
+                segment.title,
+                segment.size,
+                segment_title(out_filename),
+            )
+    print(
+        f"Generated manifest video {out_filename} for {len(segments)} segments, "
+        f"{len(segments) - len(new)} of them already uploaded"
+    )
+    return list(paths.values()) + [out_filename]
+
+
+def _segment_to_video(
+    filename: str,
+    offset: int,
+    size: int,
+    name: str,
+    out_filename: str,
+    key: bytes,
+    nsym: int,
+    nsize: int,
+    workers: int,
+    modulation: int | str,
+    stream_format: StreamFormat | None,
+    profile: str | EncodeProfile,
+) -> bytes:
+    # one segment of convert_file_to_segments, returns the sha256 of its range
+    compressed, compressed_size, digest, compression = compress_range(
+        filename, offset, size, get_encode_profile(profile).zstd_level, workers
+    )
+    try:
+        _payload_to_video(
+            compressed,
+            compressed_size,
+            name,
+            KIND_FILE,
+            compression,
+            b"",
+            out_filename,
+            key,
+            RSCodec(nsym, nsize),
+            workers,
+            modulation,
+            stream_format,
+            profile,
+            None,
+        )
+    finally:
+        compressed.close()
+    print(f"Generated video file: {out_filename}")
+    return digest
+
+
+def convert_files_to_video(
+    filenames: list[str],
+    out_filename: str,
+    key: bytes,
+    rsc: RSCodec,
+    workers: int = 1,
+    modulation: int | str = MODULATION,
+    stream_format: StreamFormat | None = None,
+    profile: str | EncodeProfile = ENCODE_PROFILE,
+    report: JobReport | None = None,
+) -> list[ArchiveMember]:
+    # many files in a single video, each compressed on its own after a table
+    # of contents, extracted into a folder named after the video
+    names = member_names(filenames)
+    original_size = sum(os.path.getsize(f) for f in filenames)
+    level = get_encode_profile(profile).zstd_level
+    with measure(report, "compress", original_size):
+        packed, toc = pack_files(filenames, names, level, workers)
+    try:
+        _payload_to_video(
+            packed,
+            toc.dictionary_size + sum(m.size for m in toc.members),
+            os.path.splitext(out_filename)[0],
+            KIND_ARCHIVE,
+            COMPRESSION_NONE,
+            build_toc(toc),
+            out_filename,
+            key,
+            rsc,
+            workers,
+            modulation,
+            stream_format,
+            profile,
+            report,
+        )
+    finally:
+        packed.close()
+    print(f"Generated video file: {out_filename}")
+    return toc.members
+
+
+def _payload_to_video(
+    payload: IO[bytes],
+    payload_size: int,
+    filename: str,
+    kind: int,
+    compression: int,
+    prefix: bytes,
+    out_filename: str,
+    key: bytes,
+    rsc: RSCodec,
+    workers: int,
+    modulation: int | str,
+    stream_format: StreamFormat | None,
+    profile: str | EncodeProfile,
+    report: JobReport | None,
+):
+    # payload is encrypted after the file header and prefix
+    data_size = len(prefix) + payload_size
+    pool = SharedMemoryPool(workers) if workers > 1 else None
+    try:
+        # the header length does not depend on the stream format
+        header_size = len(build_file_header(filename, data_size, kind=kind))
+        if stream_format is None:
+            stream_size = encrypted_size(header_size + data_size, ENCRYPTION_CHUNKED)
+            stream_format = choose_stream_format(stream_size, rsc, modulation)
+        if stream_format.encryption == ENCRYPTION_EAX:
+            # the tag first EAX layout is only read, for older videos
+            stream_format = stream_format._replace(encryption=ENCRYPTION_EAX_TAIL)
+        stream_size = encrypted_size(header_size + data_size, stream_format.encryption)
+        header = (
+            build_file_header(filename, data_size, stream_format, kind, compression)
+            + prefix
+        )
+        if (rsc.nsym, rsc.nsize) != (stream_format.rs_nsym, stream_format.rs_nsize):
+            rsc = RSCodec(stream_format.rs_nsym, stream_format.rs_nsize)
+        # encryption
+        if stream_format.encryption == ENCRYPTION_CHUNKED:
+            encrypted = iter_encrypted_chunked(header, payload, payload_size, key, pool)
+        else:
+            encrypted = iter_encrypted_eax(header, payload, payload_size, key)
+        encrypted = measure_iter(report, "encrypt", encrypted)
+        # encode with Reed-Solomon
+        if stream_format.layout == LAYOUT_FRAME_ALIGNED:
+            encoded = iter_frame_aligned_encoded(
+                rsc, encrypted, stream_size, stream_format, pool
+            )
+        else:
+            encoded = iter_reed_solomon_encoded(rsc, encrypted, stream_size, pool)
+        encoded = measure_iter(report, "rs_encode", encoded)
+        # interpolation to video frames, after the preamble frame
+        frames = measure_iter(
+            report, "render", iter_video_frames(encoded, stream_format, pool)
+        )
+        # saving to video file, only the time ffmpeg blocks the pipe is its own
+        with measure(report, "ffmpeg_encode"):
+            frames_to_video_file(frames, out_filename, stream_format, profile)
+    finally:
+        if pool is not None:
+            pool.close()
+
+
+def extract_file_from_video(
+    video_path: str,
+    key: bytes,
+    rsc: RSCodec,
+    workers: int = 1,
+    scaled: bool = SCALED_DECODE,
+    report: JobReport | None = None,
+    members: Iterable[str] | None = None,
+    fetch_segment: Callable[[str], str] | None = None,
+    dest_dir: str = ".",
+) -> str:
+    # returns the restored file or archive folder, written to dest_dir;
+    # members selects what is written out of an archive. The video of a
+    # split file only holds its manifest, the segments are then fetched with
+    # fetch_segment, or the manifest is returned without it
+    # the preamble configures the decoder, rsc is only used for older videos
+    with measure(report, "read_format"):
+        stream_format = read_stream_format(video_path)
+    if (
+        members is not None
+        and stream_format is not None
+        and stream_format.layout == LAYOUT_FRAME_ALIGNED
+    ):
+        output = extract_members_from_video(
+            video_path,
+            key,
+            rsc,
+            members,
+            workers,
+            scaled,
+            report,
+            stream_format,
+            dest_dir,
+        )
+        os.remove(video_path)
+        return output
+    # older videos are read at full size to detect their modulation
+    scaled = scaled and stream_format is not None
+    # reading video, one frame at a time
+    raw_frames = iter_raw_frames(video_path, stream_format or LEGACY_FORMAT, scaled)
+    read_frames = measure_iter(report, "ffmpeg_decode", raw_frames)
+    pool = SharedMemoryPool(workers) if workers > 1 else None
+    try:
+        first_frame = next(read_frames, None)
+        if first_frame is None:
+            raise ValueError("Video has no frames")
+        frames: Iterable[bytes] = read_frames
+        if stream_format is None:
+            stream_format = detect_modulation(first_frame, rsc)
+            frames = itertools.chain([first_frame], read_frames)
+        elif (rsc.nsym, rsc.nsize) != (stream_format.rs_nsym, stream_format.rs_nsize):
+            rsc = RSCodec(stream_format.rs_nsym, stream_format.rs_nsize)
+        # only the frame aligned layout keeps codewords within a frame
+        soft = SOFT_DECODE and stream_format.layout == LAYOUT_FRAME_ALIGNED
+        # de-interpolation to bit stream
+        recovered_stream = measure_iter(
+            report,
+            "collapse",
+            iter_collapsed_frames(frames, stream_format, pool, scaled, soft),
+        )
+        # decode with Reed-Solomon
+        if stream_format.layout == LAYOUT_FRAME_ALIGNED:
+            decoded_data = iter_frame_aligned_decoded(
+                rsc, recovered_stream, stream_format, pool, soft=soft, report=report
+            )
+        else:
+            decoded_data = iter_reed_solomon_decoded(rsc, recovered_stream, pool)
+        decoded_data = measure_iter(report, "rs_decode", decoded_data)
+        # decryption
+        if stream_format.encryption == ENCRYPTION_CHUNKED:
+            decrypted_data = iter_decrypted_chunked(decoded_data, key, pool)
+        else:
+            decrypted_data = iter_decrypted_eax(
+                decoded_data, key, stream_format.encryption
+            )
+        decrypted_data = measure_iter(report, "decrypt", decrypted_data)
+        # saving restored file
+        with measure(report, "decompress"):
+            output, kind = write_output_stream(decrypted_data, members, dest_dir)
+    finally:
+        if pool is not None:
+            pool.close()
+        raw_frames.close()
     # deleting temporary video file
     os.remove(video_path)
+    if kind == KIND_MANIFEST and fetch_segment is not None:
+        output = assemble_segments(
+            output, key, rsc, fetch_segment, workers, scaled, report, dest_dir
+        )
+    return output
+
+
+def assemble_segments(
+    manifest_path: str,
+    key: bytes,
+    rsc: RSCodec,
+    fetch_segment: Callable[[str], str],
+    workers: int = 1,
+    scaled: bool = SCALED_DECODE,
+    report: JobReport | None = None,
+    dest_dir: str = ".",
+    retries: int = SEGMENT_RETRIES,
+) -> str:
+    # restores the file listed by a manifest into dest_dir, fetch_segment
+    # downloads the video of a segment title and returns its path
+    with open(manifest_path, "rb") as f:
+        manifest = parse_manifest(f.read())
+    filename = available_filename(os.path.join(dest_dir, manifest.name))
+
+    fd, tmp_path = tempfile.mkstemp(prefix=".", suffix=".part", dir=dest_dir)
+    try:
+        with os.fdopen(fd, "wb") as out:
+            for segment in manifest.segments:
+                _restore_segment(
+                    segment,
+                    out,
+                    key,
+                    rsc,
+                    fetch_segment,
+                    workers,
+                    scaled,
+                    report,
+                    dest_dir,
+                    retries,
+                )
+        os.replace(tmp_path, filename)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    os.remove(manifest_path)
+    return filename
+
+
+def _restore_segment(
+    segment: Segment,
+    out: IO[bytes],
+    key: bytes,
+    rsc: RSCodec,
+    fetch_segment: Callable[[str], str],
+    workers: int,
+    scaled: bool,
+    report: JobReport | None,
+    dest_dir: str,
+    retries: int,
+):
+    # appends segment to out, a segment that fails to download, decode or
+    # match its hash is fetched again instead of starting over
+    for attempt in range(retries + 1):
+        video_path = None
+        try:
+            video_path = fetch_segment(segment.title)
+            part = extract_file_from_video(
+                video_path, key, rsc, workers, scaled, report, dest_dir=dest_dir
+            )
+            out.seek(segment.offset)
+            out.truncate()
+            digest = hashlib.sha256()
+            size = 0
+            try:
+                with open(part, "rb") as f:
+                    for chunk in iter_file_chunks(f):
+                        digest.update(chunk)
+                        size += len(chunk)
+                        out.write(chunk)
+            finally:
+                os.remove(part)
+            if size == segment.size and digest.digest() == segment.sha256:
+                return
+            error: Exception = ValueError("Segment does not match the manifest")
+        except Exception as exc:
+            error = exc
+            if video_path is not None and os.path.exists(video_path):
+                os.remove(video_path)
+            if isinstance(exc, JobCancelled):
+                raise
+        print(f"Segment {segment.title} failed, attempt {attempt + 1}: {error}")
+    raise RuntimeError(f"Could not restore segment {segment.title}") from error
+
+
+def iter_stream_from_frame(
+    video_path: str,
+    rsc: RSCodec,
+    stream_format: StreamFormat,
+    first_frame: int = 0,
+    count: int | None = None,
+    total_bytes: int | None = None,
+    scaled: bool = SCALED_DECODE,
+    pool: SharedMemoryPool | None = None,
+    report: JobReport | None = None,
+) -> Iterator[bytes]:
+    # the encrypted stream held by count data frames of a frame aligned
+    # video, starting at first_frame; the preamble is skipped by ffmpeg.
+    # The whole groups holding them are read
+    group_frames = stream_format.group_frames
+    group_first = first_frame - first_frame % group_frames
+    if count is not None:
+        end = -(-(first_frame + count) // group_frames) * group_frames
+        count = end - group_first
+    raw_frames = iter_raw_frames(
+        video_path, stream_format, scaled, group_first + 1, count
+    )
+    try:
+        frames = measure_iter(report, "ffmpeg_decode", raw_frames)
+        collapsed = measure_iter(
+            report,
+            "collapse",
+            iter_collapsed_frames(frames, stream_format, pool, scaled, SOFT_DECODE),
+        )
+        decoded = iter_frame_aligned_decoded(
+            rsc,
+            collapsed,
+            stream_format,
+            pool,
+            first_frame,
+            total_bytes,
+            SOFT_DECODE,
+            report,
+        )
+        yield from measure_iter(report, "rs_decode", decoded)
+    finally:
+        raw_frames.close()
+
+
+def extract_members_from_video(
+    video_path: str,
+    key: bytes,
+    rsc: RSCodec,
+    members: Iterable[str],
+    workers: int = 1,
+    scaled: bool = SCALED_DECODE,
+    report: JobReport | None = None,
+    stream_format: StreamFormat | None = None,
+    dest_dir: str = ".",
+) -> str:
+    # random access into an archive in the frame aligned layout: only the
+    # first frames, for the table of contents, and the frames holding the
+    # wanted members are decoded. Chunked streams authenticate every chunk
+    # read; the tag of an EAX stream covers all of it and cannot be checked
+    # here, members are also verified by their sha256
+    if stream_format is None:
+        with measure(report, "read_format"):
+            stream_format = read_stream_format(video_path)
+    if stream_format is None or stream_format.layout != LAYOUT_FRAME_ALIGNED:
+        raise ValueError("Video does not support random access")
+    fmt = stream_format
+    if (rsc.nsym, rsc.nsize) != (fmt.rs_nsym, fmt.rs_nsize):
+        rsc = RSCodec(fmt.rs_nsym, fmt.rs_nsize)
+    message_bytes = fmt.frame_message_bytes
+    chunked = fmt.encryption == ENCRYPTION_CHUNKED
+    head_size = CHUNKED_HEAD_SIZE
+    if not chunked:
+        tag_first = fmt.encryption == ENCRYPTION_EAX
+        head_size = 8 + EAX_NONCE_SIZE + (EAX_TAG_SIZE if tag_first else 0)
+    wanted = set(members)
+
+    def read_range(offset: int, size: int) -> Iterator[bytes]:
+        # size bytes of plaintext from offset, decoding only the frames
+        # holding them; stream offsets count the length prefix of the layout
+        if chunked:
+            first_chunk = offset // head.chunk_size
+            last_chunk = (offset + size - 1) // head.chunk_size
+            start = 8 + head.chunk_offset(first_chunk)
+            end = min(8 + head.chunk_offset(last_chunk + 1), total_bytes)
+        else:
+            start = 8 + head_size + offset
+            end = start + size
+        first = start // message_bytes
+        last = (end - 1) // message_bytes
+        stream = iter_stream_from_frame(
+            video_path,
+            rsc,
+            fmt,
+            first,
+            last - first + 1,
+            total_bytes,
+            scaled,
+            pool,
+            report,
+        )
+        try:
+            reader = ChunkReader(stream)
+            reader.skip(start - max(first * message_bytes, 8))
+            encrypted = reader.iter_read(end - start)
+            if chunked:
+                plain = ChunkReader(
+                    iter_decrypted_chunked(encrypted, key, pool, head, first_chunk)
+                )
+                plain.skip(offset - first_chunk * head.chunk_size)
+                yield from plain.iter_read(size)
+            else:
+                yield from map(eax_cipher_at(key, nonce, offset).decrypt, encrypted)
+        finally:
+            stream.close()
+
+    def read_index(size: int) -> bytes:
+        # the first size bytes of plaintext, more once the lengths they
+        # hold are known
+        size = min(size, data_size)
+        return b"".join(read_range(0, size)) if size > 0 else b""
+
+    pool = SharedMemoryPool(workers) if workers > 1 else None
+    try:
+        # the head of the encrypted stream, from the first data frame
+        stream = iter_stream_from_frame(
+            video_path, rsc, fmt, 0, 1, None, scaled, pool, report
+        )
+        try:
+            head_bytes = ChunkReader(stream).read(head_size)
+        finally:
+            stream.close()
+        if chunked:
+            head = ChunkedHead.from_bytes(head_bytes)
+            total_bytes = 8 + head.total_len
+            data_size = head.total_len - head_size - head.chunks * GCM_TAG_SIZE
+        else:
+            total_bytes = 8 + int.from_bytes(head_bytes[:8], "little")
+            data_size = total_bytes - 8 - encrypted_size(0, fmt.encryption)
+            nonce = head_bytes[8 : 8 + EAX_NONCE_SIZE]
+
+        # then the file header and table of contents
+        index = read_index(ARCHIVE_INDEX_READ_SIZE)
+        header_len = int.from_bytes(index[:4], "little")
+        if len(index) < header_len + 4:
+            index = read_index(header_len + 4)
+        header = parse_file_header(index[:header_len])
+        if header["kind"] != KIND_ARCHIVE:
+            raise ValueError("Only archive members can be extracted")
+        toc_len = int.from_bytes(index[header_len : header_len + 4], "little")
+        if len(index) < header_len + toc_len:
+            index = read_index(header_len + toc_len)
+        toc = parse_toc(index[header_len : header_len + toc_len])
+
+        missing = wanted - {m.name for m in toc.members}
+        if missing:
+            raise ValueError(f"Archive has no member {sorted(missing)}")
+        dictionary = b""
+        if any(
+            m.name in wanted and m.compression == COMPRESSION_ZSTD_DICT
+            for m in toc.members
+        ):
+            dictionary = b"".join(read_range(header_len + toc_len, toc.dictionary_size))
+
+        dirname = available_filename(os.path.join(dest_dir, str(header["name"])))
+        tmp_dir = tempfile.mkdtemp(prefix=".", suffix=".part", dir=dest_dir)
+        try:
+            for member in toc.members:
+                if member.name not in wanted:
+                    continue
+                offset = header_len + toc_len + member.offset
+                path = member_path(tmp_dir, member.name)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with measure(report, "decompress"):
+                    extract_member(
+                        read_range(offset, member.size), member, path, dictionary
+                    )
+            os.replace(tmp_dir, dirname)
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+    finally:
+        if pool is not None:
+            pool.close()
+    return dirname
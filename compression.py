@@ -0,0 +1,149 @@
+import hashlib
+from typing import IO, Iterable, Iterator
+from zstandard import (
+    ZstdCompressionDict,
+    ZstdCompressor,
+    ZstdDecompressor,
+    ZstdError,
+    train_dictionary,
+)
+
+# how a payload is stored, recorded in the file header of single files and
+# for every member in the table of contents of archives
+COMPRESSION_ZSTD = 0
+COMPRESSION_NONE = 1
+# zstd with the dictionary stored ahead of the members of an archive
+COMPRESSION_ZSTD_DICT = 2
+# windows compressed at SAMPLE_LEVEL across an input to tell whether it
+# compresses; inputs whose samples shrink by less than MIN_SAVING, media and
+# archives mostly, are stored as they are
+SAMPLE_COUNT = 8
+SAMPLE_SIZE = 1 << 16
+SAMPLE_LEVEL = 1
+MIN_SAVING = 0.03
+# the level of the encode profile is raised for small inputs, which take
+# little time at any level, and capped for huge ones
+SMALL_INPUT_SIZE = 1 << 20
+SMALL_INPUT_LEVEL = 9
+LARGE_INPUT_SIZE = 1 << 30
+LARGE_INPUT_LEVEL = 3
+# inputs from this size are compressed by one zstd thread per worker
+THREADED_SIZE = 1 << 23
+# archive members up to DICTIONARY_FILE_SIZE share a dictionary trained on
+# the first DICTIONARY_SAMPLE_BYTES of them, when there are at least
+# DICTIONARY_MIN_FILES and it saves more than its own size
+DICTIONARY_FILE_SIZE = 1 << 16
+DICTIONARY_MIN_FILES = 16
+DICTIONARY_SIZE = 1 << 14
+DICTIONARY_SAMPLE_BYTES = 1 << 22
+COPY_CHUNK_SIZE = 1 << 20
+
+
+def is_compressible(src: IO[bytes], offset: int, size: int) -> bool:
+    # samples size bytes of src from offset, the position of src is left
+    # anywhere
+    if size <= 0:
+        return False
+    count = min(SAMPLE_COUNT, -(-size // SAMPLE_SIZE))
+    window = min(SAMPLE_SIZE, size)
+    step = (size - window) // max(count - 1, 1)
+    compressor = ZstdCompressor(level=SAMPLE_LEVEL)
+    sampled = compressed = 0
+    for i in range(count):
+        src.seek(offset + i * step)
+        sample = src.read(window)
+        sampled += len(sample)
+        compressed += len(compressor.compress(sample))
+    return compressed < sampled * (1 - MIN_SAVING)
+
+
+def compression_level(size: int, level: int) -> int:
+    if size <= SMALL_INPUT_SIZE:
+        return max(level, SMALL_INPUT_LEVEL)
+    if size > LARGE_INPUT_SIZE:
+        return min(level, LARGE_INPUT_LEVEL)
+    return level
+
+
+def make_compressor(
+    size: int,
+    level: int,
+    threads: int = 1,
+    dictionary: ZstdCompressionDict | None = None,
+) -> ZstdCompressor:
+    # for an input of size bytes, level is the one of the encode profile
+    return ZstdCompressor(
+        level=compression_level(size, level),
+        write_checksum=True,
+        threads=threads if threads > 1 and size >= THREADED_SIZE else 0,
+        dict_data=dictionary,
+    )
+
+
+def copy_compressed(
+    src: IO[bytes],
+    dst: IO[bytes],
+    size: int,
+    compressor: ZstdCompressor | None,
+) -> tuple[int, bytes]:
+    # size bytes of src written to dst as one zstd frame, or as they are
+    # without a compressor; returns the bytes written and the sha256 of the
+    # bytes read
+    start = dst.tell()
+    digest = hashlib.sha256()
+    chunker = None if compressor is None else compressor.chunker(size=size)
+    remaining = size
+    while remaining > 0:
+        chunk = src.read(min(COPY_CHUNK_SIZE, remaining))
+        if not chunk:
+            raise ValueError("File is shorter than expected")
+        remaining -= len(chunk)
+        digest.update(chunk)
+        if chunker is None:
+            dst.write(chunk)
+        else:
+            for out in chunker.compress(chunk):
+                dst.write(out)
+    if chunker is not None:
+        for out in chunker.finish():
+            dst.write(out)
+    return dst.tell() - start, digest.digest()
+
+
+def train_member_dictionary(
+    samples: list[bytes], level: int
+) -> ZstdCompressionDict | None:
+    # None when there are too few samples to train on, or the dictionary
+    # saves less on them than it costs to store
+    if len(samples) < DICTIONARY_MIN_FILES:
+        return None
+    try:
+        dictionary = train_dictionary(DICTIONARY_SIZE, samples, level=level)
+    except ZstdError:
+        return None
+    plain = ZstdCompressor(level=level)
+    shared = ZstdCompressor(level=level, dict_data=dictionary)
+    saved = sum(
+        len(plain.compress(sample)) - len(shared.compress(sample)) for sample in samples
+    )
+    if saved <= len(dictionary.as_bytes()):
+        return None
+    return dictionary
+
+
+def iter_decompressed(
+    chunks: Iterable[bytes], compression: int, dictionary: bytes = b""
+) -> Iterator[bytes]:
+    if compression == COMPRESSION_NONE:
+        yield from chunks
+        return
+    if compression == COMPRESSION_ZSTD:
+        decompressor = ZstdDecompressor().decompressobj()
+    elif compression == COMPRESSION_ZSTD_DICT:
+        decompressor = ZstdDecompressor(
+            dict_data=ZstdCompressionDict(dictionary)
+        ).decompressobj()
+    else:
+        raise ValueError(f"Unknown compression {compression}")
+    for chunk in chunks:
+        yield decompressor.decompress(chunk)
@@ -0,0 +1,153 @@
+import os
+import json
+import hashlib
+import numpy as np
+from typing import Iterable
+
+# content defined chunking: a boundary follows every byte where the rolling
+# sum of GEAR over the last CDC_WINDOW bytes has its low CDC_MASK_BITS bits
+# clear, so an edit only moves the boundaries around it. Chunks are at least
+# CDC_MIN_SIZE long, about CDC_MIN_SIZE + 2**CDC_MASK_BITS on average
+CDC_WINDOW = 64
+CDC_MIN_SIZE = 1 << 26
+CDC_MASK_BITS = 27
+CDC_READ_SIZE = 1 << 22
+# derived from sha256 rather than a random generator, so boundaries never
+# change between versions; 32 bits wrap twice as fast as 64 in numpy
+GEAR = np.array(
+    [
+        int.from_bytes(hashlib.sha256(bytes([b])).digest()[:4], "little")
+        for b in range(256)
+    ],
+    dtype=np.uint32,
+)
+
+ContentIndex = dict[str, dict[str, int | str | list[str]]]
+
+
+def range_sha256(path: str, offset: int = 0, size: int = -1) -> bytes:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        f.seek(offset)
+        remaining = size
+        while remaining != 0:
+            chunk = f.read(
+                CDC_READ_SIZE if remaining < 0 else min(CDC_READ_SIZE, remaining)
+            )
+            if not chunk:
+                break
+            digest.update(chunk)
+            if remaining > 0:
+                remaining -= len(chunk)
+    return digest.digest()
+
+
+def content_defined_chunks(
+    path: str,
+    max_size: int,
+    min_size: int = CDC_MIN_SIZE,
+    mask_bits: int = CDC_MASK_BITS,
+) -> list[tuple[int, int, bytes]]:
+    # offset, size and sha256 of every chunk of path, in a single pass
+    mask = np.uint32((1 << mask_bits) - 1)
+    min_size = min(min_size, max_size)
+    chunks = []
+    start = 0
+    digest = hashlib.sha256()
+    # gear values of the bytes before the block, zero before the file
+    tail = np.zeros(CDC_WINDOW, dtype=np.uint32)
+    block_start = 0
+    with open(path, "rb") as f:
+        while block := f.read(CDC_READ_SIZE):
+            values = np.concatenate((tail, GEAR[np.frombuffer(block, np.uint8)]))
+            sums = np.cumsum(values, dtype=np.uint32)
+            # sum of the window ending at every byte of the block
+            windows = sums[CDC_WINDOW:] - sums[:-CDC_WINDOW]
+            candidates = np.flatnonzero((windows & mask) == 0) + block_start + 1
+            tail = values[-CDC_WINDOW:]
+
+            block_end = block_start + len(block)
+            position = block_start
+            while True:
+                i = np.searchsorted(candidates, start + min_size)
+                cut = start + max_size
+                if i < len(candidates) and candidates[i] < cut:
+                    cut = int(candidates[i])
+                if cut > block_end:
+                    break
+                digest.update(block[position - block_start : cut - block_start])
+                chunks.append((start, cut - start, digest.digest()))
+                start = position = cut
+                digest = hashlib.sha256()
+            digest.update(block[position - block_start :])
+            block_start = block_end
+    if block_start > start:
+        chunks.append((start, block_start - start, digest.digest()))
+    return chunks
+
+
+def load_content_index(path: str) -> ContentIndex:
+    # local record of the videos holding every uploaded file or segment,
+    # keyed by the hex sha256 of the content, with the manifests using it
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_content_index(path: str, index: ContentIndex):
+    tmp_path = f"{path}.part"
+    with open(tmp_path, "w") as f:
+        json.dump(index, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def lookup_content(index: ContentIndex, digest: bytes) -> str | None:
+    # title of the video holding the content, if it was uploaded before
+    entry = index.get(digest.hex())
+    return None if entry is None else str(entry["title"])
+
+
+def record_content(
+    index: ContentIndex,
+    digest: bytes,
+    title: str,
+    size: int,
+    used_by: str | None = None,
+):
+    entry = index.setdefault(
+        digest.hex(), {"title": title, "size": size, "used_by": []}
+    )
+    users = entry.setdefault("used_by", [])
+    if used_by is not None and used_by not in users:
+        users.append(used_by)
+
+
+def referencing_titles(index: ContentIndex, titles: Iterable[str]) -> set[str]:
+    # videos that need content held by titles, other than titles themselves
+    titles = set(titles)
+    users = set()
+    for entry in index.values():
+        if entry["title"] in titles:
+            users.update(entry.get("used_by", []))
+    return users - titles
+
+
+def forget_titles(index: ContentIndex, titles: Iterable[str]):
+    # drops the content held by deleted videos and their references
+    titles = set(titles)
+    for key in [k for k, entry in index.items() if entry["title"] in titles]:
+        del index[key]
+    for entry in index.values():
+        entry["used_by"] = [t for t in entry.get("used_by", []) if t not in titles]
+
+
+def merge_content_index(index: ContentIndex, other: ContentIndex):
+    # adds what a job recorded in its copy of index, which other jobs may
+    # have changed in the meantime
+    for key, entry in other.items():
+        merged = index.setdefault(key, {**entry, "used_by": []})
+        users = merged.setdefault("used_by", [])
+        for user in entry.get("used_by", []):
+            if user not in users:
+                users.append(user)
@@ -0,0 +1,232 @@
+import os
+import json
+import time
+import pstats
+import cProfile
+import resource
+import threading
+import contextlib
+from typing import Any, Iterable, Iterator
+
+# how often the resident memory of the process is sampled while a job runs
+MEMORY_SAMPLE_INTERVAL = 0.05
+
+
+def current_rss() -> int:
+    # resident bytes of this process, the peak so far where /proc is missing
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobReport:
+    # time, bytes and items of every stage of a job; stages nest, and the
+    # time of a stage excludes the stages it is waiting on, so a generator
+    # pulling from another one is only charged for its own work. A cancelled
+    # job stops at the next stage it enters. cProfile only follows the thread
+    # that enabled it, so the parts of a job are profiled where they run,
+    # see profiling
+
+    def __init__(self, name: str, profile_path: str | None = None):
+        self.name = name
+        self.profile_path = profile_path
+        self.stages: dict[str, dict[str, float]] = {}
+        self.elapsed = 0.0
+        self.peak_rss = 0
+        self._active: list[str] = []
+        self._switched = 0.0
+        self._started = 0.0
+        self._sampling = threading.Event()
+        self._sampler: threading.Thread | None = None
+        self._profiles: list[cProfile.Profile] = []
+        self._profiles_lock = threading.Lock()
+        self._exit_stack = contextlib.ExitStack()
+        self._cancelled = threading.Event()
+
+    def __enter__(self) -> "JobReport":
+        # the job runs on this thread
+        self.start()
+        self._exit_stack.enter_context(self.profiling())
+        return self
+
+    def __exit__(self, *exc_info):
+        self._exit_stack.close()
+        self.finish()
+
+    def start(self):
+        self._started = self._switched = time.perf_counter()
+        self.peak_rss = current_rss()
+        self._sampling.clear()
+        self._sampler = threading.Thread(target=self._sample_memory, daemon=True)
+        self._sampler.start()
+
+    def finish(self):
+        # dumps the profiles of every part, once they have all ended
+        with self._profiles_lock:
+            profiles, self._profiles = self._profiles, []
+        if profiles and self.profile_path is not None:
+            stats = pstats.Stats(profiles[0])
+            for profile in profiles[1:]:
+                stats.add(profile)
+            stats.dump_stats(self.profile_path)
+        self._sampling.set()
+        if self._sampler is not None:
+            self._sampler.join()
+            self._sampler = None
+        self.elapsed = time.perf_counter() - self._started
+
+    @contextlib.contextmanager
+    def profiling(self) -> Iterator[None]:
+        # profiles the block on the calling thread, when the report has a
+        # profile path
+        if self.profile_path is None:
+            yield
+            return
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # another profiler is active, from python 3.12 only one can be
+            yield
+            return
+        try:
+            yield
+        finally:
+            profiler.disable()
+            with self._profiles_lock:
+                self._profiles.append(profiler)
+
+    def _sample_memory(self):
+        while not self._sampling.wait(MEMORY_SAMPLE_INTERVAL):
+            self.peak_rss = max(self.peak_rss, current_rss())
+        self.peak_rss = max(self.peak_rss, current_rss())
+
+    def _stage(self, name: str) -> dict[str, float]:
+        if name not in self.stages:
+            self.stages[name] = {"seconds": 0.0, "bytes": 0, "items": 0}
+        return self.stages[name]
+
+    def _switch(self):
+        # charges the time since the last switch to the innermost stage
+        now = time.perf_counter()
+        if self._active:
+            self._stage(self._active[-1])["seconds"] += now - self._switched
+        self._switched = now
+
+    def cancel(self):
+        # from any thread
+        self._cancelled.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def check_cancelled(self):
+        if self._cancelled.is_set():
+            raise JobCancelled(f"{self.name} was cancelled")
+
+    def enter(self, name: str):
+        self.check_cancelled()
+        self._switch()
+        self._active.append(name)
+
+    def exit(self):
+        self._switch()
+        self._active.pop()
+
+    def count(self, name: str, size: int, items: int = 1):
+        stage = self._stage(name)
+        stage["bytes"] += size
+        stage["items"] += items
+
+    def to_dict(self) -> dict[str, Any]:
+        stages = {}
+        for name, stage in self.stages.items():
+            seconds = stage["seconds"]
+            stages[name] = {
+                **stage,
+                "mb_per_s": stage["bytes"] / 1e6 / seconds if seconds else None,
+            }
+        tracked = sum(stage["seconds"] for stage in self.stages.values())
+        return {
+            "job": self.name,
+            "seconds": self.elapsed,
+            "untracked_seconds": self.elapsed - tracked,
+            "peak_rss_mb": self.peak_rss / 1e6,
+            "stages": stages,
+            "profile": self.profile_path,
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict())
+
+    def summary(self) -> str:
+        # one line for the status bar, stages sorted by the time they took
+        parts = [f"{self.name} took {self.elapsed:.1f}s"]
+        ranked = sorted(self.stages.items(), key=lambda s: -s[1]["seconds"])
+        for name, stage in ranked[:4]:
+            share = stage["seconds"] / self.elapsed if self.elapsed else 0
+            parts.append(f"{name} {share:.0%}")
+        parts.append(f"peak {self.peak_rss / 1e6:.0f} MB")
+        return ", ".join(parts)
+
+    def log(self, path: str | None = None):
+        # one json line per job, printed and appended to path if given
+        line = self.to_json()
+        print(f"job report: {line}")
+        if path is not None:
+            with open(path, "a") as f:
+                f.write(line + "\n")
+
+
+def check_cancelled(report: JobReport | None):
+    # for long loops that enter no stage, does nothing without a report
+    if report is not None:
+        report.check_cancelled()
+
+
+@contextlib.contextmanager
+def measure(report: JobReport | None, name: str, size: int = 0) -> Iterator[None]:
+    # times the block as a stage of report, does nothing without a report
+    if report is None:
+        yield
+        return
+    report.enter(name)
+    try:
+        yield
+    finally:
+        report.exit()
+        report.count(name, size)
+
+
+def measure_iter(
+    report: JobReport | None, name: str, iterable: Iterable[bytes]
+) -> Iterator[bytes]:
+    # times every item pulled from iterable as a stage of report
+    if report is None:
+        return iter(iterable)
+    return _measured(report, name, iter(iterable))
+
+
+def _measured(report: JobReport, name: str, it: Iterator[bytes]) -> Iterator[bytes]:
+    try:
+        while True:
+            report.enter(name)
+            try:
+                item = next(it)
+            except StopIteration:
+                return
+            finally:
+                report.exit()
+            report.count(name, len(item))
+            yield item
+    finally:
+        close = getattr(it, "close", None)
+        if close is not None:
+            close()
@@ -0,0 +1,122 @@
+import itertools
+from concurrent.futures import Executor
+from typing import Any, Callable, NamedTuple
+from PyQt6.QtCore import QObject, pyqtSignal
+from instrumentation import JobReport
+from storage import StorageBackend
+
+
+class Stage(NamedTuple):
+    # run gets the job and what the previous stage returned, on a thread of
+    # the named lane; a lane runs as many stages at once as it has threads,
+    # in submission order, so the stages of consecutive jobs overlap
+    lane: str
+    run: Callable[["Job", Any], Any]
+
+
+class Job:
+    def __init__(
+        self,
+        queue: "JobQueue",
+        job_id: int,
+        name: str,
+        stages: list[Stage],
+        report: JobReport,
+        on_done: Callable[[Any], None] | None,
+        on_failed: Callable[[Exception], None] | None,
+    ):
+        self.queue = queue
+        self.job_id = job_id
+        self.name = name
+        self.stages = stages
+        self.report = report
+        self.on_done = on_done
+        self.on_failed = on_failed
+
+    def progress(self, text: str):
+        # from any thread
+        self.queue.progress.emit(self.job_id, text)
+
+    def cancel(self):
+        # the job stops at its next stage, see JobReport.cancel
+        self.report.cancel()
+
+
+class JobQueue(QObject):
+    # runs jobs off the Qt thread; on_done and on_failed are called on the Qt
+    # thread, then ended is emitted
+    progress = pyqtSignal(int, str)
+    ended = pyqtSignal(int)
+    _done = pyqtSignal(int, object)
+    _failed = pyqtSignal(int, object)
+
+    def __init__(self, lanes: dict[str, Executor | StorageBackend]):
+        super().__init__()
+        self.lanes = lanes
+        self.jobs: dict[int, Job] = {}
+        self._ids = itertools.count(1)
+        self._done.connect(self._on_done)
+        self._failed.connect(self._on_failed)
+
+    def submit(
+        self,
+        name: str,
+        stages: list[Stage],
+        on_done: Callable[[Any], None] | None = None,
+        on_failed: Callable[[Exception], None] | None = None,
+        report: JobReport | None = None,
+    ) -> Job:
+        job = Job(
+            self,
+            next(self._ids),
+            name,
+            stages,
+            JobReport(name) if report is None else report,
+            on_done,
+            on_failed,
+        )
+        self.jobs[job.job_id] = job
+        self._schedule(job, 0, None)
+        return job
+
+    def cancel(self, job_id: int):
+        job = self.jobs.get(job_id)
+        if job is not None:
+            job.cancel()
+
+    def cancel_all(self):
+        for job in self.jobs.values():
+            job.cancel()
+
+    def _schedule(self, job: Job, index: int, value: Any):
+        self.lanes[job.stages[index].lane].submit(self._run, job, index, value)
+
+    def _run(self, job: Job, index: int, value: Any):
+        # on a lane thread, hands the result to the lane of the next stage
+        try:
+            if index == 0:
+                job.report.start()
+            job.report.check_cancelled()
+            with job.report.profiling():
+                value = job.stages[index].run(job, value)
+            if index + 1 < len(job.stages):
+                self._schedule(job, index + 1, value)
+                return
+        except Exception as exc:
+            job.report.finish()
+            self._failed.emit(job.job_id, exc)
+            return
+        job.report.finish()
+        self._done.emit(job.job_id, value)
+
+    def _on_done(self, job_id: int, value: Any):
+        job = self.jobs.pop(job_id)
+        if job.on_done is not None:
+            job.on_done(value)
+        self.ended.emit(job_id)
+
+    def _on_failed(self, job_id: int, exc: Exception):
+        job = self.jobs.pop(job_id)
+        if job.on_failed is not None:
+            job.on_failed(exc)
+        self.ended.emit(job_id)
@@ -0,0 +1,210 @@
+import abc
+import functools
+import numpy as np
+
+
+class Modulation(abc.ABC):
+    # maps bytes to the pixel values of a grid of square blocks and back,
+    # the id is what gets recorded in the file header and the preamble.
+    # frame data is split in equal planes, each plane is a grid of blocks
+    # carrying bits_per_symbol bits per block
+    id = -1
+    name = ""
+    planes = 1
+    bits_per_symbol = 1
+    # raw pixel format fed to ffmpeg, and which data plane goes in each of
+    # its planes
+    pix_fmt = "gray"
+    plane_order: tuple[int, ...] = (0,)
+    # distance between neighbouring levels, the decision thresholds are
+    # halfway between them
+    step = 255
+
+    @property
+    def bits_per_block(self) -> int:
+        return self.planes * self.bits_per_symbol
+
+    def frame_bytes(self, h_blocks: int, w_blocks: int) -> int:
+        return h_blocks * w_blocks * self.bits_per_block // 8
+
+    @abc.abstractmethod
+    def symbol_values(self, data: np.ndarray) -> np.ndarray:
+        # pixel value of each block encoded by data, in stream order
+        pass
+
+    @abc.abstractmethod
+    def decide(self, block_sums: np.ndarray, samples: int) -> np.ndarray:
+        # (planes, h_blocks, w_blocks) sums of samples pixel values each, to
+        # (planes, h_blocks, w_blocks, bits_per_symbol) bits
+        pass
+
+    def margins(self, block_sums: np.ndarray, samples: int) -> np.ndarray:
+        # how far the mean of every block is from the nearest threshold, from
+        # 0 on a threshold to 255 on a level; levels span the whole pixel
+        # range, so the outer levels have a threshold on one side only
+        means = block_sums / samples
+        distance = self.step / 2 - np.abs(
+            means - np.rint(means / self.step) * self.step
+        )
+        return np.clip(distance * (510 / self.step), 0, 255).astype(np.uint8)
+
+    def byte_margins(self, block_sums: np.ndarray, samples: int) -> np.ndarray:
+        # the lowest margin of the blocks of every demodulated byte
+        per_byte = 8 // self.bits_per_symbol
+        margins = self.margins(block_sums, samples).reshape(-1)
+        padded = np.full(-(-len(margins) // per_byte) * per_byte, 255, np.uint8)
+        padded[: len(margins)] = margins
+        return padded.reshape(-1, per_byte).min(axis=1)
+
+    @functools.lru_cache(maxsize=None)
+    def row_table(self, block_size: int) -> np.ndarray:
+        # one pixel row of the blocks encoded by every possible byte value
+        symbols = 8 // self.bits_per_symbol
+        values = self.symbol_values(np.arange(256, dtype=np.uint8))
+        return np.repeat(values.reshape(256, symbols), block_size, axis=1)
+
+    def render_into(
+        self,
+        data: bytes,
+        out: np.ndarray,
+        h_blocks: int,
+        w_blocks: int,
+        block_size: int,
+    ):
+        # out is a (len(plane_order), height, width) frame, fully overwritten
+        size = self.frame_bytes(h_blocks, w_blocks)
+        if len(data) > size:
+            raise ValueError("Data does not fit in a single frame")
+
+        padded = np.zeros(size, dtype=np.uint8)
+        padded[: len(data)] = np.frombuffer(data, dtype=np.uint8)
+        plane_bytes = size // self.planes
+        symbols = 8 // self.bits_per_symbol
+        height = h_blocks * block_size
+        width = w_blocks * block_size
+
+        for target, plane in zip(out, self.plane_order):
+            plane_data = padded[plane * plane_bytes : (plane + 1) * plane_bytes]
+            if target.shape == (height, width) and w_blocks % symbols == 0:
+                # every byte maps to a run of whole blocks of one block row,
+                # so the first pixel row of each block row is a table lookup
+                # and the other rows are copies of it
+                rows = target.reshape(h_blocks, block_size, width)
+                first_rows = rows[:, 0, :].reshape(h_blocks, -1, symbols * block_size)
+                np.take(
+                    self.row_table(block_size),
+                    plane_data.reshape(h_blocks, -1),
+                    axis=0,
+                    out=first_rows,
+                    mode="clip",
+                )
+                rows[:, 1:, :] = rows[:, :1, :]
+            else:
+                # blocks straddling bytes or not covering the whole frame
+                values = self.symbol_values(plane_data).reshape(h_blocks, w_blocks)
+                target[...] = 0
+                target[:height, :width] = values.repeat(block_size, axis=0).repeat(
+                    block_size, axis=1
+                )
+
+    def demodulate(
+        self, frame: np.ndarray, block_size: int, soft: bool = False
+    ) -> bytes:
+        # frame is a (height, width, 3) rgb24 frame; with soft, the data is
+        # followed by the margin of every byte, see byte_margins
+        height, width, _ = frame.shape
+        h_blocks = height // block_size
+        w_blocks = width // block_size
+        blocks = frame.reshape(h_blocks, block_size, w_blocks, block_size, 3)
+
+        # per channel integer sums of every block
+        block_sums = blocks.sum(axis=(1, 3), dtype=np.uint32).transpose(2, 0, 1)
+        samples = block_size * block_size
+        if self.planes == 1:
+            block_sums = block_sums.sum(axis=0, keepdims=True)
+            samples *= 3
+        data = np.packbits(self.decide(block_sums, samples)).tobytes()
+        if soft:
+            data += self.byte_margins(block_sums, samples).tobytes()
+        return data
+
+    def demodulate_grid(self, grid: np.ndarray, soft: bool = False) -> bytes:
+        # grid is a (len(plane_order), h_blocks, w_blocks) frame already
+        # averaged down to one pixel per block, in the pixel format of pix_fmt
+        if self.planes > 1:
+            grid = grid[np.argsort(self.plane_order)]
+        data = np.packbits(self.decide(grid, 1)).tobytes()
+        if soft:
+            data += self.byte_margins(grid, 1).tobytes()
+        return data
+
+
+class BinaryModulation(Modulation):
+    # the original scheme, one bit per black or white block
+    id = 0
+    name = "bw"
+
+    def symbol_values(self, data: np.ndarray) -> np.ndarray:
+        return np.unpackbits(data) * np.uint8(255)
+
+    def decide(self, block_sums: np.ndarray, samples: int) -> np.ndarray:
+        return (block_sums > 127 * samples)[..., None]
+
+
+class GrayModulation(Modulation):
+    # two bits per block on four gray levels, gray coded so that a block
+    # decoded as a neighbouring level only flips one bit
+    id = 1
+    name = "gray4"
+    bits_per_symbol = 2
+    step = 85
+
+    def symbol_values(self, data: np.ndarray) -> np.ndarray:
+        pairs = np.unpackbits(data).reshape(-1, 2)
+        symbols = pairs[:, 0] * 2 + pairs[:, 1]
+        return (symbols ^ (symbols >> 1)) * np.uint8(self.step)
+
+    def decide(self, block_sums: np.ndarray, samples: int) -> np.ndarray:
+        scale = self.step * samples
+        block_sums = block_sums.astype(np.uint32, copy=False)
+        # nearest level, with integer rounding
+        levels = np.minimum((block_sums * 2 + scale) // (scale * 2), 3)
+        levels = levels.astype(np.uint8)
+        symbols = levels ^ (levels >> 1)
+        return np.stack((symbols >> 1, symbols & 1), axis=-1)
+
+
+class ColorModulation(BinaryModulation):
+    # one bit per block on each of the R, G and B channels, each channel
+    # carries a contiguous third of the frame data; blocks must cover whole
+    # 2x2 cells so they line up with yuv420p chroma
+    id = 2
+    name = "rgb"
+    planes = 3
+    # ffmpeg's planar rgb stores green, blue and red in this order
+    pix_fmt = "gbrp"
+    plane_order = (1, 2, 0)
+
+    def render_into(
+        self,
+        data: bytes,
+        out: np.ndarray,
+        h_blocks: int,
+        w_blocks: int,
+        block_size: int,
+    ):
+        if block_size % 2 != 0:
+            raise ValueError("Color modulation needs an even block size")
+        super().render_into(data, out, h_blocks, w_blocks, block_size)
+
+
+MODULATIONS: dict[int, Modulation] = {
+    m.id: m for m in (BinaryModulation(), GrayModulation(), ColorModulation())
+}
+
+
+def get_modulation(modulation: int | str) -> Modulation:
+    for m in MODULATIONS.values():
+        if modulation in (m.id, m.name):
+            return m
+    raise ValueError(f"Unknown modulation {modulation!r}")
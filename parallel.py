@@ -0,0 +1,121 @@
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Callable
+
+# one task per worker would leave cores idle at the end of each window
+TASKS_PER_WORKER = 2
+
+
+def default_workers() -> int:
+    return os.cpu_count() or 1
+
+
+def _run_task(
+    func: Callable[..., None],
+    in_name: str,
+    in_range: tuple[int, int],
+    out_name: str,
+    out_range: tuple[int, int],
+    args: tuple[Any, ...],
+):
+    # runs inside a worker, func reads from src and writes its result into dst
+    src = SharedMemory(name=in_name)
+    dst = SharedMemory(name=out_name)
+    try:
+        src_view = src.buf[in_range[0] : in_range[1]]
+        dst_view = dst.buf[out_range[0] : out_range[1]]
+        try:
+            func(src_view, dst_view, *args)
+        finally:
+            src_view.release()
+            dst_view.release()
+    finally:
+        src.close()
+        dst.close()
+
+
+class SharedMemoryPool:
+    # process pool exchanging windows of data through shared memory blocks,
+    # so only names and offsets are pickled for each task
+
+    def __init__(self, workers: int):
+        if workers < 1:
+            raise ValueError("At least one worker is required")
+        self.workers = workers
+        # forked workers would inherit the ffmpeg pipes opened by the parent
+        # and keep them from ever reaching end of file
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+        )
+        self._input: SharedMemory | None = None
+        self._output: SharedMemory | None = None
+
+    def __enter__(self) -> "SharedMemoryPool":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.executor.shutdown(cancel_futures=True)
+        for shm in (self._input, self._output):
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+        self._input = self._output = None
+
+    def window_size(self, task_size: int) -> int:
+        return task_size * self.workers * TASKS_PER_WORKER
+
+    def _ensure(self, shm: SharedMemory | None, size: int) -> SharedMemory:
+        # blocks are reused between windows and only grow
+        if shm is not None and shm.size >= size:
+            return shm
+        if shm is not None:
+            shm.close()
+            shm.unlink()
+        return SharedMemory(create=True, size=max(size, 1))
+
+    def map(
+        self,
+        func: Callable[..., None],
+        data: bytes,
+        task_size: int,
+        out_size: Callable[[int], int],
+        *args: Any,
+    ) -> bytes:
+        # func must be a module level function so that it can be pickled,
+        # out_size gives the output length of a task from its input length
+        if not data:
+            return b""
+
+        tasks = []
+        out_end = 0
+        for start in range(0, len(data), task_size):
+            end = min(start + task_size, len(data))
+            size = out_size(end - start)
+            tasks.append(((start, end), (out_end, out_end + size)))
+            out_end += size
+
+        self._input = self._ensure(self._input, len(data))
+        self._output = self._ensure(self._output, out_end)
+        self._input.buf[: len(data)] = data
+
+        futures = [
+            self.executor.submit(
+                _run_task,
+                func,
+                self._input.name,
+                in_range,
+                self._output.name,
+                out_range,
+                args,
+            )
+            for in_range, out_range in tasks
+        ]
+        for future in futures:
+            future.result()
+
+        return bytes(self._output.buf[:out_end])
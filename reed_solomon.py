@@ -0,0 +1,342 @@
+import numpy as np
+from typing import Iterable
+
+# GF(2^8) with the same primitive polynomial, generator and first consecutive
+# root as reedsolo.RSCodec, so the codewords are bit-for-bit identical
+PRIM = 0x11D
+GENERATOR = 2
+FCR = 0
+# codewords processed together by the vectorized encoder and syndrome check
+BATCH_CODEWORDS = 4096
+
+
+class ReedSolomonError(Exception):
+    pass
+
+
+def _build_tables() -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    exp = np.zeros(512, dtype=np.int64)
+    log = np.zeros(256, dtype=np.int64)
+    x = 1
+    for i in range(255):
+        exp[i] = x
+        log[x] = i
+        x <<= 1
+        if x & 0x100:
+            x ^= PRIM
+    exp[255:510] = exp[:255]
+
+    # full multiplication table, mul[a, b] = a * b
+    mul = exp[(log[:, None] + log[None, :]) % 255].astype(np.uint8)
+    mul[0, :] = 0
+    mul[:, 0] = 0
+    return exp, log, mul
+
+
+GF_EXP, GF_LOG, GF_MUL = _build_tables()
+
+
+def gf_pow(x: int, power: int) -> int:
+    return int(GF_EXP[(int(GF_LOG[x]) * power) % 255])
+
+
+def gf_inverse(x: int) -> int:
+    return int(GF_EXP[255 - GF_LOG[x]])
+
+
+def gf_div(x: int, y: int) -> int:
+    if y == 0:
+        raise ZeroDivisionError()
+    if x == 0:
+        return 0
+    return int(GF_EXP[(GF_LOG[x] + 255 - GF_LOG[y]) % 255])
+
+
+def gf_poly_mul(p: list[int], q: list[int]) -> list[int]:
+    # coefficients are ordered from the highest degree, as in reedsolo
+    r = [0] * (len(p) + len(q) - 1)
+    for j, qj in enumerate(q):
+        for i, pi in enumerate(p):
+            r[i + j] ^= int(GF_MUL[pi, qj])
+    return r
+
+
+def gf_poly_eval(p: list[int], x: int) -> int:
+    y = p[0]
+    for coef in p[1:]:
+        y = int(GF_MUL[y, x]) ^ coef
+    return y
+
+
+def rs_generator_poly(nsym: int) -> list[int]:
+    g = [1]
+    for i in range(FCR, FCR + nsym):
+        g = gf_poly_mul(g, [1, gf_pow(GENERATOR, i)])
+    return g
+
+
+def _pack_rows(rows: np.ndarray) -> np.ndarray:
+    # (..., nsym) uint8 -> (..., words) uint64, so that one XOR handles 8 symbols
+    words = -(-rows.shape[-1] // 8)
+    padded = np.zeros(rows.shape[:-1] + (words * 8,), dtype=np.uint8)
+    padded[..., : rows.shape[-1]] = rows
+    return padded.view(np.uint64)
+
+
+class RSCodec:
+    # drop-in replacement for reedsolo.RSCodec(nsym) built on lookup tables,
+    # working on thousands of codewords per numpy call
+
+    def __init__(self, nsym: int = 10, nsize: int = 255):
+        if not 0 < nsym < nsize <= 255:
+            raise ValueError("Invalid Reed-Solomon parameters")
+        self.nsym = nsym
+        self.nsize = nsize
+        self.generator = GENERATOR
+        self.fcr = FCR
+        self.gen = rs_generator_poly(nsym)
+
+        # parity contribution of the message symbol at each position:
+        # encode_table[i, v] = v * (x^(nsize - 1 - i) mod g)
+        k = nsize - nsym
+        remainders = np.zeros((k, nsym), dtype=np.uint8)
+        r = [1] + [0] * (nsym - 1)
+        for d in range(nsym, nsize):
+            # multiply by x and reduce modulo the monic generator
+            top = r[0]
+            r = r[1:] + [0]
+            if top:
+                r = [c ^ int(GF_MUL[top, gj]) for c, gj in zip(r, self.gen[1:])]
+            remainders[nsize - 1 - d] = r
+        self.encode_table = _pack_rows(GF_MUL[:, remainders].transpose(1, 0, 2))
+
+        # syndrome contribution of the codeword symbol at each position:
+        # syndrome_table[i, v] = [v * alpha^((j + fcr) * (nsize - 1 - i)) for j]
+        degrees = nsize - 1 - np.arange(nsize)
+        roots = np.arange(FCR, FCR + nsym)
+        powers = GF_EXP[(degrees[:, None] * roots[None, :]) % 255].astype(np.uint8)
+        self.syndrome_table = _pack_rows(GF_MUL[:, powers].transpose(1, 0, 2))
+
+    def chunk(self, data: bytes, chunk_size: int) -> Iterable[bytes]:
+        for i in range(0, len(data), chunk_size):
+            yield data[i : i + chunk_size]
+
+    def _accumulate(self, table: np.ndarray, blocks: np.ndarray) -> np.ndarray:
+        # xor of table[offset + i, blocks[:, i]] over i, for shortened blocks
+        # too; one column at a time into the same row buffer, gathering all
+        # of them at once takes 8 bytes per parity symbol per input byte
+        width = blocks.shape[1]
+        offset = table.shape[0] - width
+        packed = table[offset][blocks[:, 0]]
+        row = np.empty_like(packed)
+        for i in range(1, width):
+            np.take(table[offset + i], blocks[:, i], axis=0, out=row)
+            packed ^= row
+        return packed.view(np.uint8).reshape(len(blocks), -1)[:, : self.nsym]
+
+    def encode(self, data: bytes, out: memoryview | None = None) -> bytearray:
+        # out, a writable buffer of the encoded length, is filled and returned
+        # instead of a new bytearray
+        message = np.frombuffer(data, dtype=np.uint8)
+        k = self.nsize - self.nsym
+        full = len(message) // k
+
+        if out is None:
+            out = bytearray(len(message) + -(-len(message) // k) * self.nsym)
+        encoded = np.frombuffer(out, dtype=np.uint8)
+        if full:
+            blocks = encoded[: full * self.nsize].reshape(full, self.nsize)
+            blocks[:, :k] = message[: full * k].reshape(full, k)
+            for start in range(0, full, BATCH_CODEWORDS):
+                batch = blocks[start : start + BATCH_CODEWORDS]
+                batch[:, k:] = self._accumulate(self.encode_table, batch[:, :k])
+
+        tail = message[full * k :]
+        if len(tail):
+            block = encoded[full * self.nsize :]
+            block[: len(tail)] = tail
+            block[len(tail) :] = self._accumulate(self.encode_table, tail[None, :])[0]
+
+        return out
+
+    def syndromes(self, blocks: np.ndarray) -> np.ndarray:
+        return self._accumulate(self.syndrome_table, blocks)
+
+    def check(self, data: bytes) -> list[bool]:
+        check = []
+        for chunk in self.chunk(bytes(data), self.nsize):
+            block = np.frombuffer(chunk, dtype=np.uint8)[None, :]
+            check.append(not self.syndromes(block).any())
+        return check
+
+    def decode(
+        self,
+        data: bytes,
+        erase_pos: Iterable[int] | None = None,
+        only_erasures: bool = False,
+        weak_pos: Iterable[int] | None = None,
+    ) -> tuple[bytearray, bytearray, bytearray]:
+        # weak_pos are symbols that are likely but not known to be wrong,
+        # erased first in the blocks holding them: past t errors, errors only
+        # decoding can settle on a wrong codeword instead of failing. A block
+        # that cannot be corrected with them erased is decoded without them
+        # the only copy of data, corrected in place
+        corrected_data = bytearray(data)
+        corrected = np.frombuffer(corrected_data, dtype=np.uint8)
+        n = self.nsize
+        full = len(corrected) // n
+
+        # erasures are given as positions in the whole data, as with reedsolo
+        erasures: dict[int, list[int]] = {}
+        for pos in erase_pos or ():
+            erasures.setdefault(pos // n, []).append(pos % n)
+        weak: dict[int, list[int]] = {}
+        for pos in weak_pos or ():
+            weak.setdefault(pos // n, []).append(pos % n)
+
+        # batched syndromes, only blocks that are not clean need a full decode
+        bad: list[int] = []
+        if full:
+            blocks = corrected[: full * n].reshape(full, n)
+            for start in range(0, full, BATCH_CODEWORDS):
+                synd = self.syndromes(blocks[start : start + BATCH_CODEWORDS])
+                bad.extend((start + np.flatnonzero(synd.any(axis=1))).tolist())
+        if len(corrected) > full * n:
+            tail = corrected[full * n :]
+            if len(tail) <= self.nsym:
+                raise ReedSolomonError("Message is too short to be decoded")
+            if self.syndromes(tail[None, :]).any():
+                bad.append(full)
+
+        # a clean block is a codeword whatever is erased in it
+        errata = bytearray()
+        for index in sorted(bad):
+            start = index * n
+            block = corrected[start : start + n]
+            erased = sorted(set(erasures.get(index, [])))
+            positions = None
+            if index in weak:
+                received = block.copy()
+                with_weak = sorted(set(erased) | set(weak[index]))
+                try:
+                    positions = self._correct_block(block, with_weak, only_erasures)
+                except ReedSolomonError:
+                    block[:] = received
+            if positions is None:
+                positions = self._correct_block(block, erased, only_erasures)
+            errata.extend(positions)
+
+        k = n - self.nsym
+        tail = corrected[full * n :][: -self.nsym]
+        decoded = bytearray(full * k + len(tail))
+        message = np.frombuffer(decoded, dtype=np.uint8)
+        message[: full * k].reshape(full, k)[:] = corrected[: full * n].reshape(
+            full, n
+        )[:, :k]
+        message[full * k :] = tail
+        return decoded, corrected_data, errata
+
+    def _correct_block(
+        self, block: np.ndarray, erase_pos: list[int], only_erasures: bool
+    ) -> list[int]:
+        # errors-and-erasures decoding of a single codeword, in place
+        n = len(block)
+        nsym = self.nsym
+        if len(erase_pos) > nsym:
+            raise ReedSolomonError("Too many erasures to correct")
+
+        block[erase_pos] = 0
+        synd = self.syndromes(block[None, :])[0].tolist()
+        if not any(synd):
+            return list(erase_pos)
+
+        # locator polynomials here are ordered from the lowest degree
+        erasure_loc = [1]
+        for pos in erase_pos:
+            x = gf_pow(GENERATOR, n - 1 - pos)
+            erasure_loc = _poly_mul_low(erasure_loc, [1, x])
+
+        if only_erasures:
+            locator = erasure_loc
+        else:
+            locator = _berlekamp_massey(synd, erasure_loc, len(erase_pos))
+
+        # chien search over the positions of this (possibly shortened) block
+        errs = len(locator) - 1
+        if 2 * (errs - len(erase_pos)) + len(erase_pos) > nsym:
+            raise ReedSolomonError("Too many errors to correct")
+        degrees = n - 1 - np.arange(n)
+        inverse = GF_EXP[(255 - degrees) % 255]
+        values = np.zeros(n, dtype=np.uint8)
+        for i, coef in enumerate(locator):
+            if coef:
+                values ^= GF_MUL[coef, GF_EXP[(GF_LOG[inverse] * i) % 255]]
+        positions = np.flatnonzero(values == 0).tolist()
+        if len(positions) != errs:
+            raise ReedSolomonError("Could not locate the errors")
+
+        # forney algorithm, omega = synd * locator mod x^nsym
+        omega = _poly_mul_low(synd, locator)[:nsym]
+        derivative = [locator[i] if i % 2 else 0 for i in range(1, len(locator))]
+        for pos in positions:
+            x = gf_pow(GENERATOR, n - 1 - pos)
+            x_inv = gf_inverse(x)
+            denominator = _poly_eval_low(derivative, x_inv)
+            if denominator == 0:
+                raise ReedSolomonError("Could not compute the error magnitude")
+            numerator = int(GF_MUL[gf_pow(x, 1 - FCR), _poly_eval_low(omega, x_inv)])
+            block[pos] ^= gf_div(numerator, denominator)
+
+        if self.syndromes(block[None, :]).any():
+            raise ReedSolomonError("Could not correct message")
+        return positions
+
+
+def _poly_mul_low(p: list[int], q: list[int]) -> list[int]:
+    r = [0] * (len(p) + len(q) - 1)
+    for i, pi in enumerate(p):
+        if pi:
+            for j, qj in enumerate(q):
+                r[i + j] ^= int(GF_MUL[pi, qj])
+    return r
+
+
+def _poly_eval_low(p: list[int], x: int) -> int:
+    y = 0
+    for coef in reversed(p):
+        y = int(GF_MUL[y, x]) ^ coef
+    return y
+
+
+def _berlekamp_massey(
+    synd: list[int], erasure_loc: list[int], erasures: int
+) -> list[int]:
+    # errors-and-erasures variant, starting from the erasure locator
+    locator = list(erasure_loc)
+    previous = list(erasure_loc)
+    length = erasures
+    for r in range(erasures, len(synd)):
+        delta = 0
+        for i, coef in enumerate(locator):
+            if i <= r:
+                delta ^= int(GF_MUL[coef, synd[r - i]])
+        previous = [0] + previous
+        if delta == 0:
+            continue
+        update = [int(GF_MUL[delta, c]) for c in previous]
+        new_locator = [a ^ b for a, b in _zip_longest(locator, update)]
+        if 2 * length <= r + erasures:
+            length = r + 1 + erasures - length
+            previous = [gf_div(c, delta) for c in locator]
+        locator = new_locator
+
+    while len(locator) > 1 and locator[-1] == 0:
+        locator.pop()
+    if len(locator) - 1 != length:
+        raise ReedSolomonError("Too many errors to correct")
+    return locator
+
+
+def _zip_longest(p: list[int], q: list[int]) -> Iterable[tuple[int, int]]:
+    size = max(len(p), len(q))
+    return zip(p + [0] * (size - len(p)), q + [0] * (size - len(q)))
@@ -0,0 +1,90 @@
+import os
+from typing import NamedTuple
+
+# content of the small video listing the segment videos of a split file
+MANIFEST_MAGIC = b"YTSG"
+# a manifest decoded without fetching its segments is kept with this suffix
+MANIFEST_SUFFIX = ".segments"
+
+
+class Segment(NamedTuple):
+    # title of the segment video and the range of the original file it holds,
+    # sha256 is the digest of that range
+    title: str
+    offset: int
+    size: int
+    sha256: bytes
+
+
+class SegmentManifest(NamedTuple):
+    name: str
+    size: int
+    segments: list[Segment]
+
+
+def segment_ranges(size: int, segment_size: int) -> list[tuple[int, int]]:
+    # offset and size of every segment, the last one may be shorter
+    if segment_size < 1:
+        raise ValueError("Segment size must be positive")
+    return [
+        (offset, min(segment_size, size - offset))
+        for offset in range(0, size, segment_size)
+    ]
+
+
+def segment_path(out_filename: str, index: int) -> str:
+    # title.mp4 is split into title.part001.mp4, title.part002.mp4, ...
+    stem, ext = os.path.splitext(out_filename)
+    return f"{stem}.part{index + 1:03d}{ext}"
+
+
+def segment_title(path: str) -> str:
+    # videos are titled after their file name
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def build_manifest(manifest: SegmentManifest) -> bytes:
+    name_b = manifest.name.encode("utf-8")
+    body = bytearray(MANIFEST_MAGIC)
+    body += len(name_b).to_bytes(2, "little") + name_b
+    body += manifest.size.to_bytes(8, "little")
+    body += len(manifest.segments).to_bytes(4, "little")
+    for segment in manifest.segments:
+        title_b = segment.title.encode("utf-8")
+        body += len(title_b).to_bytes(2, "little") + title_b
+        body += segment.offset.to_bytes(8, "little")
+        body += segment.size.to_bytes(8, "little")
+        body += segment.sha256
+    return (len(body) + 4).to_bytes(4, "little") + bytes(body)
+
+
+def parse_manifest(buf: bytes) -> SegmentManifest:
+    total_len = int.from_bytes(buf[0:4], "little")
+    if len(buf) < total_len or buf[4:8] != MANIFEST_MAGIC:
+        raise ValueError("Not a segment manifest")
+
+    offset = 8
+    name_len = int.from_bytes(buf[offset : offset + 2], "little")
+    offset += 2
+    name = buf[offset : offset + name_len].decode("utf-8")
+    offset += name_len
+    size = int.from_bytes(buf[offset : offset + 8], "little")
+    offset += 8
+    count = int.from_bytes(buf[offset : offset + 4], "little")
+    offset += 4
+
+    segments = []
+    for _ in range(count):
+        title_len = int.from_bytes(buf[offset : offset + 2], "little")
+        offset += 2
+        title = buf[offset : offset + title_len].decode("utf-8")
+        offset += title_len
+        seg_offset = int.from_bytes(buf[offset : offset + 8], "little")
+        seg_size = int.from_bytes(buf[offset + 8 : offset + 16], "little")
+        offset += 16
+        sha256 = bytes(buf[offset : offset + 32])
+        offset += 32
+        segments.append(Segment(title, seg_offset, seg_size, sha256))
+    if offset != total_len or sum(s.size for s in segments) != size:
+        raise ValueError("Segment manifest is corrupted")
+    return SegmentManifest(name, size, segments)
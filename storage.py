@@ -0,0 +1,127 @@
+import os
+import abc
+import shutil
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from typing import Any, Callable, Iterator, NamedTuple
+
+# videos of LocalStorage listed per page, newest first
+LOCAL_PAGE_SIZE = 30
+
+
+class RemoteVideo(NamedTuple):
+    title: str
+    video_id: str
+    uploaded: float | None
+
+
+class StorageBackend(abc.ABC):
+    # where the videos are kept, by title. upload, list_pages, download and
+    # delete run on a thread of the executor of the backend: submit them, or
+    # call them from functions submitted to it. The bulk variants submit the
+    # single ones, as many at once as the executor has threads, and must be
+    # called from outside those threads
+
+    def __init__(self, executor: Executor):
+        self.executor = executor
+
+    @abc.abstractmethod
+    def upload(self, path: str) -> None:
+        # the video is titled after the file name, without its extension
+        pass
+
+    @abc.abstractmethod
+    def list_pages(self) -> Iterator[list[RemoteVideo]]:
+        # newest first
+        pass
+
+    @abc.abstractmethod
+    def download(self, title: str, dest_dir: str) -> str:
+        # returns the path of the downloaded video
+        pass
+
+    @abc.abstractmethod
+    def delete(self, title: str) -> None:
+        pass
+
+    def recover(self) -> None:
+        # called on the thread of a failed call before it is retried
+        pass
+
+    def submit(self, fn: Callable[..., Any], /, *args: Any, **kwargs: Any) -> Future:
+        # runs fn on a thread of the backend
+        return self.executor.submit(fn, *args, **kwargs)
+
+    def close(self) -> None:
+        self.executor.shutdown()
+
+    def list_videos(self) -> list[RemoteVideo]:
+        return self.submit(
+            lambda: [video for page in self.list_pages() for video in page]
+        ).result()
+
+    def upload_many(self, paths: list[str]) -> None:
+        for future in [self.submit(self.upload, path) for path in paths]:
+            future.result()
+
+    def download_many(self, titles: list[str], dest_dir: str) -> list[str]:
+        futures = [self.submit(self.download, title, dest_dir) for title in titles]
+        return [future.result() for future in futures]
+
+    def delete_many(self, titles: list[str]) -> None:
+        for future in [self.submit(self.delete, title) for title in titles]:
+            future.result()
+
+
+class LocalStorage(StorageBackend):
+    # videos kept as files in folder, to use the app and measure transfers
+    # offline; transcode(src, dst) stands in for the re-encode of the video
+    # host, see benchmarks/simulate.py
+    def __init__(
+        self,
+        folder: str,
+        concurrency: int = 4,
+        transcode: Callable[[str, str], None] | None = None,
+    ):
+        super().__init__(
+            ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="storage")
+        )
+        self.folder = folder
+        self.transcode = transcode
+        os.makedirs(folder, exist_ok=True)
+
+    def upload(self, path: str) -> None:
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Video file {path} not found")
+        name = os.path.basename(path)
+        # hidden until complete, with the extension ffmpeg needs
+        tmp_path = os.path.join(self.folder, f".part-{name}")
+        if self.transcode is None:
+            shutil.copyfile(path, tmp_path)
+        else:
+            self.transcode(path, tmp_path)
+        os.replace(tmp_path, os.path.join(self.folder, name))
+
+    def list_pages(self) -> Iterator[list[RemoteVideo]]:
+        entries = [e for e in os.scandir(self.folder) if not e.name.startswith(".")]
+        entries.sort(key=lambda e: e.stat().st_mtime, reverse=True)
+        videos = [
+            RemoteVideo(os.path.splitext(e.name)[0], e.name, e.stat().st_mtime)
+            for e in entries
+        ]
+        for start in range(0, len(videos), LOCAL_PAGE_SIZE):
+            yield videos[start : start + LOCAL_PAGE_SIZE]
+
+    def download(self, title: str, dest_dir: str) -> str:
+        name = self._find(title)
+        dest_path = os.path.join(dest_dir, name)
+        shutil.copyfile(os.path.join(self.folder, name), dest_path)
+        return dest_path
+
+    def delete(self, title: str) -> None:
+        os.remove(os.path.join(self.folder, self._find(title)))
+
+    def _find(self, title: str) -> str:
+        for name in os.listdir(self.folder):
+            if not name.startswith(".") and os.path.splitext(name)[0] == title:
+                return name
+        raise Exception(f"Video titled '{title}' not found in {self.folder}.")
@@ -0,0 +1,257 @@
+import numpy as np
+from typing import NamedTuple
+from reed_solomon import RSCodec, ReedSolomonError
+from modulation import MODULATIONS, Modulation
+
+FORMAT_VERSION = 4
+PREAMBLE_MAGIC = b"YTDV"
+# the preamble frame is a coarse grid of black and white cells, read back by
+# letting ffmpeg scale the first frame down to exactly this size
+PREAMBLE_GRID_W, PREAMBLE_GRID_H = 64, 36
+PREAMBLE_SIZE = 16
+# version 3 added the interleave depth
+PREAMBLE_SIZES = (PREAMBLE_SIZE + 1, PREAMBLE_SIZE)
+# from version 4 on, the last bytes of every data frame of the frame aligned
+# layout are its index, RS protected on their own, so duplicated and
+# dropped frames are told apart from data
+SYNC_INDEX_SIZE = 4
+SYNC_RS_BYTES = 8
+SYNC_MARKER_SIZE = SYNC_INDEX_SIZE + SYNC_RS_BYTES
+PREAMBLE_RS_BYTES = 32
+# codewords are written one after the other, split across frames
+LAYOUT_CONTIGUOUS = 0
+# every frame holds a whole number of codewords encoding the next
+# frame_message_bytes of the stream, so any frame decodes on its own; with
+# interleave, each group of that many frames holds interleave times as many
+# codewords, every codeword spread evenly over the frames of its group and
+# the whole of each frame, see interleave_codewords
+LAYOUT_FRAME_ALIGNED = 1
+# how the stream is encrypted, a single EAX message or AES-GCM chunks that
+# are authenticated on their own, recorded from version 2 on
+ENCRYPTION_EAX = 0
+ENCRYPTION_CHUNKED = 1
+# a single EAX message with its tag after the ciphertext instead of before
+# it, so it is written in one pass; new EAX streams use it
+ENCRYPTION_EAX_TAIL = 2
+
+preamble_rsc = RSCodec(PREAMBLE_RS_BYTES)
+sync_rsc = RSCodec(SYNC_RS_BYTES, SYNC_MARKER_SIZE)
+
+
+class StreamFormat(NamedTuple):
+    # everything the decoder needs to read the frames of a video
+    width: int
+    height: int
+    block_size: int
+    fps: int
+    modulation: int
+    rs_nsym: int
+    rs_nsize: int = 255
+    layout: int = LAYOUT_CONTIGUOUS
+    encryption: int = ENCRYPTION_EAX
+    version: int = FORMAT_VERSION
+    # 0 for frames of contiguous codewords, recorded from version 3 on
+    interleave: int = 0
+
+    @property
+    def w_blocks(self) -> int:
+        return self.width // self.block_size
+
+    @property
+    def h_blocks(self) -> int:
+        return self.height // self.block_size
+
+    @property
+    def symbols(self) -> Modulation:
+        return MODULATIONS[self.modulation]
+
+    @property
+    def frame_bytes(self) -> int:
+        # payload bytes carried by a data frame
+        return self.symbols.frame_bytes(self.h_blocks, self.w_blocks)
+
+    @property
+    def sync_bytes(self) -> int:
+        # at the end of every data frame
+        if self.version < 4 or self.layout != LAYOUT_FRAME_ALIGNED:
+            return 0
+        return SYNC_MARKER_SIZE
+
+    @property
+    def codewords_per_frame(self) -> int:
+        return (self.frame_bytes - self.sync_bytes) // self.rs_nsize
+
+    @property
+    def frame_message_bytes(self) -> int:
+        # stream bytes carried by a frame of the frame aligned layout
+        return self.codewords_per_frame * (self.rs_nsize - self.rs_nsym)
+
+    @property
+    def group_frames(self) -> int:
+        # frames that are only decoded together
+        return max(self.interleave, 1)
+
+    @property
+    def frame_size(self) -> int:
+        # bytes of a raw rgb24 frame, as read back by the decoder
+        return self.width * self.height * 3
+
+    @property
+    def pix_fmt(self) -> str:
+        # raw pixel format of the frames fed to the encoder
+        return self.symbols.pix_fmt
+
+    @property
+    def render_planes(self) -> int:
+        return len(self.symbols.plane_order)
+
+    @property
+    def render_size(self) -> int:
+        # bytes of a raw frame fed to the encoder
+        return self.width * self.height * self.render_planes
+
+    @property
+    def grid_size(self) -> int:
+        # bytes of a frame scaled down to one pixel per block
+        return self.w_blocks * self.h_blocks * self.render_planes
+
+    def to_bytes(self) -> bytes:
+        return (
+            PREAMBLE_MAGIC
+            + self.version.to_bytes(1, "little")
+            + self.width.to_bytes(2, "little")
+            + self.height.to_bytes(2, "little")
+            + self.block_size.to_bytes(1, "little")
+            + self.fps.to_bytes(1, "little")
+            + self.modulation.to_bytes(1, "little")
+            + self.rs_nsym.to_bytes(1, "little")
+            + self.rs_nsize.to_bytes(1, "little")
+            + self.layout.to_bytes(1, "little")
+            + self.encryption.to_bytes(1, "little")
+            + (self.interleave.to_bytes(1, "little") if self.version >= 3 else b"")
+        )
+
+    @classmethod
+    def from_bytes(cls, buf: bytes) -> "StreamFormat":
+        if len(buf) < PREAMBLE_SIZE or buf[:4] != PREAMBLE_MAGIC:
+            raise ValueError("Not a stream preamble")
+        version = buf[4]
+        if version > FORMAT_VERSION:
+            raise ValueError(f"Unsupported stream format version {version}")
+        if version >= 3 and len(buf) < PREAMBLE_SIZE + 1:
+            raise ValueError("Stream preamble is too short")
+        return cls(
+            width=int.from_bytes(buf[5:7], "little"),
+            height=int.from_bytes(buf[7:9], "little"),
+            block_size=buf[9],
+            fps=buf[10],
+            modulation=buf[11],
+            rs_nsym=buf[12],
+            rs_nsize=buf[13],
+            layout=buf[14],
+            encryption=buf[15],
+            version=version,
+            interleave=buf[16] if version >= 3 else 0,
+        )
+
+
+def build_preamble_grid(stream_format: StreamFormat) -> np.ndarray:
+    # the RS protected preamble is repeated to fill the whole grid
+    codeword = bytes(preamble_rsc.encode(stream_format.to_bytes()))
+    grid_bytes = PREAMBLE_GRID_W * PREAMBLE_GRID_H // 8
+    copies = grid_bytes // len(codeword)
+    data = codeword * copies + bytes(grid_bytes - copies * len(codeword))
+
+    bits = np.unpackbits(np.frombuffer(data, dtype=np.uint8))
+    return bits.reshape(PREAMBLE_GRID_H, PREAMBLE_GRID_W) * np.uint8(255)
+
+
+def render_preamble_frame(stream_format: StreamFormat) -> bytes:
+    # in the pixel format of the stream, black and white on every plane
+    grid = build_preamble_grid(stream_format)
+    # nearest cell for every pixel, so any resolution can hold the grid
+    rows = np.arange(stream_format.height) * PREAMBLE_GRID_H // stream_format.height
+    cols = np.arange(stream_format.width) * PREAMBLE_GRID_W // stream_format.width
+    frame = grid[rows[:, None], cols[None, :]]
+    planes = stream_format.render_planes
+    return np.broadcast_to(frame, (planes,) + frame.shape).tobytes()
+
+
+def parse_preamble_grid(grid: bytes) -> StreamFormat | None:
+    # grid is the first frame scaled to the preamble grid, one gray byte per cell
+    cells = np.frombuffer(grid, dtype=np.uint8)
+    if cells.size != PREAMBLE_GRID_W * PREAMBLE_GRID_H:
+        return None
+    data = np.packbits(cells > 127)
+
+    for size in PREAMBLE_SIZES:
+        codeword_len = size + PREAMBLE_RS_BYTES
+        copies = data.size // codeword_len
+        codewords = data[: copies * codeword_len].reshape(copies, codeword_len)
+
+        # a bitwise majority vote of the copies first, then each copy on its own
+        votes = np.unpackbits(codewords, axis=1).sum(axis=0) * 2 > copies
+        candidates = [np.packbits(votes).tobytes()]
+        candidates += [codeword.tobytes() for codeword in codewords]
+        for candidate in candidates:
+            try:
+                decoded, _, _ = preamble_rsc.decode(candidate)
+                stream_format = StreamFormat.from_bytes(bytes(decoded))
+            except (ReedSolomonError, ValueError):
+                continue
+            # the preamble of another version may still decode
+            if len(stream_format.to_bytes()) != size:
+                continue
+            return stream_format
+    return None
+
+
+def interleave_codewords(
+    codewords: np.ndarray, stream_format: StreamFormat, out: np.ndarray | None = None
+) -> np.ndarray:
+    # (frames, codewords_per_frame * nsize) contiguous codewords of whole
+    # groups to the layout of their frames: byte j of the c-th codeword of a
+    # group is byte j * group_codewords + c of the group. Written into out,
+    # a contiguous array of the same shape, when given
+    fmt = stream_format
+    if fmt.interleave == 0:
+        return codewords
+    group_codewords = fmt.interleave * fmt.codewords_per_frame
+    groups = codewords.reshape(-1, group_codewords, fmt.rs_nsize)
+    if out is None:
+        return groups.transpose(0, 2, 1).reshape(codewords.shape)
+    np.copyto(
+        out.reshape(-1, fmt.rs_nsize, group_codewords), groups.transpose(0, 2, 1)
+    )
+    return out
+
+
+def deinterleave_codewords(
+    frames: np.ndarray, stream_format: StreamFormat
+) -> np.ndarray:
+    # inverse of interleave_codewords
+    fmt = stream_format
+    if fmt.interleave == 0:
+        return frames
+    group_codewords = fmt.interleave * fmt.codewords_per_frame
+    groups = frames.reshape(-1, fmt.rs_nsize, group_codewords)
+    return groups.transpose(0, 2, 1).reshape(frames.shape)
+
+
+def build_sync_markers(first: int, count: int) -> np.ndarray:
+    # (count, SYNC_MARKER_SIZE) markers of the data frames from first on;
+    # indexes are stored plus one so a black frame holds no marker
+    indexes = np.arange(first + 1, first + count + 1, dtype="<u4")
+    return np.frombuffer(sync_rsc.encode(indexes.tobytes()), np.uint8).reshape(
+        count, SYNC_MARKER_SIZE
+    )
+
+
+def read_sync_marker(marker: bytes) -> int | None:
+    # the index of a data frame, None when the marker is unreadable
+    try:
+        decoded, _, _ = sync_rsc.decode(marker)
+    except ReedSolomonError:
+        return None
+    index = int.from_bytes(decoded, "little")
+    return index - 1 if index > 0 else None
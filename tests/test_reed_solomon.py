@@ -0,0 +1,33 @@
+import random
+
+from reed_solomon import RSCodec
+
+
+def test_weak_bytes_are_erased_before_errors_only_decoding():
+    # t + 1 errors, all on bytes flagged as weak: errors only decoding
+    # cannot correct them and may settle on a wrong codeword
+    rsc = RSCodec(8)
+    rng = random.Random(0)
+    for _ in range(200):
+        message = bytes(rng.randrange(256) for _ in range(rsc.nsize - rsc.nsym))
+        received = bytearray(rsc.encode(message))
+        weak = rng.sample(range(rsc.nsize), rsc.nsym // 2 + 1)
+        for pos in weak:
+            received[pos] ^= rng.randrange(1, 256)
+        decoded, _, _ = rsc.decode(bytes(received), weak_pos=weak)
+        assert decoded == message
+
+
+def test_wrong_weak_bytes_fall_back_to_errors_only_decoding():
+    rsc = RSCodec(8)
+    rng = random.Random(1)
+    message = bytes(rng.randrange(256) for _ in range(rsc.nsize - rsc.nsym))
+    received = bytearray(rsc.encode(message))
+    errors = rng.sample(range(rsc.nsize), rsc.nsym // 2 - 1)
+    for pos in errors:
+        received[pos] ^= rng.randrange(1, 256)
+    # as many weak bytes as erasure_positions gives, all right, leaving too
+    # little parity for the errors outside of them
+    weak = [pos for pos in range(rsc.nsize) if pos not in errors][: rsc.nsym // 2]
+    decoded, _, _ = rsc.decode(bytes(received), weak_pos=weak)
+    assert decoded == message
@@ -1,16 +1,29 @@
 import os
+import re
+import json
+import time
+import threading
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator
+from urllib.parse import parse_qs, urlencode, urlsplit
 from playwright.sync_api import (
+    Error as PlaywrightError,
     TimeoutError as PlaywrightTimeoutError,
     Playwright,
     Browser,
     BrowserContext,
+    Locator,
     Page,
+    sync_playwright,
 )
+from storage import RemoteVideo, StorageBackend
 
 COOKIES_PATH = "yt_cookies.json"
-# TODO: not all videos are loaded at once, API to find all videos may be needed
-# anyway need to use the search bar to click the correct options
+# benchmarks/mock_studio.py serves a local stand-in for it
+STUDIO_URL = "https://studio.youtube.com"
+# how long to wait for the next page of the list to render, in ms
+PAGE_TIMEOUT = 15000
 
 
 def upload_video_to_youtube(video_path: str, page: Page) -> None:
@@ -43,21 +56,117 @@ def upload_video_to_youtube(video_path: str, page: Page) -> None:
         raise Exception("Error during video upload process.")
 
 
-def get_video_list(page: Page) -> list[str]:
-    anchors = page.query_selector_all("a#video-title")
-    titles: list[str] = []
-    for a in anchors:
-        text = (a.inner_text() or "").strip()
-        titles.append(text)
-    return titles
+def _video_rows(page: Page) -> list[RemoteVideo]:
+    videos = []
+    for row in page.query_selector_all("ytcp-video-row"):
+        anchor = row.query_selector("a#video-title")
+        if anchor is None:
+            continue
+        # the link is /video/<id>/edit
+        parts = (anchor.get_attribute("href") or "").split("/")
+        if "video" not in parts or parts.index("video") + 1 >= len(parts):
+            continue
+        video_id = parts[parts.index("video") + 1]
+        date = row.query_selector(".tablecell-date")
+        videos.append(
+            RemoteVideo(
+                (anchor.inner_text() or "").strip(),
+                video_id,
+                _parse_date(date.inner_text() if date else ""),
+            )
+        )
+    return videos
 
 
-def delete_video(page: Page, video_title: str) -> None:
-    row = page.locator(".ytcp-video-list-cell-video.right-section").filter(
-        has_text=video_title
+def _parse_date(text: str) -> float | None:
+    # "Oct 17, 2026" followed by "Uploaded" or "Published"
+    try:
+        return time.mktime(time.strptime(text.strip().split("\n")[0], "%b %d, %Y"))
+    except ValueError:
+        return None
+
+
+def iter_video_pages(page: Page) -> Iterator[list[RemoteVideo]]:
+    # every page of the Studio content list, newest first; the list is back
+    # on its first page once iteration ends
+    start_url = page.url
+    paged = False
+    if _filtered(start_url):
+        # left filtered by _find_row
+        start_url = _content_url(start_url)
+        page.goto(start_url, wait_until="load")
+    try:
+        while True:
+            try:
+                page.wait_for_selector("ytcp-video-row", timeout=PAGE_TIMEOUT)
+            except PlaywrightTimeoutError:
+                # a channel without videos has no rows
+                if paged:
+                    raise
+                return
+            videos = _video_rows(page)
+            yield videos
+
+            next_button = page.locator("ytcp-table-footer #navigate-after")
+            if (
+                not videos
+                or next_button.count() == 0
+                or next_button.get_attribute("aria-disabled") == "true"
+            ):
+                return
+            next_button.click()
+            paged = True
+            # the rows are replaced in place
+            page.wait_for_function(
+                "(id) => { const a = document.querySelector('a#video-title');"
+                " return a && !a.getAttribute('href').includes(id); }",
+                arg=videos[0].video_id,
+                timeout=PAGE_TIMEOUT,
+            )
+    except PlaywrightTimeoutError:
+        raise Exception("Timed out while reading the video list.")
+    finally:
+        if paged:
+            page.goto(start_url, wait_until="load")
+
+
+def _content_url(url: str, title: str | None = None) -> str:
+    # the content list at url, filtered to the titles containing title
+    parts = urlsplit(url)
+    query = parse_qs(parts.query)
+    rules = [] if title is None else [{"name": "TITLE", "value": title}]
+    query["filter"] = [json.dumps(rules, separators=(",", ":"))]
+    return parts._replace(query=urlencode(query, doseq=True)).geturl()
+
+
+def _filtered(url: str) -> bool:
+    # whether the content list at url is filtered
+    rules = parse_qs(urlsplit(url).query).get("filter", [])
+    return any(json.loads(r) for r in rules)
+
+
+def _find_row(page: Page, video_title: str) -> Locator:
+    # the title must match exactly, segment titles start with the one of
+    # their manifest
+    title = page.locator(
+        "a#video-title", has_text=re.compile(f"^\\s*{re.escape(video_title)}\\s*$")
     )
+    row = page.locator(".ytcp-video-list-cell-video.right-section").filter(has=title)
+    if row.count() == 0:
+        # the video may be on another page of the list, or newer than the
+        # list when another page uploaded it: the list is filtered by title
+        page.goto(_content_url(page.url, video_title), wait_until="load")
+        try:
+            page.wait_for_selector("ytcp-video-row", timeout=PAGE_TIMEOUT)
+        except PlaywrightTimeoutError:
+            pass
     if row.count() == 0:
         raise Exception(f"Video titled '{video_title}' not found on the page.")
+    return row.first
+
+
+def delete_video(page: Page, video_title: str) -> None:
+    row = _find_row(page, video_title)
 
     row.hover()
     row.locator('[aria-label="Options"]').click()
@@ -67,11 +176,7 @@ def delete_video(page: Page, video_title: str) -> None:
 
 
 def download_video(page: Page, video_title: str, dest_dir: Path) -> str:
-    row = page.locator(".ytcp-video-list-cell-video.right-section").filter(
-        has_text=video_title
-    )
-    if row.count() == 0:
-        raise Exception(f"Video titled '{video_title}' not found on the page.")
+    row = _find_row(page, video_title)
 
     row.hover()
     with page.expect_download() as download_info:
@@ -87,23 +192,38 @@ def download_video(page: Page, video_title: str, dest_dir: Path) -> str:
     return dest_path
 
 
-def create_yt_istance(sync_p: Playwright) -> tuple[Browser, BrowserContext, Page]:
-    browser = sync_p.firefox.launch(headless=False)
-
-    context = browser.new_context(
+def new_studio_context(browser: Browser) -> BrowserContext:
+    return browser.new_context(
         locale="en-US",
         storage_state=COOKIES_PATH if os.path.exists(COOKIES_PATH) else None,
     )
+
+
+def show_content_list(page: Page) -> None:
+    try:
+        page.click("tp-yt-paper-icon-item:has(div:has-text('Content'))")
+    except PlaywrightTimeoutError:
+        raise Exception(
+            "Could not find 'Content' button after login. Set the language to English."
+        )
+
+
+def create_yt_istance(
+    sync_p: Playwright, studio_url: str = STUDIO_URL, headless: bool = False
+) -> tuple[Browser, BrowserContext, Page]:
+    browser = sync_p.firefox.launch(headless=headless)
+
+    context = new_studio_context(browser)
     page = context.new_page()
 
-    page.goto("https://studio.youtube.com", wait_until="load")
+    page.goto(studio_url, wait_until="load")
 
     while "accounts.google.com" in page.url:
         print(
             "Login to YouTube Studio in the Playwright window, then press Enter here."
         )
         input("Press Enter after logging in...")
-        page.goto("https://studio.youtube.com", wait_until="load")
+        page.goto(studio_url, wait_until="load")
 
         if "accounts.google.com" not in page.url:
             context.storage_state(path=COOKIES_PATH)
@@ -111,12 +231,120 @@ def create_yt_istance(sync_p: Playwright) -> tuple[Browser, BrowserContext, Page
             break
 
     print("Logged in successfully.")
+    show_content_list(page)
 
-    try:
-        page.click("tp-yt-paper-icon-item:has(div:has-text('Content'))")
-    except PlaywrightTimeoutError:
-        raise Exception(
-            "Could not find 'Content' button after login. Set the language to English."
+    return browser, context, page
+
+
+class StudioPool(StorageBackend):
+    # the storage backend of YouTube Studio: up to size logged in pages, each
+    # owned by a thread of its own since the sync Playwright API only works
+    # on the thread that started it. A function submitted to the pool runs
+    # on a free thread and uses the page of that thread; a failure sends the
+    # page back to the content list, or replaces it without logging in again
+    # when it is broken
+    def __init__(
+        self, size: int = 1, studio_url: str = STUDIO_URL, headless: bool = False
+    ):
+        super().__init__(
+            ThreadPoolExecutor(
+                max_workers=size, thread_name_prefix="studio", initializer=self._open
+            )
         )
+        self.size = size
+        self.studio_url = studio_url
+        self.headless = headless
+        self._local = threading.local()
+        # pages are opened one at a time, the first may have to log in
+        self._opening = threading.Lock()
+        self._opened = 0
 
-    return browser, context, page
+    @property
+    def page(self) -> Page:
+        page = getattr(self._local, "page", None)
+        if page is None:
+            raise RuntimeError("Studio pages can only be used by pool functions")
+        if page.is_closed():
+            self.recover()
+        return self._local.page
+
+    def start(self):
+        # blocks until logged in
+        self.submit(lambda: None).result()
+
+    def upload(self, path: str) -> None:
+        upload_video_to_youtube(path, self.page)
+
+    def list_pages(self) -> Iterator[list[RemoteVideo]]:
+        return iter_video_pages(self.page)
+
+    def download(self, title: str, dest_dir: str) -> str:
+        return download_video(self.page, title, Path(dest_dir))
+
+    def delete(self, title: str) -> None:
+        delete_video(self.page, title)
+
+    def submit(self, fn, /, *args, **kwargs):
+        return super().submit(self._call, fn, *args, **kwargs)
+
+    def close(self):
+        # every thread closes its own browser, the barrier keeps any of them
+        # from taking two of these
+        if self._opened:
+            barrier = threading.Barrier(self._opened)
+            closing = [
+                self.executor.submit(self._close, barrier)
+                for _ in range(self._opened)
+            ]
+            for future in closing:
+                future.result()
+        super().close()
+
+    def recover(self):
+        # on the thread whose page failed
+        local = self._local
+        try:
+            local.page.goto(self.studio_url, wait_until="load")
+            show_content_list(local.page)
+            return
+        except Exception as exc:
+            print(f"Reopening the Studio page: {exc}")
+        try:
+            local.page.close()
+        except PlaywrightError:
+            pass
+        if not local.browser.is_connected():
+            local.browser = local.playwright.firefox.launch(headless=self.headless)
+            local.context = new_studio_context(local.browser)
+        try:
+            local.page = local.context.new_page()
+        except PlaywrightError:
+            # the context was closed
+            local.context = new_studio_context(local.browser)
+            local.page = local.context.new_page()
+        local.page.goto(self.studio_url, wait_until="load")
+        show_content_list(local.page)
+
+    def _open(self):
+        local = self._local
+        with self._opening:
+            local.playwright = sync_playwright().start()
+            local.browser, local.context, local.page = create_yt_istance(
+                local.playwright, self.studio_url, self.headless
+            )
+            self._opened += 1
+
+    def _call(self, fn, *args, **kwargs):
+        try:
+            return fn(*args, **kwargs)
+        except Exception:
+            try:
+                self.recover()
+            except Exception as exc:
+                print(f"Could not recover the Studio page: {exc}")
+            raise
+
+    def _close(self, barrier: threading.Barrier):
+        barrier.wait()
+        self._local.browser.close()
+        self._local.playwright.stop()